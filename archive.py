@@ -0,0 +1,255 @@
+"""
+冷数据归档
+把已结束月份的配对价差与合约K线从 precious_metals.db 移到按列存储的压缩 NumPy 文件:
+  archive/pairs/{metal}/{pair_name}/{YYYY-MM}.npz
+  archive/bars/{metal}/{symbol}/{YYYY-MM}.npz
+每个文件的每一列是一个独立数组，长区间分析只需读取用到的列。
+汇总表 (pair_rollups/bar_rollups) 与 pair_latest 留在数据库中，5m/1h/1d 查询不受归档影响；
+get_pair_history / load_bars 的分钟级查询会自动合并归档与库内数据。
+已归档的月份只读：写入路径跳过该序列最后一个归档月之前的行（database.cold_boundary）。
+用法: python archive.py [--keep-months N] [--dry-run]
+"""
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from database import (
+    DB_FILE, PAIR_TABLES, RESOLUTIONS, ROLLUP_LEVELS, BEIJING_OFFSET,
+    get_connection, to_epoch, from_epoch, bump_data_version, _rollup_pairs, _rollup_bars,
+)
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), 'archive')
+
+# 归档文件中的列（ts 为 UTC 秒级时间戳，按升序排列）
+PAIR_COLUMNS = ['ts', 'gfex_contract', 'cme_contract', 'gfex_price', 'cme_usd', 'cme_cny', 'spread', 'spread_pct']
+BAR_COLUMNS = ['ts', 'o', 'h', 'l', 'c', 'v', 'oi']
+
+
+def month_range(month):
+    """'YYYY-MM' -> 北京时间该月 [开始, 结束) 的时间戳区间"""
+    year, mon = map(int, month.split('-'))
+    start = to_epoch(datetime(year, mon, 1))
+    end = to_epoch(datetime(year + mon // 12, mon % 12 + 1, 1))
+    return start, end
+
+
+def archive_path(kind, metal, name, month):
+    return os.path.join(ARCHIVE_DIR, kind, metal, name, f'{month}.npz')
+
+
+def archived_months(kind, metal, name):
+    """已归档的月份列表（升序）"""
+    folder = os.path.join(ARCHIVE_DIR, kind, metal, name)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f[:-4] for f in os.listdir(folder) if f.endswith('.npz'))
+
+
+def _source(kind, metal, name, conn):
+    """归档对象在库中的 (表名, 键列, 键值, 列清单)"""
+    if kind == 'pairs':
+        return PAIR_TABLES[metal], 'pair_name', name, PAIR_COLUMNS
+    row = conn.execute('SELECT instrument_id FROM instruments WHERE symbol = ?', (name,)).fetchone()
+    return 'bars', 'instrument_id', row[0] if row else None, BAR_COLUMNS
+
+
+def _rollup(kind, metal, key, conn, start, end):
+    """重算一个月内全部汇总桶"""
+    stamps = range(start, end, RESOLUTIONS[ROLLUP_LEVELS[0][0]])
+    if kind == 'pairs':
+        _rollup_pairs(conn, metal, key, stamps)
+    else:
+        _rollup_bars(conn, key, stamps)
+
+
+def _write_columns(path, columns, rows):
+    """rows 按列拆开写成压缩 npz（先写临时文件再替换，避免留下半个文件）"""
+    arrays = {}
+    for i, col in enumerate(columns):
+        values = [r[i] for r in rows]
+        if col in ('gfex_contract', 'cme_contract'):
+            arrays[col] = np.array(values, dtype=str)
+        elif col == 'ts':
+            arrays[col] = np.array(values, dtype=np.int64)
+        else:
+            # 缺失值 (如CME无持仓量) 记为 NaN，放回库中时还原为 NULL
+            arrays[col] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp, path)
+
+
+def read_columns(path, columns=None):
+    """读取归档文件，返回 {列名: ndarray}；columns 为 None 时读取全部列"""
+    with np.load(path, allow_pickle=False) as data:
+        return {col: data[col] for col in (columns or data.files)}
+
+
+def archive_month(kind, metal, name, month, dry_run=False):
+    """
+    归档单个配对/合约的一个月数据，返回归档的行数
+
+    该月已有归档文件时（之后又写入了迟到数据），先把文件数据放回库中合并
+    （库中数据优先），重算该月汇总后整体重写文件。写文件与删除库内数据在
+    同一个事务内完成，失败时库内数据保持不变。
+    """
+    conn = get_connection()
+    table, key_col, key, columns = _source(kind, metal, name, conn)
+    if key is None:
+        return 0
+    start, end = month_range(month)
+    col_list = ', '.join(columns)
+    where = f'{key_col} = ? AND ts >= ? AND ts < ?'
+
+    count = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {where}', (key, start, end)).fetchone()[0]
+    if count == 0 or dry_run:
+        return count
+
+    path = archive_path(kind, metal, name, month)
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if os.path.exists(path):
+            old = read_columns(path, columns)
+            rows = zip(*([None if v != v else v for v in old[col].tolist()] for col in columns))
+            conn.executemany(f'''
+                INSERT OR IGNORE INTO {table} ({key_col}, {col_list})
+                VALUES ({', '.join('?' * (len(columns) + 1))})
+            ''', ((key,) + tuple(row) for row in rows))
+            _rollup(kind, metal, key, conn, start, end)
+
+        rows = conn.execute(
+            f'SELECT {col_list} FROM {table} WHERE {where} ORDER BY ts', (key, start, end)
+        ).fetchall()
+        _write_columns(path, columns, rows)
+        conn.execute(f'DELETE FROM {table} WHERE {where}', (key, start, end))
+        bump_data_version(conn)
+    return len(rows)
+
+
+def _series(conn):
+    """所有可归档对象 (kind, metal, name)"""
+    for metal, table in PAIR_TABLES.items():
+        for (pair_name,) in conn.execute(f'SELECT DISTINCT pair_name FROM {table}').fetchall():
+            yield 'pairs', metal, pair_name
+    for symbol, metal in conn.execute('SELECT symbol, metal FROM instruments ORDER BY symbol').fetchall():
+        yield 'bars', metal, symbol
+
+
+def archive_closed_months(keep_months=1, dry_run=False):
+    """
+    归档所有已结束的月份
+
+    当月以及之前 keep_months 个月保留在库中（迟到数据、回填仍直接写库）。
+    返回 [(kind, metal, name, month, rows)]。
+    """
+    now = datetime.now()
+    year, mon = now.year, now.month - keep_months
+    while mon < 1:
+        year, mon = year - 1, mon + 12
+    cutoff = to_epoch(datetime(year, mon, 1))
+
+    conn = get_connection()
+    report = []
+    for kind, metal, name in list(_series(conn)):
+        table, key_col, key, _ = _source(kind, metal, name, conn)
+        months = [m for (m,) in conn.execute(f'''
+            SELECT DISTINCT strftime('%Y-%m', ts, 'unixepoch', '+8 hours')
+            FROM {table} WHERE {key_col} = ? AND ts < ?
+        ''', (key, cutoff)).fetchall()]
+        for month in sorted(months):
+            report.append((kind, metal, name, month, archive_month(kind, metal, name, month, dry_run)))
+    return report
+
+
+def load_frame(kind, metal, name, start_ts=None, end_ts=None, columns=None):
+    """
+    读取归档数据，返回按 ts 升序的 DataFrame（闭区间 [start_ts, end_ts]）
+
+    只打开与区间相交的月份文件，且只解压 columns 指定的列。
+    """
+    columns = columns or (PAIR_COLUMNS if kind == 'pairs' else BAR_COLUMNS)
+    if 'ts' not in columns:
+        columns = ['ts'] + list(columns)
+
+    frames = []
+    for month in archived_months(kind, metal, name):
+        start, end = month_range(month)
+        if (start_ts is not None and end <= start_ts) or (end_ts is not None and start > end_ts):
+            continue
+        frames.append(pd.DataFrame(read_columns(archive_path(kind, metal, name, month), columns)))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.concat(frames, ignore_index=True)
+    if start_ts is not None:
+        df = df[df['ts'] >= start_ts]
+    if end_ts is not None:
+        df = df[df['ts'] <= end_ts]
+    return df.sort_values('ts').reset_index(drop=True)
+
+
+def pair_history(metal, pair_name, start_ts=None, end_ts=None, agg='last', limit=5000):
+    """
+    归档中的分钟级配对历史，格式与 database.get_pair_history 相同
+
+    agg='last' 返回原始行；agg='ohlc' 按北京时间分钟分桶。只返回最近的 limit 条。
+    """
+    df = load_frame('pairs', metal, pair_name, start_ts, end_ts)
+    if len(df) == 0:
+        return []
+
+    step = RESOLUTIONS['1m']
+    df['bucket'] = (df['ts'] + BEIJING_OFFSET) // step * step - BEIJING_OFFSET
+    if agg == 'last':
+        df = df.tail(limit)
+        dates = [from_epoch(ts) for ts in df['ts'].tolist()]
+    else:
+        grouped = df.groupby('bucket')
+        spread = grouped['spread_pct']
+        last = grouped.last()
+        df = last.assign(open=spread.first(), high=spread.max(), low=spread.min(),
+                         sum=spread.sum(), count=spread.count()).tail(limit)
+        dates = [from_epoch(ts) for ts in df.index.tolist()]
+
+    history = []
+    for date, row in zip(dates, df.to_dict('records')):
+        item = {'date': date, 'gfex_price': row['gfex_price'], 'cme_usd': row['cme_usd'],
+                'cme_cny': row['cme_cny'], 'spread': row['spread'], 'spread_pct': row['spread_pct']}
+        if agg == 'ohlc':
+            item.update({'open': row['open'], 'high': row['high'], 'low': row['low'],
+                         'close': row['spread_pct'], 'avg': row['sum'] / row['count'] if row['count'] else None,
+                         'count': int(row['count'])})
+        history.append(item)
+    return history
+
+
+def main():
+    print("=" * 60)
+    print("冷数据归档")
+    print("=" * 60)
+
+    keep_months = 1
+    if '--keep-months' in sys.argv:
+        keep_months = int(sys.argv[sys.argv.index('--keep-months') + 1])
+    dry_run = '--dry-run' in sys.argv
+
+    report = archive_closed_months(keep_months, dry_run)
+    total = 0
+    for kind, metal, name, month, rows in report:
+        print(f"  {kind:<6} {metal:<10} {name:<16} {month}  {rows:>8} 条")
+        total += rows
+
+    if dry_run:
+        print(f"[OK] 预演完成，可归档 {total} 条（未做任何修改）")
+    else:
+        print(f"[OK] 归档完成，共 {total} 条 -> {ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+asyncio HTTP/1.1 服务器
+一个事件循环处理全部连接（HTTP/1.1 keep-alive），不再每个连接占用一个线程；
+阻塞的工作按路由类别交给有界线程池:
+  db        SQLite 查询、读写本地文件
+  upstream  akshare/新浪等网络请求、数据同步子进程；同时在途的数量另有上限，排队超时返回 503
+  inline    很轻的处理，直接在事件循环中执行
+路由与业务处理由调用方提供 (price_api_server.resolve)，本模块只负责连接、协议与统计。
+响应体不是 bytes 时视为流（如 SSE）：可 async 迭代出若干段 bytes，不带 Content-Length，
+发送完（或客户端断开）后关闭连接。
+用法: python price_api_server.py --async [--port 8080]
+"""
+import asyncio
+import contextlib
+import http
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from urllib.parse import urlparse, parse_qs
+
+DB_WORKERS = 8                    # 数据库/文件线程池大小（也是 SQLite 读连接数的上限）
+UPSTREAM_WORKERS = 4              # 网络/子进程线程池大小
+MAX_UPSTREAM_INFLIGHT = 4         # 同时在途的上游调用上限
+UPSTREAM_WAIT = 30                # 等待上游名额的秒数，超时返回 503
+KEEPALIVE_TIMEOUT = 75            # 空闲连接保持的秒数
+MAX_HEADER_BYTES = 65536
+MAX_BODY_BYTES = 10 * 1024 * 1024
+LATENCY_SAMPLES = 10000           # 计算耗时分位数的最近请求数
+
+
+class Request:
+    """与传输方式无关的请求: method, path（不含查询串）, query, headers（小写键）, body"""
+
+    def __init__(self, method, target, headers=None, body=b''):
+        parsed = urlparse(target)
+        self.method = method
+        self.target = target
+        self.path = parsed.path
+        self.query = parse_qs(parsed.query)
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+        self.body = body
+
+    def param(self, name, default=None):
+        return self.query.get(name, [default])[0]
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
+class RequestStats:
+    """请求计数与最近 LATENCY_SAMPLES 个请求的耗时分位数（线程模式与 asyncio 模式共用）"""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self._latencies = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self._counts = {'requests': 0, 'errors': 0, 'rejected': 0,
+                        'connections': 0, 'max_connections': 0, 'total_connections': 0}
+        self._in_flight = {}
+
+    def record(self, seconds, status):
+        with self._lock:
+            self._latencies.append(seconds)
+            self._counts['requests'] += 1
+            if status >= 500:
+                self._counts['errors'] += 1
+            if status == 503:
+                self._counts['rejected'] += 1
+
+    def connection(self, delta):
+        with self._lock:
+            self._counts['connections'] += delta
+            if delta > 0:
+                self._counts['total_connections'] += 1
+                self._counts['max_connections'] = max(self._counts['max_connections'], self._counts['connections'])
+
+    def in_flight(self, kind, delta):
+        with self._lock:
+            self._in_flight[kind] = self._in_flight.get(kind, 0) + delta
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['in_flight'] = dict(self._in_flight)
+            latencies = sorted(self._latencies)
+        if latencies:
+            def pick(q):
+                return round(latencies[int(q * (len(latencies) - 1))] * 1000, 2)
+            stats['latency_ms'] = {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99),
+                                   'max': pick(1.0), 'samples': len(latencies)}
+        return stats
+
+
+def error_response(status, message):
+    body = json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+    return status, {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, body
+
+
+def _parse_head(head):
+    """解析请求行与请求头，格式错误时抛出 ValueError"""
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ')
+    if not version.startswith('HTTP/1.'):
+        raise ValueError(version)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method.upper(), target, version, headers
+
+
+def _keep_alive(version, headers):
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+class AsyncHTTPServer:
+    """
+    asyncio HTTP/1.1 服务器
+
+    resolve(request) 返回 (处理函数, 类别) 或 None (404)，处理函数接收 Request，
+    返回 (状态码, 响应头 dict, 响应体 bytes 或可 async 迭代的流)。
+    """
+
+    def __init__(self, resolve, host='', port=8080, stats=None, db_workers=DB_WORKERS,
+                 upstream_workers=UPSTREAM_WORKERS, max_upstream=MAX_UPSTREAM_INFLIGHT):
+        self.resolve = resolve
+        self.host = host
+        self.port = port
+        self.stats = stats or RequestStats()
+        self.max_upstream = max_upstream
+        self.executors = {
+            'db': ThreadPoolExecutor(db_workers, thread_name_prefix='api-db'),
+            'upstream': ThreadPoolExecutor(upstream_workers, thread_name_prefix='api-upstream'),
+        }
+        self._upstream = None
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            for executor in self.executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    async def serve(self):
+        self._upstream = asyncio.Semaphore(self.max_upstream)
+        server = await asyncio.start_server(self._connection, self.host or None, self.port,
+                                            limit=MAX_HEADER_BYTES, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    async def _run(self, func, kind, request):
+        if kind == 'inline':
+            return func(request)
+        loop = asyncio.get_running_loop()
+        if kind != 'upstream':
+            return await loop.run_in_executor(self.executors['db'], func, request)
+        try:
+            await asyncio.wait_for(self._upstream.acquire(), UPSTREAM_WAIT)
+        except asyncio.TimeoutError:
+            return error_response(503, '上游请求繁忙，请稍后重试')
+        self.stats.in_flight('upstream', 1)
+        try:
+            return await loop.run_in_executor(self.executors['upstream'], func, request)
+        finally:
+            self.stats.in_flight('upstream', -1)
+            self._upstream.release()
+
+    async def _handle(self, request):
+        route = self.resolve(request)
+        if route is None:
+            return error_response(404, 'Not Found')
+        func, kind = route
+        try:
+            return await self._run(func, kind, request)
+        except Exception as e:
+            print(f"[{request.method} {request.path}] 处理失败: {e}")
+            return error_response(500, str(e))
+
+    async def _connection(self, reader, writer):
+        self.stats.connection(1)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except asyncio.LimitOverrunError:
+                    await self._send(writer, error_response(431, 'Request Header Fields Too Large'), False, False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                started = time.perf_counter()
+                try:
+                    method, target, version, headers = _parse_head(head[:-4])
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    await self._send(writer, error_response(400, 'Bad Request'), False, False)
+                    break
+                if 'transfer-encoding' in headers:
+                    await self._send(writer, error_response(411, 'Length Required'), False, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._send(writer, error_response(413, 'Payload Too Large'), False, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                keep_alive = _keep_alive(version, headers)
+                request = Request('GET' if method == 'HEAD' else method, target, headers, body)
+                response = await self._handle(request)
+                if not isinstance(response[2], bytes):
+                    self.stats.record(time.perf_counter() - started, response[0])
+                    await self._stream(reader, writer, response, method == 'HEAD')
+                    break
+                await self._send(writer, response, keep_alive, method == 'HEAD')
+                self.stats.record(time.perf_counter() - started, response[0])
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.stats.connection(-1)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    def _head(status, headers, keep_alive, length=None):
+        lines = [f'HTTP/1.1 {status} {http.HTTPStatus(status).phrase}',
+                 f'Date: {formatdate(usegmt=True)}',
+                 f'Connection: {"keep-alive" if keep_alive else "close"}']
+        if length is not None and status not in (204, 304):
+            lines.append(f'Content-Length: {length}')
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _send(self, writer, response, keep_alive, head_only):
+        status, headers, body = response
+        writer.write(self._head(status, headers, keep_alive, len(body)))
+        if not head_only:
+            writer.write(body)
+        await writer.drain()
+
+    async def _stream(self, reader, writer, response, head_only):
+        """发送流式响应（以关闭连接结束），客户端断开时立即停止迭代并释放订阅"""
+        status, headers, body = response
+        writer.write(self._head(status, headers, False))
+        await writer.drain()
+        if head_only:
+            return
+
+        async def send():
+            async with contextlib.aclosing(aiter(body)) as chunks:
+                async for chunk in chunks:
+                    writer.write(chunk)
+                    await writer.drain()
+
+        self.stats.in_flight('stream', 1)
+        # 客户端在流上不再发送数据，读到 EOF 即表示已断开（不必等到下一次写入失败）
+        tasks = [asyncio.ensure_future(send()), asyncio.ensure_future(reader.read())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.stats.in_flight('stream', -1)
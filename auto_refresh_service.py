@@ -9,7 +9,7 @@ import schedule
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import json
+from json_artifacts import write_json
 import akshare as ak
 
 # 设置代理 (TradingView需要)
@@ -17,7 +17,7 @@ os.environ['HTTP_PROXY'] = 'http://127.0.0.1:7890'
 os.environ['HTTPS_PROXY'] = 'http://127.0.0.1:7890'
 
 from tvDatafeed import TvDatafeed, Interval
-from database import save_spread_data, save_price_snapshot
+import write_queue
 
 OZ_TO_GRAM = 31.1035
 RATE = 7.04  # USD/CNY汇率
@@ -173,16 +173,14 @@ def update_all_data():
         print("\n正在更新铂金数据...")
         pt_data = generate_spread_data(tv, 'platinum')
         if pt_data:
-            with open('platinum_spread_analysis.json', 'w', encoding='utf-8') as f:
-                json.dump(pt_data, f, ensure_ascii=False, indent=2)
+            write_json('platinum_spread_analysis.json', pt_data)
             print(f"  ✓ 铂金: {pt_data['current']['gfex_price']:.2f} vs {pt_data['current']['cme_cny']:.2f} = {pt_data['current']['spread_pct']:+.2f}%")
         
         # 更新钯金
         print("\n正在更新钯金数据...")
         pd_data = generate_spread_data(tv, 'palladium')
         if pd_data:
-            with open('palladium_spread_analysis.json', 'w', encoding='utf-8') as f:
-                json.dump(pd_data, f, ensure_ascii=False, indent=2)
+            write_json('palladium_spread_analysis.json', pd_data)
             print(f"  ✓ 钯金: {pd_data['current']['gfex_price']:.2f} vs {pd_data['current']['cme_cny']:.2f} = {pd_data['current']['spread_pct']:+.2f}%")
         
         # 更新价格卡片数据 (for API)
@@ -209,29 +207,29 @@ def update_all_data():
             }
         }
         
-        with open('prices_data.json', 'w', encoding='utf-8') as f:
-            json.dump(prices_data, f, ensure_ascii=False, indent=2)
+        write_json('prices_data.json', prices_data)
         print(f"\n✓ prices_data.json 已更新")
         
         # 保存到数据库
         try:
             now_str = datetime.now().strftime('%Y-%m-%d %H:%M')
             if pt_data:
-                save_spread_data('platinum', now_str, 
-                               pt_data['current']['gfex_price'],
-                               pt_data['current']['cme_usd'],
-                               pt_data['current']['cme_cny'],
-                               pt_data['current']['spread'],
-                               pt_data['current']['spread_pct'])
+                write_queue.put_spread('platinum', now_str, 
+                                     pt_data['current']['gfex_price'],
+                                     pt_data['current']['cme_usd'],
+                                     pt_data['current']['cme_cny'],
+                                     pt_data['current']['spread'],
+                                     pt_data['current']['spread_pct'])
             if pd_data:
-                save_spread_data('palladium', now_str,
-                               pd_data['current']['gfex_price'],
-                               pd_data['current']['cme_usd'],
-                               pd_data['current']['cme_cny'],
-                               pd_data['current']['spread'],
-                               pd_data['current']['spread_pct'])
+                write_queue.put_spread('palladium', now_str,
+                                     pd_data['current']['gfex_price'],
+                                     pd_data['current']['cme_usd'],
+                                     pd_data['current']['cme_cny'],
+                                     pd_data['current']['spread'],
+                                     pd_data['current']['spread_pct'])
             if pt_data and pd_data:
-                save_price_snapshot(pt_data['current'], pd_data['current'], RATE)
+                write_queue.put_snapshot(pt_data['current'], pd_data['current'], RATE)
+            write_queue.flush()
             print(f"✓ 数据已保存到数据库")
         except Exception as db_err:
             print(f"  数据库保存警告: {db_err}")
@@ -0,0 +1,409 @@
+"""
+合约K线缺口检测与定向补数计划
+按交易所交易时间（广期所日盘/夜盘、CME Globex）计算库中已有K线之间缺失的交易时段，
+只为这些缺口安排最少的抓取，代替每次固定抓 5000 根分钟线 / 1000 根小时线:
+  - tvDatafeed 只能取"最近 N 根"，每个周期至多抓一次，N 刚好够到该周期负责的最早缺口；
+    1分钟线够不到的旧缺口改用 5分钟/15分钟/1小时线补（只写入缺口内的K线）；
+  - akshare 新浪分钟线没有条数参数（固定返回最近一段），只决定抓不抓。
+库中K线时间取自 bar_rollups / pair_rollups 的 5m 桶，已移入年度分区或归档的数据同样算在内。
+节假日按下方列表排除，未列入的休市日只会多计划一次抓取（接口返回空）。
+用法: python backfill_planner.py [--days N] [--symbols PT2610,PLJ2026] [--pairs]
+      （预演：只打印缺口、抓取计划与相对固定抓取量节省的条数，不抓取任何数据）
+"""
+import math
+import sys
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import (
+    PAIR_TABLES, get_read_connection, instrument_info, from_epoch, to_epoch, series_to_epoch,
+)
+
+LOOKBACK_DAYS = 30        # 默认只检查最近 N 天
+MAX_BARS = 5000           # tvDatafeed 单次最多返回的条数
+SINA_BARS = 1000          # 新浪分钟线接口固定返回最近约 1000 根
+BAR_MARGIN = 10           # 条数余量（K线时间标记方式、交易所临时调整）
+SESSION_SEARCH_DAYS = 14  # 查找交易日开盘时间时前后各看的天数
+
+# 广期所铂/钯交易时间（北京时间）；夜盘属于下一交易日，节前最后一个交易日没有夜盘
+GFEX_DAY_SESSIONS = [('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')]
+GFEX_NIGHT_SESSION = ('21:00', '02:30')
+
+# CME Globex 金属: 交易日 D 的时段为芝加哥时间 D-1 17:00 至 D 16:00，周日晚开盘
+CME_TIMEZONE = 'America/Chicago'
+CME_OPEN, CME_CLOSE = '17:00', '16:00'
+
+
+def _days(first, last):
+    """[first, last] 之间的全部日期文本"""
+    start, end = date.fromisoformat(first), date.fromisoformat(last)
+    return {(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)}
+
+
+# 全天休市的工作日（按交易所公告维护，周末无需列出）
+HOLIDAYS = {
+    'GFEX': set().union(
+        _days('2025-01-01', '2025-01-01'), _days('2025-01-28', '2025-02-04'), _days('2025-04-04', '2025-04-04'),
+        _days('2025-05-01', '2025-05-05'), _days('2025-06-02', '2025-06-02'), _days('2025-10-01', '2025-10-08'),
+        _days('2026-01-01', '2026-01-02'), _days('2026-02-16', '2026-02-23'), _days('2026-04-06', '2026-04-06'),
+        _days('2026-05-01', '2026-05-05'), _days('2026-06-19', '2026-06-19'), _days('2026-09-25', '2026-09-25'),
+        _days('2026-10-01', '2026-10-07'),
+    ),
+    # 只列 Globex 金属整天不开盘的日子，提前收盘的假日按正常交易日处理
+    'CME': {'2025-01-01', '2025-04-18', '2025-12-25', '2026-01-01', '2026-04-03', '2026-12-25'},
+    'FX': set(),
+}
+
+# 数据源配置:
+#   calendar       判定缺口所用的交易日历
+#   fetch_calendar 换算抓取条数所用的交易日历
+#   step           库中K线周期（秒）
+#   tolerance      连续缺失超过这么多交易秒数才算缺口
+#   intervals      可选抓取周期 秒 -> 数据源周期名（不低于 step，从细到粗尝试）
+#   fixed_window   数据源不能指定条数，一次抓取总是返回 max_bars 根
+#   baseline       原来的固定抓取条数（计算节省量）
+SOURCES = {
+    # fetch_2026_contracts.py: 广期所小时线 (akshare period='60')
+    'GFEX': {'calendar': 'GFEX', 'fetch_calendar': 'GFEX', 'step': 3600, 'tolerance': 5400,
+             'intervals': {3600: '60'}, 'max_bars': SINA_BARS, 'fixed_window': True, 'baseline': SINA_BARS},
+    # fetch_2026_contracts.py: CME 分钟线 (tvDatafeed Interval.*)
+    'CME': {'calendar': 'CME', 'fetch_calendar': 'CME', 'step': 60, 'tolerance': 1800,
+            'intervals': {60: 'in_1_minute', 300: 'in_5_minute', 900: 'in_15_minute', 3600: 'in_1_hour'},
+            'max_bars': MAX_BARS, 'fixed_window': False, 'baseline': MAX_BARS},
+    # import_history.py: 配对价差按广期所小时线生成，CME 腿用 tvDatafeed 小时线
+    'PAIRS': {'calendar': 'GFEX', 'fetch_calendar': 'CME', 'step': 3600, 'tolerance': 5400,
+              'intervals': {3600: 'in_1_hour'}, 'max_bars': MAX_BARS, 'fixed_window': False, 'baseline': 1000},
+}
+
+
+# ==================== 交易日历 ====================
+
+def _is_trading_day(day, calendar):
+    return day.weekday() < 5 and day.isoformat() not in HOLIDAYS[calendar]
+
+
+def _beijing(day, hhmm):
+    hour, minute = map(int, hhmm.split(':'))
+    return to_epoch(datetime(day.year, day.month, day.day, hour, minute))
+
+
+def _chicago(day, hhmm):
+    hour, minute = map(int, hhmm.split(':'))
+    return int(pd.Timestamp(datetime(day.year, day.month, day.day, hour, minute), tz=CME_TIMEZONE).timestamp())
+
+
+def _day_sessions(calendar, day):
+    """某个日期开始的交易时段 [(开, 收)]（UTC 时间戳）"""
+    if not _is_trading_day(day, calendar):
+        return []
+    if calendar == 'GFEX':
+        sessions = [(_beijing(day, a), _beijing(day, b)) for a, b in GFEX_DAY_SESSIONS]
+        next_day = day + timedelta(days=3 if day.weekday() == 4 else 1)
+        if _is_trading_day(next_day, calendar):
+            night_open, night_close = GFEX_NIGHT_SESSION
+            sessions.append((_beijing(day, night_open), _beijing(day + timedelta(days=1), night_close)))
+        return sessions
+    previous = day - timedelta(days=1)
+    if calendar == 'CME':
+        return [(_chicago(previous, CME_OPEN), _chicago(day, CME_CLOSE))]
+    # 外汇 (USDCNH) 周一至周五连续交易
+    return [(_chicago(previous, CME_OPEN), _chicago(day, CME_OPEN))]
+
+
+def trading_sessions(calendar, start_ts, end_ts):
+    """
+    [start_ts, end_ts] 内的交易时段，返回按时间排序的 [(开, 收)]（UTC 时间戳，已裁剪）
+
+    calendar 为 'GFEX'、'CME' 或 'FX'。
+    """
+    first = date.fromisoformat(from_epoch(start_ts, '%Y-%m-%d')) - timedelta(days=1)
+    last = date.fromisoformat(from_epoch(end_ts, '%Y-%m-%d')) + timedelta(days=1)
+    sessions = []
+    for i in range((last - first).days + 1):
+        for open_ts, close_ts in _day_sessions(calendar, first + timedelta(days=i)):
+            open_ts, close_ts = max(open_ts, start_ts), min(close_ts, end_ts)
+            if open_ts < close_ts:
+                sessions.append((open_ts, close_ts))
+    return sorted(sessions)
+
+
+def session_seconds(sessions, start_ts, end_ts):
+    """[start_ts, end_ts] 中处于交易时段的秒数"""
+    return sum(max(0, min(close_ts, end_ts) - max(open_ts, start_ts)) for open_ts, close_ts in sessions)
+
+
+def _reach(sessions, now, seconds):
+    """从 now 往回累计 seconds 个交易秒数所到达的时间点，交易时段不够时返回 None"""
+    for open_ts, close_ts in reversed(sessions):
+        close_ts = min(close_ts, now)
+        if close_ts <= open_ts:
+            continue
+        if close_ts - open_ts >= seconds:
+            return close_ts - seconds
+        seconds -= close_ts - open_ts
+    return None
+
+
+def bars_needed(calendar, since, step, now=None):
+    """从 since 到现在按 calendar 交易时间共有多少根 step 秒K线（含余量）"""
+    now = now or to_epoch(datetime.now())
+    seconds = session_seconds(trading_sessions(calendar, since, now), since, now)
+    return math.ceil(seconds / step) + BAR_MARGIN
+
+
+def trading_day_opens(calendar, start_ts, end_ts):
+    """
+    [start_ts, end_ts] 内各交易日的开盘时间
+
+    广期所交易日从前一晚 21:00 夜盘算起，前一晚没有夜盘（节后第一天）时从 09:00 算起；
+    CME/外汇每个交易时段即一个交易日。
+    """
+    opens = []
+    after_night = False
+    for open_ts, _ in trading_sessions(calendar, start_ts, end_ts):
+        if calendar != 'GFEX':
+            opens.append(open_ts)
+            continue
+        hhmm = from_epoch(open_ts, '%H:%M')
+        if hhmm == GFEX_NIGHT_SESSION[0] or (hhmm == GFEX_DAY_SESSIONS[0][0] and not after_night):
+            opens.append(open_ts)
+        after_night = hhmm == GFEX_NIGHT_SESSION[0]
+    return [ts for ts in opens if ts >= start_ts]
+
+
+def trading_day_bounds(calendar, ts=None):
+    """
+    ts 所在交易日的 (开盘时间, 下一交易日开盘时间)
+
+    收盘后、休市期间仍算作最近一个交易日，直到下一交易日开盘。前后各看 SESSION_SEARCH_DAYS 天
+    （覆盖春节等长假），范围内找不到时对应位置为 None。
+    """
+    ts = ts or to_epoch(datetime.now())
+    opens = trading_day_opens(calendar, ts - SESSION_SEARCH_DAYS * 86400, ts + SESSION_SEARCH_DAYS * 86400)
+    current = max((o for o in opens if o <= ts), default=None)
+    upcoming = min((o for o in opens if o > ts), default=None)
+    return current, upcoming
+
+
+# ==================== 缺口与抓取计划 ====================
+
+def find_gaps(points, sessions, start_ts, end_ts, tolerance, tail=None):
+    """
+    相邻两个已有K线时间之间的交易秒数超过 tolerance 即为缺口
+
+    窗口起点/终点也作为边界参与比较（窗口开头没有数据、最近一段没有数据都算缺口）。
+    最后一段（最新K线到 end_ts）还在延长，交易时间达到 tail 秒（一根K线）就算缺口，
+    不必等到超过 tolerance。返回 [{'start', 'end', 'seconds'}]，start/end 为缺口两侧已有数据的时间。
+    """
+    bounds = [start_ts] + [ts for ts in points if start_ts < ts < end_ts] + [end_ts]
+    gaps = []
+    for i, (a, b) in enumerate(zip(bounds, bounds[1:])):
+        last = tail is not None and i == len(bounds) - 2
+        threshold = min(tolerance, tail) if last else tolerance
+        if b - a < threshold:       # 交易秒数不会超过自然时间差
+            continue
+        seconds = session_seconds(sessions, a, b)
+        if seconds > tolerance or (last and seconds >= tail):
+            gaps.append({'start': a, 'end': b, 'seconds': seconds})
+    return gaps
+
+
+def plan_fetches(gaps, source, now, sessions):
+    """
+    为缺口安排抓取: 从最细的周期开始，每个周期负责其 max_bars 够得到的那部分缺口，
+    更旧的部分交给下一个更粗的周期。返回 (fetches, unreachable)。
+
+    fetches 为 [{'interval', 'step', 'n_bars', 'gaps'}]，sessions 为 fetch_calendar 的交易时段。
+    """
+    config = SOURCES[source]
+    remaining = [(gap['start'], gap['end']) for gap in gaps]
+    fetches = []
+    for step, interval in sorted(config['intervals'].items()):
+        if not remaining or step < config['step']:
+            continue
+        reach = _reach(sessions, now, config['max_bars'] * step)
+        if reach is None:
+            covered, remaining = remaining, []
+        else:
+            covered = [(max(a, reach), b) for a, b in remaining if b > reach]
+            remaining = [(a, min(b, reach)) for a, b in remaining if a < reach]
+        if not covered:
+            continue
+        oldest = min(a for a, _ in covered)
+        n_bars = config['max_bars']
+        if not config['fixed_window']:
+            n_bars = min(n_bars, math.ceil(session_seconds(sessions, oldest, now) / step) + BAR_MARGIN)
+        fetches.append({'interval': interval, 'step': step, 'n_bars': n_bars,
+                        'gaps': [{'start': a, 'end': b} for a, b in covered]})
+    return fetches, [{'start': a, 'end': b} for a, b in remaining]
+
+
+def plan_series(points, source, start_ts=None, now=None):
+    """
+    根据已有K线时间 points 为一条序列生成补数计划
+
+    返回 {'source', 'step', 'gaps', 'missing', 'fetches', 'unreachable', 'bars', 'baseline', 'beyond_baseline'}:
+    missing 为缺口内按交易时间估算的缺失根数，bars 为计划抓取的总条数，baseline 为原来
+    固定抓取的条数，beyond_baseline 为缺口中原来的固定抓取够不到、从未补上的根数。
+    """
+    config = SOURCES[source]
+    now = now or to_epoch(datetime.now())
+    start_ts = start_ts or now - LOOKBACK_DAYS * 86400
+    sessions = trading_sessions(config['calendar'], start_ts, now)
+    gaps = find_gaps(points, sessions, start_ts, now, config['tolerance'], tail=config['step'])
+
+    fetch_sessions = sessions
+    if config['fetch_calendar'] != config['calendar']:
+        # 抓取条数按数据源的交易时间计，可能要回溯到窗口之前
+        fetch_sessions = trading_sessions(config['fetch_calendar'], now - 400 * 86400, now)
+    fetches, unreachable = plan_fetches(gaps, source, now, fetch_sessions)
+    reach = _reach(fetch_sessions, now, config['baseline'] * config['step'])
+    beyond = sum(session_seconds(sessions, gap['start'], min(gap['end'], reach))
+                 for gap in gaps if reach is not None and gap['start'] < reach)
+    return {
+        'source': source,
+        'step': config['step'],
+        'gaps': gaps,
+        'missing': sum(math.ceil(gap['seconds'] / config['step']) for gap in gaps),
+        'fetches': fetches,
+        'unreachable': unreachable,
+        'bars': sum(fetch['n_bars'] for fetch in fetches),
+        'baseline': config['baseline'],
+        'beyond_baseline': math.ceil(beyond / config['step']),
+    }
+
+
+def _rollup_points(sql, params, start_ts):
+    """5m 汇总桶中的首末K线时间（覆盖主库、年度分区与归档）"""
+    rows = get_read_connection().execute(sql, params + [start_ts - 300]).fetchall()
+    return sorted({ts for row in rows for ts in row if ts >= start_ts})
+
+
+def _latest_real_bar(symbol, start_ts):
+    """
+    窗口内最新一根有成交量的K线时间，没有时返回 None
+
+    爬虫每轮写入的实时价是 o=h=l=c、成交量为 0 的单点K线，不能代替数据源的K线；
+    按主键从新到旧找第一根成交量大于 0 的，只会经过最近的那些爬虫点。
+    """
+    row = get_read_connection().execute('''
+        SELECT b.ts FROM instruments i JOIN bars b ON b.instrument_id = i.instrument_id
+        WHERE i.symbol = ? AND b.ts >= ? AND b.v > 0
+        ORDER BY b.ts DESC LIMIT 1
+    ''', (symbol, start_ts)).fetchone()
+    return row[0] if row else None
+
+
+def plan_instrument(symbol, days=LOOKBACK_DAYS, now=None):
+    """单个合约K线 (bars) 的补数计划，数据源按交易所选择"""
+    info = instrument_info(symbol)
+    if info is None:
+        raise ValueError(f"无法识别合约 {symbol} 的交易所/品种")
+    now = now or to_epoch(datetime.now())
+    start_ts = now - days * 86400
+    # 只有爬虫单点K线（成交量合计为 0）的桶不算已有数据
+    points = _rollup_points('''
+        SELECT r.first_ts, r.last_ts FROM instruments i
+        JOIN bar_rollups r ON r.instrument_id = i.instrument_id
+        WHERE i.symbol = ? AND r.resolution = '5m' AND r.v > 0 AND r.bucket >= ?
+    ''', [symbol], start_ts)
+    # 混有爬虫点的桶，末条时间可能是爬虫点；最近一段从最新的真实K线算起
+    # （主库里没有真实K线时，例如整段已移入分区，只能按汇总桶判断）
+    latest = _latest_real_bar(symbol, start_ts)
+    if latest is not None:
+        points = [ts for ts in points if ts < latest] + [latest]
+    plan = plan_series(points, info[0], start_ts, now)
+    plan['symbol'] = symbol
+    return plan
+
+
+def plan_pair(metal, pair_name, days=LOOKBACK_DAYS, now=None):
+    """单个配对价差小时数据的补数计划（import_history.py）"""
+    if metal not in PAIR_TABLES:
+        raise ValueError(f"未知品种: {metal}")
+    now = now or to_epoch(datetime.now())
+    start_ts = now - days * 86400
+    points = _rollup_points('''
+        SELECT first_ts, last_ts FROM pair_rollups
+        WHERE metal = ? AND pair_name = ? AND resolution = '5m' AND bucket >= ?
+    ''', [metal, pair_name], start_ts)
+    plan = plan_series(points, 'PAIRS', start_ts, now)
+    plan['symbol'] = f'{metal} {pair_name}'
+    return plan
+
+
+def oldest_gap(plan):
+    """计划中最早需要补的时间，无需抓取时返回 None"""
+    starts = [gap['start'] for fetch in plan['fetches'] for gap in fetch['gaps']]
+    return min(starts) if starts else None
+
+
+def in_gaps(times, gaps):
+    """
+    北京时间 DatetimeIndex / 时间序列中落在缺口内的K线掩码
+
+    用更粗的周期补数时只写入缺口内的K线，不覆盖已有的细周期K线。
+    """
+    ts = np.asarray(series_to_epoch(times), dtype=np.int64)
+    mask = np.zeros(len(ts), dtype=bool)
+    for gap in gaps:
+        mask |= (ts >= gap['start']) & (ts <= gap['end'])
+    return mask
+
+
+# ==================== 预演报告 ====================
+
+def describe(plan):
+    """计划的文字说明（多行）"""
+    lines = [f"{plan['symbol']} ({plan['source']}): 缺口 {len(plan['gaps'])} 个，约缺 {plan['missing']} 根"]
+    for gap in plan['gaps']:
+        lines.append(f"    缺口 {from_epoch(gap['start'])} ~ {from_epoch(gap['end'])} "
+                     f"(交易时间 {gap['seconds'] / 3600:.1f}h)")
+    for fetch in plan['fetches']:
+        lines.append(f"    抓取 {fetch['interval']} × {fetch['n_bars']}，覆盖 {len(fetch['gaps'])} 段")
+    for gap in plan['unreachable']:
+        lines.append(f"    [!] 超出数据源回溯范围: {from_epoch(gap['start'])} ~ {from_epoch(gap['end'])}")
+    if not plan['fetches']:
+        lines.append("    无需抓取")
+    lines.append(f"    计划 {plan['bars']} 根 / 固定抓取 {plan['baseline']} 根")
+    return lines
+
+
+def main():
+    print("=" * 60)
+    print("K线缺口与补数计划（预演）")
+    print("=" * 60)
+
+    days = LOOKBACK_DAYS
+    if '--days' in sys.argv:
+        days = int(sys.argv[sys.argv.index('--days') + 1])
+
+    conn = get_read_connection()
+    if '--symbols' in sys.argv:
+        symbols = sys.argv[sys.argv.index('--symbols') + 1].split(',')
+    else:
+        symbols = [row[0] for row in conn.execute('SELECT symbol FROM instruments ORDER BY exchange, symbol')]
+
+    plans = [plan_instrument(symbol, days) for symbol in symbols if instrument_info(symbol)]
+    if '--pairs' in sys.argv:
+        plans += [plan_pair(metal, pair_name, days) for metal, pair_name in
+                  conn.execute('SELECT metal, pair_name FROM pair_latest ORDER BY metal, pair_name')]
+
+    for plan in plans:
+        print('\n'.join(describe(plan)))
+
+    planned = sum(plan['bars'] for plan in plans)
+    baseline = sum(plan['baseline'] for plan in plans)
+    fetches = sum(len(plan['fetches']) for plan in plans)
+    beyond = sum(plan['beyond_baseline'] for plan in plans)
+    saved = 1 - planned / baseline if baseline else 0
+    print(f"\n[OK] 最近 {days} 天: 计划 {fetches} 次抓取 / {planned} 根，"
+          f"固定抓取 {len(plans)} 次 / {baseline} 根，节省 {baseline - planned} 根 ({saved:.0%})")
+    if beyond:
+        print(f"[!] 其中约 {beyond} 根缺口超出原固定抓取的回溯范围，按计划抓取会比固定抓取多取数据")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+API 服务器压测
+对运行中的 price_api_server 同时打开 N 个 keep-alive 连接，每个连接依次发送 M 个请求，
+统计吞吐量与客户端耗时分位数 (p50/p90/p99/max)，结束后读取服务端的 /api/server-stats。
+用法: python bench_api_server.py [--url http://localhost:8080/api/platinum-pairs]
+                                 [--connections 300] [--requests 20]
+"""
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import urlparse
+
+DEFAULT_URL = 'http://localhost:8080/api/platinum-pairs'
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+async def _request(reader, writer, host, path):
+    """发送一个 GET 请求并读完响应，返回 (状态码, 响应体, 连接是否保持)"""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode())
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {k.strip().lower(): v.strip() for k, v in (line.split(':', 1) for line in lines[1:] if line)}
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()
+    # 线程模式 (HTTP/1.0) 每个响应后关闭连接
+    keep_alive = lines[0].startswith('HTTP/1.1') and headers.get('connection', '').lower() != 'close'
+    return status, body, keep_alive
+
+
+async def _client(url, requests, latencies, errors):
+    parsed = urlparse(url)
+    path = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+    writer = None
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or 80)
+            status, _, keep_alive = await _request(reader, writer, parsed.netloc, path)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors.append(f'HTTP {status}')
+            if not keep_alive:
+                writer.close()
+                writer = None
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors.append(str(e) or type(e).__name__)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run(url, connections, requests):
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*[_client(url, requests, latencies, errors) for _ in range(connections)])
+    return latencies, errors, time.perf_counter() - started
+
+
+async def server_stats(url):
+    parsed = urlparse(url)
+    reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or 80)
+    try:
+        _, body, _ = await _request(reader, writer, parsed.netloc, '/api/server-stats')
+        return json.loads(body)
+    finally:
+        writer.close()
+
+
+def main():
+    print("=" * 60)
+    print("API 服务器压测")
+    print("=" * 60)
+
+    url = _arg('--url', DEFAULT_URL)
+    connections = _arg('--connections', 300)
+    requests = _arg('--requests', 20)
+    print(f"{url}: {connections} 个连接 × {requests} 个请求")
+
+    latencies, errors, elapsed = asyncio.run(run(url, connections, requests))
+    if latencies:
+        latencies.sort()
+        pick = lambda q: latencies[int(q * (len(latencies) - 1))] * 1000
+        print(f"[OK] 完成 {len(latencies)} 个请求，耗时 {elapsed:.2f}s，{len(latencies) / elapsed:.0f} 请求/秒")
+        print(f"  客户端耗时 p50 {pick(0.5):.1f}ms  p90 {pick(0.9):.1f}ms  "
+              f"p99 {pick(0.99):.1f}ms  max {pick(1.0):.1f}ms")
+    if errors:
+        print(f"[X] 失败 {len(errors)} 次，例如: {errors[0]}")
+
+    try:
+        stats = asyncio.run(server_stats(url))
+        print(f"  服务端 ({stats.get('mode')}): {json.dumps(stats.get('latency_ms'), ensure_ascii=False)}，"
+              f"最多同时 {stats.get('max_connections')} 个连接")
+    except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+        print(f"[!] 读取 /api/server-stats 失败: {e}")
+
+
+if __name__ == "__main__":
+    main()
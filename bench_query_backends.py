@@ -0,0 +1,126 @@
+"""
+查询后端基准测试: SQLite vs DuckDB
+在临时目录生成一张合成的配对价差表（默认 100 万行），分别用两个后端跑
+多配对扫描、区间统计、小时级 OHLC 聚合与滚动 Z 分数，比较耗时并核对结果一致。
+用法: python bench_query_backends.py [--rows N] [--pairs N] [--repeat N] [--keep]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import archive
+import database
+import query_backend
+
+METAL = 'platinum'
+START_TS = 1735689600           # 2025-01-01 00:00 UTC
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return int(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+def build_database(folder, rows, pairs):
+    """生成合成数据：每个配对一条分钟级随机游走，直接批量写入原始表"""
+    database.DB_FILE = os.path.join(folder, 'bench.db')
+    archive.ARCHIVE_DIR = os.path.join(folder, 'archive')
+    database.init_database()
+
+    rng = np.random.default_rng(20260101)
+    per_pair = rows // pairs
+    conn = database.get_connection()
+    with conn:
+        for i in range(pairs):
+            ts = START_TS + np.arange(per_pair, dtype=np.int64) * 60
+            gfex = 550 + np.cumsum(rng.normal(0, 0.5, per_pair))
+            cme_cny = 540 + np.cumsum(rng.normal(0, 0.5, per_pair))
+            spread = gfex - cme_cny
+            conn.executemany(f'''
+                INSERT INTO {database.PAIR_TABLES[METAL]}
+                (pair_name, gfex_contract, cme_contract, ts, gfex_price, cme_usd, cme_cny, spread, spread_pct)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', zip([f'BENCH-{i:02d}'] * per_pair, ['PT2610'] * per_pair, ['PLJ2026'] * per_pair,
+                     ts.tolist(), gfex.tolist(), (cme_cny / 7.1 * 31.1035).tolist(), cme_cny.tolist(),
+                     spread.tolist(), (spread / cme_cny * 100).tolist()))
+    return per_pair * pairs
+
+
+def timed(func, repeat):
+    """返回 (最短耗时秒, 最后一次结果)"""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    print("=" * 60)
+    print("查询后端基准测试")
+    print("=" * 60)
+
+    rows = _arg('--rows', 1_000_000)
+    pairs = _arg('--pairs', 10)
+    repeat = _arg('--repeat', 3)
+
+    backends = ['sqlite']
+    if query_backend.duckdb_available():
+        backends.append('duckdb')
+    else:
+        print("[!] 未安装 duckdb (pip install duckdb)，只测试 SQLite 后端")
+
+    folder = tempfile.mkdtemp(prefix='bench_query_')
+    try:
+        started = time.perf_counter()
+        total = build_database(folder, rows, pairs)
+        print(f"[OK] 合成数据 {total} 行 / {pairs} 个配对，耗时 {time.perf_counter() - started:.1f}s\n")
+
+        pair = 'BENCH-00'
+        cases = [
+            ('多配对扫描', lambda: query_backend.load_pairs(METAL)),
+            ('区间统计', lambda: query_backend.pair_summary(METAL)),
+            ('1h OHLC', lambda: query_backend.pair_ohlc(METAL, pair, 3600)),
+            ('滚动Z分数', lambda: query_backend.rolling_zscore(METAL, pair, window=240)),
+        ]
+
+        timings, results = {}, {}
+        for backend in backends:
+            query_backend.set_backend(backend)
+            for name, func in cases:
+                timings[backend, name], results[backend, name] = timed(func, repeat)
+
+        print(f"{'查询':<12}" + ''.join(f"{b:>12}" for b in backends) + ('     加速比' if len(backends) > 1 else ''))
+        for name, _ in cases:
+            line = f"{name:<12}" + ''.join(f"{timings[b, name] * 1000:>10.0f}ms" for b in backends)
+            if len(backends) > 1:
+                line += f"{timings['sqlite', name] / timings['duckdb', name]:>10.1f}x"
+            print(line)
+
+        if len(backends) > 1:
+            print()
+            for name, _ in cases:
+                a, b = results['sqlite', name], results['duckdb', name]
+                numeric = a.select_dtypes('number').columns
+                diff = np.nanmax(np.abs(a[numeric].to_numpy(float) - b[numeric].to_numpy(float)))
+                mark = '✓' if len(a) == len(b) and diff < 1e-6 else '[X]'
+                print(f"  {mark} {name}: {len(a)} 行，最大差异 {diff:.2e}")
+    finally:
+        query_backend.set_backend('auto')
+        query_backend.close()
+        database.close_connections()
+        if '--keep' in sys.argv:
+            print(f"\n数据保留在: {folder}")
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+历史数据的列式编码
+/api/pair-history 等接口的历史默认是字典列表，每个点都重复一遍字段名，几千个点的响应大部分是键名，
+序列化和浏览器解析都慢。format 参数可选两种列式表示:
+  columnar  JSON 平行数组: ts 为 UTC 秒级时间戳，价格为按 SCALES 放大后取整的整数（缺失为 null），
+            {'count': n, 'scale': {字段: 倍数}, 'ts': [...], 'gfex_price': [...], ...}
+  binary    小端定长数组，前端可直接构造 TypedArray（不经过 JSON 解析）:
+            'PMC1' | uint32 头部长度 | 头部 JSON（补空格到 8 字节对齐）| 各列数据
+            头部 {'count', 'columns': [{'name', 'type', 'offset'}], ...附加字段}，offset 相对文件开头，
+            type 为 uint32（ts）/ float32（价格，缺失为 NaN）/ int32（条数）
+
+用法:
+    import columnar
+    columnar.to_columns(history)                 # 字典列表 -> 列式 JSON 对象
+    body = columnar.encode_binary(history, {'pair_name': '2610-2610'})
+    columnar.decode_binary(body)                  # -> (头部, {列名: numpy 数组})
+
+前端解码 binary:
+    const view = new DataView(buf); const len = view.getUint32(4, true);
+    const head = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 8, len)));
+    for (const c of head.columns) cols[c.name] = new TYPED[c.type](buf, c.offset, head.count);
+"""
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+from database import BEIJING_OFFSET
+
+FORMATS = ('json', 'columnar', 'binary')
+BINARY_TYPE = 'application/octet-stream'
+MAGIC = b'PMC1'
+
+# 列式 JSON 中各字段放大的倍数（价格保留 2 位小数，百分比保留 4 位）
+SCALES = {
+    'gfex_price': 100,
+    'cme_usd': 100,
+    'cme_cny': 100,
+    'spread': 100,
+    'spread_pct': 10000,
+    'open': 10000,
+    'high': 10000,
+    'low': 10000,
+    'close': 10000,
+    'avg': 10000,
+    'count': 1,
+}
+
+# 二进制格式的列类型
+DTYPES = {'ts': '<u4', 'count': '<i4'}
+FLOAT_DTYPE = '<f4'
+TYPE_NAMES = {'<u4': 'uint32', '<i4': 'int32', '<f4': 'float32'}
+
+
+def _fields(history):
+    """历史记录中除 date 外的数值字段（按 SCALES 的顺序）"""
+    present = history[0].keys() if history else ()
+    return [name for name in SCALES if name in present]
+
+
+def _timestamps(history):
+    """date（北京时间文本）-> UTC 秒级时间戳数组"""
+    dates = pd.to_datetime([item['date'] for item in history], format='%Y-%m-%d %H:%M')
+    return dates.values.astype('datetime64[s]').astype('int64') - BEIJING_OFFSET
+
+
+def _column(history, name):
+    """某字段的 float64 数组，None 为 NaN"""
+    return np.array([item[name] for item in history], dtype='float64')
+
+
+def to_columns(history):
+    """字典列表 -> {'count', 'scale', 'ts', 字段...}，数值按 SCALES 放大取整，缺失为 None"""
+    fields = _fields(history)
+    result = {'count': len(history), 'scale': {name: SCALES[name] for name in fields},
+              'ts': _timestamps(history).tolist()}
+    for name in fields:
+        values = np.round(_column(history, name) * SCALES[name])
+        missing = np.isnan(values)
+        column = np.where(missing, 0, values).astype('int64').tolist()
+        for i in np.flatnonzero(missing):
+            column[i] = None
+        result[name] = column
+    return result
+
+
+def encode_binary(history, extra=None):
+    """字典列表 -> 二进制列式格式（见模块说明），extra 为写入头部的附加字段"""
+    arrays = [('ts', _timestamps(history).astype(DTYPES['ts']))]
+    for name in _fields(history):
+        dtype = DTYPES.get(name, FLOAT_DTYPE)
+        values = _column(history, name)
+        if dtype != FLOAT_DTYPE:
+            values = np.nan_to_num(values, nan=-1)
+        arrays.append((name, values.astype(dtype)))
+
+    def header(offset):
+        columns = []
+        for name, values in arrays:
+            columns.append({'name': name, 'type': TYPE_NAMES[values.dtype.str], 'offset': offset})
+            offset += values.nbytes
+        return json.dumps(dict(extra or {}, count=len(history), columns=columns), ensure_ascii=False).encode('utf-8')
+
+    # 头部长度影响各列的 offset，先按估计的长度生成一次，再按实际长度（对齐后）重算
+    size = len(header(0))
+    while True:
+        start = -(-(8 + size) // 8) * 8
+        head = header(start)
+        if len(head) <= start - 8:
+            break
+        size = len(head)
+    head = head.ljust(start - 8, b' ')
+    return b''.join([MAGIC, struct.pack('<I', len(head)), head] + [values.tobytes() for _, values in arrays])
+
+
+def decode_binary(data):
+    """encode_binary 的逆操作，返回 (头部 dict, {列名: numpy 数组})"""
+    if data[:4] != MAGIC:
+        raise ValueError("不是列式二进制数据")
+    size = struct.unpack_from('<I', data, 4)[0]
+    head = json.loads(data[8:8 + size].decode('utf-8'))
+    names = {name: dtype for dtype, name in TYPE_NAMES.items()}
+    columns = {c['name']: np.frombuffer(data, dtype=names[c['type']], count=head['count'], offset=c['offset'])
+               for c in head['columns']}
+    return head, columns
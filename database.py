@@ -6,154 +6,1021 @@
 import sqlite3
 import json
 import os
-from datetime import datetime
+import re
+import threading
+import time
+import math
+import weakref
+from datetime import datetime, timedelta
+
+from urllib.parse import quote
+
+import pandas as pd
 
 DB_FILE = 'precious_metals.db'
 
+# 连接调优参数（每个新连接打开时执行）
+CONNECTION_PRAGMAS = {
+    'synchronous': 'NORMAL',      # WAL模式下NORMAL即可保证一致性
+    'cache_size': -65536,         # 64MB页缓存（负数表示KB）
+    'mmap_size': 268435456,       # 256MB内存映射读取
+    'temp_store': 'MEMORY',
+}
+BUSY_TIMEOUT = 30                 # 等待写锁的秒数
+CACHED_STATEMENTS = 256           # 每个连接缓存的预编译语句数量
 
-def init_database():
-    """初始化数据库表结构"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # 创建铂金价差历史表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS platinum_spread (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            datetime TEXT NOT NULL,
-            gfex_price REAL,
-            cme_usd REAL,
-            cme_cny REAL,
-            spread REAL,
-            spread_pct REAL,
-            gfex_contract TEXT DEFAULT 'PT2610',
-            cme_contract TEXT DEFAULT 'PLV2026',
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(datetime)
-        )
-    ''')
-    
-    # 创建钯金价差历史表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS palladium_spread (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            datetime TEXT NOT NULL,
-            gfex_price REAL,
-            cme_usd REAL,
-            cme_cny REAL,
-            spread REAL,
-            spread_pct REAL,
-            gfex_contract TEXT DEFAULT 'PD2606',
-            cme_contract TEXT DEFAULT 'PAM2026',
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(datetime)
-        )
-    ''')
-    
-    # 创建价格快照表（用于实时价格记录）
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS price_snapshots (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            datetime TEXT NOT NULL,
-            pt_gfex REAL,
-            pt_cme_usd REAL,
-            pt_cme_cny REAL,
-            pt_spread REAL,
-            pt_spread_pct REAL,
-            pd_gfex REAL,
-            pd_cme_usd REAL,
-            pd_cme_cny REAL,
-            pd_spread REAL,
-            pd_spread_pct REAL,
-            exchange_rate REAL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+_local = threading.local()
 
-    # 广期所钯金各月份合约表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS gfex_palladium_contracts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            contract TEXT NOT NULL,
-            datetime TEXT NOT NULL,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            volume INTEGER,
-            hold INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(contract, datetime)
-        )
-    ''')
-    
-    # CME钯金各月份合约表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS cme_palladium_contracts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            contract TEXT NOT NULL,
-            datetime TEXT NOT NULL,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            volume INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(contract, datetime)
-        )
-    ''')
-    
-    # 铂金配对价差表 (所有GFEX vs CME配对)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS platinum_pairs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            pair_name TEXT NOT NULL,
-            gfex_contract TEXT NOT NULL,
-            cme_contract TEXT NOT NULL,
-            datetime TEXT NOT NULL,
-            gfex_price REAL,
-            cme_usd REAL,
-            cme_cny REAL,
-            spread REAL,
-            spread_pct REAL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(pair_name, datetime)
-        )
-    ''')
-    
-    # 钯金配对价差表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS palladium_pairs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            pair_name TEXT NOT NULL,
-            gfex_contract TEXT NOT NULL,
-            cme_contract TEXT NOT NULL,
-            datetime TEXT NOT NULL,
-            gfex_price REAL,
-            cme_usd REAL,
-            cme_cny REAL,
-            spread REAL,
-            spread_pct REAL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(pair_name, datetime)
-        )
-    ''')
-    
-    # 创建索引
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pt_datetime ON platinum_spread(datetime)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pd_datetime ON palladium_spread(datetime)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_datetime ON price_snapshots(datetime)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pt_pairs ON platinum_pairs(pair_name, datetime)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pd_pairs ON palladium_pairs(pair_name, datetime)')
-    
-    conn.commit()
+
+def _file_uri(path, **params):
+    """数据库文件的 URI 形式（只读/immutable 打开或 ATTACH 时使用）"""
+    uri = 'file:' + quote(os.path.abspath(path).replace('\\', '/'), safe='/:')
+    return uri + ('?' + '&'.join(f'{k}={v}' for k, v in params.items()) if params else '')
+
+
+def _open_connection(db_file, readonly, check_same_thread=True):
+    """打开一个新连接并设置WAL与调优参数（check_same_thread=False 的连接可以交给其他线程使用）"""
+    # 以 URI 方式打开，连接上的 ATTACH 才能使用 mode=ro/immutable 等 URI 参数
+    if readonly:
+        conn = sqlite3.connect(_file_uri(db_file, mode='ro'), uri=True, timeout=BUSY_TIMEOUT,
+                               cached_statements=CACHED_STATEMENTS, check_same_thread=check_same_thread)
+        conn.execute('PRAGMA query_only = ON')
+    else:
+        conn = sqlite3.connect(_file_uri(db_file), uri=True, timeout=BUSY_TIMEOUT,
+                               cached_statements=CACHED_STATEMENTS)
+        # journal_mode 是持久化到文件的，只需在可写连接上设置
+        conn.execute('PRAGMA journal_mode = WAL')
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def get_connection(readonly=False, db_file=None):
+    """
+    获取当前线程复用的数据库连接
+
+    每个线程对每个 (数据库文件, 只读/读写) 组合只保持一个连接，
+    调用方不要 close()，用 conn.commit() 或 `with conn:` 管理事务即可。
+    """
+    db_file = db_file or DB_FILE
+    conns = getattr(_local, 'connections', None)
+    if conns is None:
+        conns = _local.connections = {}
+
+    key = (os.path.abspath(db_file), readonly)
+    conn = conns.get(key)
+    if conn is None:
+        conn = _open_connection(db_file, readonly)
+        conns[key] = conn
+    return conn
+
+
+def get_readonly_connection(db_file=None):
+    """获取当前线程的只读连接（API等只读场景使用）"""
+    return get_connection(readonly=True, db_file=db_file)
+
+
+def close_connections():
+    """关闭当前线程持有的所有连接（借用的快照连接归还连接池）"""
+    lease = getattr(_local, 'snapshot_lease', None)
+    if lease is not None:
+        lease.release()
+        _local.snapshot_lease = None
+    conns = getattr(_local, 'connections', None) or {}
+    for conn in conns.values():
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    conns.clear()
+
+
+# 只读快照：写入方每个刷新周期用在线备份接口发布一份完整副本，
+# API 只读最新快照，永远不会和正在进行的批量写入争锁
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), 'snapshots')
+SNAPSHOT_POINTER = os.path.join(SNAPSHOT_DIR, 'CURRENT')
+SNAPSHOT_KEEP = 3                 # 保留的快照份数（旧快照可能仍被读线程使用）
+SNAPSHOT_MIN_INTERVAL = 60        # 两次发布快照的最短间隔（秒），每份快照都是整库复制
+
+_snapshot_reads = False
+_publish_lock = threading.Lock()
+_deferred_publish = None          # 等待补发快照的 threading.Timer
+
+
+def _snapshot_version(path):
+    """快照中记录的数据版本号，读不到时返回 None"""
+    try:
+        conn = sqlite3.connect(_file_uri(path, mode='ro'), uri=True)
+        try:
+            return get_data_version(conn)
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+def publish_snapshot(min_interval=SNAPSHOT_MIN_INTERVAL):
+    """
+    发布一份一致的只读快照并原子切换 CURRENT 指针，返回快照文件路径
+
+    备份在 WAL 模式下只占用读事务，不阻塞写入方；快照改为 DELETE 日志模式，
+    只读打开时不需要 -wal/-shm 文件。数据版本与当前快照相同时不复制，返回 None；
+    当前快照发布不到 min_interval 秒时也不立即复制，改为间隔满时在后台补发一次
+    （同一时间只排一个，见 snapshot_pending），返回 None。
+    """
+    global _deferred_publish
+    with _publish_lock:
+        current = current_snapshot()
+        if current is not None:
+            if _snapshot_version(current) == get_data_version(get_connection()):
+                return None
+            wait = min_interval - (time.time() - os.path.getmtime(current))
+            if wait > 0:
+                if _deferred_publish is None:
+                    _deferred_publish = threading.Timer(wait, _publish_deferred)
+                    _deferred_publish.daemon = True
+                    _deferred_publish.start()
+                return None
+        return _copy_snapshot()
+
+
+def _publish_deferred():
+    """补发被最短间隔推迟的快照（在定时器线程中执行）"""
+    global _deferred_publish
+    with _publish_lock:
+        _deferred_publish = None
+    try:
+        publish_snapshot(min_interval=0)
+    except Exception as e:
+        print(f"补发快照失败: {e}")
+    finally:
+        close_connections()
+
+
+def refresh_snapshot():
+    """开启快照读时发布主库的最新数据（同 publish_snapshot，太近时推迟），供发现外部写入的后台检查使用"""
+    if _snapshot_reads:
+        publish_snapshot()
+
+
+def snapshot_pending():
+    """是否有被最短间隔推迟、尚未补发的快照"""
+    return _deferred_publish is not None
+
+
+def _copy_snapshot():
+    """复制主库为新快照并切换 CURRENT 指针（调用方持有 _publish_lock）"""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    name = f'snapshot_{time.time_ns()}.db'
+    path = os.path.join(SNAPSHOT_DIR, name)
+
+    target = sqlite3.connect(path + '.tmp')
+    try:
+        get_connection().backup(target)
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+    os.replace(path + '.tmp', path)
+
+    with open(SNAPSHOT_POINTER + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(SNAPSHOT_POINTER + '.tmp', SNAPSHOT_POINTER)
+
+    # 清理更早的快照；仍被打开的文件在 Windows 上删不掉，留到下次再删
+    old = sorted(f for f in os.listdir(SNAPSHOT_DIR) if f.startswith('snapshot_') and f.endswith('.db'))
+    for f in old[:-SNAPSHOT_KEEP]:
+        try:
+            os.remove(os.path.join(SNAPSHOT_DIR, f))
+        except OSError:
+            pass
+    return path
+
+
+def current_snapshot():
+    """当前快照文件路径，尚未发布过快照时返回 None"""
+    try:
+        with open(SNAPSHOT_POINTER, 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(SNAPSHOT_DIR, name)
+    return path if name and os.path.exists(path) else None
+
+
+def enable_snapshot_reads(enabled=True):
+    """开启后本进程的查询函数改读最新快照（API 服务使用）"""
+    global _snapshot_reads
+    _snapshot_reads = enabled
+
+
+# 快照连接池：只保存当前快照的空闲连接。线程借用一个连接直到线程结束或快照切换，
+# 线程式服务器每个请求一个新线程，不必每次都重新打开连接、预热页缓存
+_snapshot_pool = {'path': None, 'idle': []}
+_snapshot_lock = threading.Lock()
+
+
+def _take_snapshot_connection(path):
+    """从连接池取一个指向 path 的连接；快照已切换时先关闭旧快照的空闲连接"""
+    with _snapshot_lock:
+        if _snapshot_pool['path'] != path:
+            stale, _snapshot_pool['idle'] = _snapshot_pool['idle'], []
+            _snapshot_pool['path'] = path
+        else:
+            stale = []
+            if _snapshot_pool['idle']:
+                return _snapshot_pool['idle'].pop()
+    for conn in stale:
+        conn.close()
+    return _open_connection(path, readonly=True, check_same_thread=False)
+
+
+def _return_snapshot_connection(path, conn):
+    """归还连接：仍是当前快照时放回连接池，否则关闭"""
+    with _snapshot_lock:
+        if _snapshot_pool['path'] == path:
+            _snapshot_pool['idle'].append(conn)
+            return
     conn.close()
+
+
+class _SnapshotLease:
+    """线程借用的快照连接；release() 或线程结束（线程局部变量被回收）时归还"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = _take_snapshot_connection(path)
+        self.release = weakref.finalize(self, _return_snapshot_connection, path, self.conn)
+
+
+def get_snapshot_connection():
+    """
+    当前线程指向最新快照的只读连接
+
+    每次调用检查 CURRENT 指针。连接从当前快照的连接池借用，同一线程内复用，
+    线程结束后归还给后续线程；发现新快照时归还旧连接并改借新快照的连接。
+    还没有快照时退回主库的只读连接。
+    """
+    path = current_snapshot()
+    if path is None:
+        return get_readonly_connection()
+
+    lease = getattr(_local, 'snapshot_lease', None)
+    if lease is None or lease.path != path:
+        if lease is not None:
+            lease.release()
+        lease = _local.snapshot_lease = _SnapshotLease(path)
+    return lease.conn
+
+
+def get_read_connection():
+    """查询函数使用的连接：开启快照读时为最新快照，否则为主库连接"""
+    return get_snapshot_connection() if _snapshot_reads else get_connection()
+
+
+def read_db_file():
+    """查询函数读取的数据库文件（供其他查询引擎挂载），与 get_read_connection 一致"""
+    return (current_snapshot() or DB_FILE) if _snapshot_reads else DB_FILE
+
+
+# 当前表结构版本 (记录在 PRAGMA user_version)
+#   0: datetime 为 TEXT（'%Y-%m-%d %H:%M' 与 '%Y-%m-%d %H:%M:%S' 混用）
+#   1: ts 为 UTC 秒级时间戳，datetime 为由 ts 生成的北京时间文本列
+#   2: 四张合约K线表合并为 bars + instruments，旧表名保留为兼容视图
+#   3: 新增 pair_latest，由写入路径维护每个配对的最新一条价差
+#   4: 新增 pair_rollups / bar_rollups (5m/1h/1d)，写入时增量更新受影响的桶
+#   5: 新增 pair_stats，写入时增量维护价差统计（全量及 1d/7d/30d 窗口）
+#   6: 新增 meta 表，data_version 随每次有变化的写入递增（读缓存据此失效）
+#   7: 配对价差表新增 version 列，记录该行最后一次写入时的 data_version（增量查询的游标）
+SCHEMA_VERSION = 7
+
+# 所有 datetime 文本都是北京时间 (UTC+8，无夏令时)
+BEIJING_OFFSET = 8 * 3600
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _datetime_text(fmt='%Y-%m-%d %H:%M'):
+    """由 ts 生成北京时间文本的列定义（兼容旧查询的 datetime 列）"""
+    return f"datetime TEXT GENERATED ALWAYS AS (strftime('{fmt}', ts, 'unixepoch', '+8 hours')) VIRTUAL"
+
+
+_SPREAD_COLUMNS = '''
+    gfex_price REAL,
+    cme_usd REAL,
+    cme_cny REAL,
+    spread REAL,
+    spread_pct REAL'''
+
+# 表名 -> 列定义
+TABLE_DEFINITIONS = {
+    # 铂金/钯金价差历史表
+    'platinum_spread': f'''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts INTEGER NOT NULL,
+        {_datetime_text()},{_SPREAD_COLUMNS},
+        gfex_contract TEXT DEFAULT 'PT2610',
+        cme_contract TEXT DEFAULT 'PLV2026',
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(ts)''',
+    'palladium_spread': f'''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts INTEGER NOT NULL,
+        {_datetime_text()},{_SPREAD_COLUMNS},
+        gfex_contract TEXT DEFAULT 'PD2606',
+        cme_contract TEXT DEFAULT 'PAM2026',
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(ts)''',
+    # 价格快照表（用于实时价格记录）
+    'price_snapshots': f'''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts INTEGER NOT NULL,
+        {_datetime_text('%Y-%m-%d %H:%M:%S')},
+        pt_gfex REAL,
+        pt_cme_usd REAL,
+        pt_cme_cny REAL,
+        pt_spread REAL,
+        pt_spread_pct REAL,
+        pd_gfex REAL,
+        pd_cme_usd REAL,
+        pd_cme_cny REAL,
+        pd_spread REAL,
+        pd_spread_pct REAL,
+        exchange_rate REAL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP''',
+    # 配对价差表 (所有GFEX vs CME配对)
+    'platinum_pairs': f'''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pair_name TEXT NOT NULL,
+        gfex_contract TEXT NOT NULL,
+        cme_contract TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        {_datetime_text()},{_SPREAD_COLUMNS},
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        version INTEGER NOT NULL DEFAULT 0,
+        UNIQUE(pair_name, ts)''',
+    'palladium_pairs': f'''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pair_name TEXT NOT NULL,
+        gfex_contract TEXT NOT NULL,
+        cme_contract TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        {_datetime_text()},{_SPREAD_COLUMNS},
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        version INTEGER NOT NULL DEFAULT 0,
+        UNIQUE(pair_name, ts)''',
+}
+
+# 合约维表：所有交易所/品种的合约统一编号
+TABLE_DEFINITIONS['instruments'] = '''
+        instrument_id INTEGER PRIMARY KEY,
+        symbol TEXT NOT NULL UNIQUE,
+        exchange TEXT NOT NULL,
+        metal TEXT NOT NULL'''
+
+# 统一K线表：(instrument_id, ts) 聚簇主键，单合约区间查询即一次B树范围扫描
+TABLE_DEFINITIONS['bars'] = '''
+        instrument_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        o REAL,
+        h REAL,
+        l REAL,
+        c REAL,
+        v INTEGER,
+        oi INTEGER,
+        PRIMARY KEY (instrument_id, ts)'''
+
+# 配对最新值表：每个配对一行，随 *_pairs 写入在同一事务内刷新
+TABLE_DEFINITIONS['pair_latest'] = f'''
+        metal TEXT NOT NULL,
+        pair_name TEXT NOT NULL,
+        gfex_contract TEXT NOT NULL,
+        cme_contract TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        {_datetime_text()},{_SPREAD_COLUMNS},
+        PRIMARY KEY (metal, pair_name)'''
+
+# 配对价差汇总：每个桶的 spread_pct 开高低收、和、平方和、条数，以及桶内最后一条的价格
+TABLE_DEFINITIONS['pair_rollups'] = '''
+        metal TEXT NOT NULL,
+        pair_name TEXT NOT NULL,
+        resolution TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        first_ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        sum REAL,
+        sumsq REAL,
+        count INTEGER,
+        gfex_price REAL,
+        cme_usd REAL,
+        cme_cny REAL,
+        spread REAL,
+        PRIMARY KEY (metal, pair_name, resolution, bucket)'''
+
+# 合约K线汇总
+TABLE_DEFINITIONS['bar_rollups'] = '''
+        instrument_id INTEGER NOT NULL,
+        resolution TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        first_ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        o REAL,
+        h REAL,
+        l REAL,
+        c REAL,
+        v INTEGER,
+        oi INTEGER,
+        count INTEGER,
+        PRIMARY KEY (instrument_id, resolution, bucket)'''
+
+# 价差统计：条数、和、平方和、极值，period 为 'all' 或窗口 '1d'/'7d'/'30d'
+TABLE_DEFINITIONS['pair_stats'] = '''
+        metal TEXT NOT NULL,
+        pair_name TEXT NOT NULL,
+        period TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        sum REAL NOT NULL,
+        sumsq REAL NOT NULL,
+        min REAL,
+        max REAL,
+        PRIMARY KEY (metal, pair_name, period)'''
+
+# 元数据键值表（data_version: 数据版本号，与数据在同一事务内递增）
+TABLE_DEFINITIONS['meta'] = '''
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL'''
+
+# 建表附加选项
+TABLE_OPTIONS = {
+    'bars': 'WITHOUT ROWID',
+    'pair_latest': 'WITHOUT ROWID',
+    'pair_rollups': 'WITHOUT ROWID',
+    'bar_rollups': 'WITHOUT ROWID',
+    'pair_stats': 'WITHOUT ROWID',
+    'meta': 'WITHOUT ROWID',
+}
+
+# 历史查询分辨率 -> 桶宽(秒)，桶边界按北京时间对齐
+RESOLUTIONS = {
+    '1m': 60,
+    '5m': 300,
+    '1h': 3600,
+    '1d': 86400,
+}
+
+HISTORY_AGGS = ('last', 'ohlc')
+
+
+# 汇总层级: (分辨率, 来源分辨率)，来源为 None 表示直接从原始数据汇总
+ROLLUP_LEVELS = [
+    ('5m', None),
+    ('1h', '5m'),
+    ('1d', '1h'),
+]
+
+
+def _bucket_expression(step, column='ts'):
+    """column 所在桶的起点（北京时间对齐后换回 UTC 时间戳）"""
+    return f'(({column} + {BEIJING_OFFSET}) / {step}) * {step} - {BEIJING_OFFSET}'
+
+
+def _bar_rollup_sql(resolution, source, instrument=':instrument_id', start=':start', end=':end'):
+    """
+    重算 [start, end) 内某一层级K线桶的语句
+
+    instrument/start/end 为 SQL 表达式：_rollup_bars 传命名参数，
+    兼容视图的触发器传由 NEW 算出的表达式。
+    """
+    step = RESOLUTIONS[resolution]
+    if source is None:
+        aggregate = f'''
+            SELECT {_bucket_expression(step)} AS bkt, MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+                   MAX(h) AS h, MIN(l) AS l, SUM(v) AS v, COUNT(*) AS count
+            FROM bars
+            WHERE instrument_id = {instrument} AND ts >= {start} AND ts < {end}
+            GROUP BY bkt'''
+    else:
+        aggregate = f'''
+            SELECT {_bucket_expression(step, 'bucket')} AS bkt, MIN(first_ts) AS first_ts,
+                   MAX(last_ts) AS last_ts, MAX(h) AS h, MIN(l) AS l, SUM(v) AS v, SUM(count) AS count
+            FROM bar_rollups
+            WHERE instrument_id = {instrument} AND resolution = '{source}' AND bucket >= {start} AND bucket < {end}
+            GROUP BY bkt'''
+    return f'''
+        INSERT OR REPLACE INTO bar_rollups
+        (instrument_id, resolution, bucket, first_ts, last_ts, o, h, l, c, v, oi, count)
+        SELECT {instrument}, '{resolution}', a.bkt, a.first_ts, a.last_ts, o.o, a.h, a.l, c.c, a.v, c.oi, a.count
+        FROM ({aggregate}) a
+        JOIN bars o ON o.instrument_id = {instrument} AND o.ts = a.first_ts
+        JOIN bars c ON c.instrument_id = {instrument} AND c.ts = a.last_ts
+    '''
+
+
+# 统计窗口 -> (使用的汇总分辨率, 窗口长度秒)
+STATS_WINDOWS = {
+    '1d': ('5m', 86400),
+    '7d': ('1h', 7 * 86400),
+    '30d': ('1h', 30 * 86400),
+}
+
+# pair_stats 中旧版单一价差表 (platinum_spread/palladium_spread) 使用的配对名
+SPREAD_SERIES = ''
+
+# 单点写入的K线列、配对价差行与旧版价差行的列（写入队列与批量写入共用）
+BAR_ROW_COLUMNS = ['ts', 'o', 'h', 'l', 'c', 'v']
+PAIR_ROW_COLUMNS = ['ts', 'gfex_contract', 'cme_contract', 'gfex_price', 'cme_usd', 'cme_cny', 'spread', 'spread_pct']
+SPREAD_ROW_COLUMNS = ['ts', 'gfex_price', 'cme_usd', 'cme_cny', 'spread', 'spread_pct']
+
+# 品种 -> 配对价差表
+PAIR_TABLES = {
+    'platinum': 'platinum_pairs',
+    'palladium': 'palladium_pairs',
+}
+
+# 合约代码前缀 -> (交易所, 品种)
+SYMBOL_PREFIXES = {
+    'PT': ('GFEX', 'platinum'),
+    'PD': ('GFEX', 'palladium'),
+    'PL': ('CME', 'platinum'),
+    'PA': ('CME', 'palladium'),
+}
+
+# 旧的分表K线表名，保留为 bars 上的兼容视图（只读查询与旧式 INSERT 均可用）
+LEGACY_BAR_TABLES = {
+    f'{exchange.lower()}_{metal}_contracts': (exchange, metal)
+    for exchange in ('GFEX', 'CME') for metal in ('platinum', 'palladium')
+}
+
+
+def _legacy_bar_view(table, exchange, metal):
+    """生成兼容视图及其 INSTEAD OF INSERT 触发器（写入后同 _store_bars 一样重算所在的汇总桶）"""
+    hold = ',\n            b.oi AS hold' if exchange == 'GFEX' else ''
+    new_hold = 'NEW.hold' if exchange == 'GFEX' else 'NULL'
+    instrument = '(SELECT instrument_id FROM instruments WHERE symbol = NEW.contract)'
+    ts = f"COALESCE(NEW.ts, CAST(strftime('%s', NEW.datetime) AS INTEGER) - {BEIJING_OFFSET})"
+    rollups = ';\n'.join(
+        _bar_rollup_sql(resolution, source, instrument,
+                        start=_bucket_expression(RESOLUTIONS[resolution], ts),
+                        end=f'{_bucket_expression(RESOLUTIONS[resolution], ts)} + {RESOLUTIONS[resolution]}')
+        for resolution, source in ROLLUP_LEVELS
+    )
+    return [f'''
+        CREATE VIEW IF NOT EXISTS {table} AS
+        SELECT i.symbol AS contract,
+            b.ts,
+            strftime('%Y-%m-%d %H:%M', b.ts, 'unixepoch', '+8 hours') AS datetime,
+            b.o AS open,
+            b.h AS high,
+            b.l AS low,
+            b.c AS close,
+            b.v AS volume{hold}
+        FROM instruments i JOIN bars b ON b.instrument_id = i.instrument_id
+        WHERE i.exchange = '{exchange}' AND i.metal = '{metal}'
+    ''', f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_insert INSTEAD OF INSERT ON {table}
+        BEGIN
+            INSERT OR IGNORE INTO instruments (symbol, exchange, metal)
+            VALUES (NEW.contract, '{exchange}', '{metal}');
+            INSERT OR REPLACE INTO bars (instrument_id, ts, o, h, l, c, v, oi)
+            VALUES ({instrument}, {ts}, NEW.open, NEW.high, NEW.low, NEW.close, NEW.volume, {new_hold});
+            {rollups};
+            UPDATE meta SET value = value + 1 WHERE key = 'data_version';
+        END
+    ''']
+
+
+VIEW_DEFINITIONS = [
+    sql for table, (exchange, metal) in LEGACY_BAR_TABLES.items()
+    for sql in _legacy_bar_view(table, exchange, metal)
+]
+
+# UNIQUE 约束已经提供 (key, ts) 索引，这里只补充没有唯一约束的表
+INDEX_DEFINITIONS = [
+    'CREATE INDEX IF NOT EXISTS idx_snapshot_ts ON price_snapshots(ts)',
+] + [f'CREATE INDEX IF NOT EXISTS idx_{table}_version ON {table}(version)' for table in PAIR_TABLES.values()]
+
+
+def to_epoch(value):
+    """
+    把北京时间转换为 UTC 秒级时间戳
+
+    接受 'YYYY-MM-DD HH:MM[:SS]' 字符串、datetime/Timestamp（无时区视为北京时间）
+    或已经是时间戳的整数。无法解析时返回 None。
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip().replace('/', '-'))
+        except ValueError:
+            return None
+    if value.tzinfo is not None:
+        return int(value.timestamp())
+    return int((value - _EPOCH).total_seconds()) - BEIJING_OFFSET
+
+
+def from_epoch(ts, fmt='%Y-%m-%d %H:%M'):
+    """把 UTC 秒级时间戳格式化为北京时间文本"""
+    if ts is None:
+        return None
+    return (_EPOCH + timedelta(seconds=ts + BEIJING_OFFSET)).strftime(fmt)
+
+
+def series_to_epoch(times):
+    """把北京时间的 DatetimeIndex/Series 向量化转换为 UTC 秒级时间戳列表"""
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None:
+        times = times.tz_convert('Asia/Shanghai').tz_localize(None)
+    seconds = (times - pd.Timestamp('1970-01-01')) // pd.Timedelta(seconds=1)
+    return (seconds - BEIJING_OFFSET).tolist()
+
+
+def day_range(day=None):
+    """返回北京时间某一天 [开始, 结束) 的时间戳区间，默认今天"""
+    day = day or datetime.now()
+    start = to_epoch(datetime(day.year, day.month, day.day))
+    return start, start + 86400
+
+
+# 年度分区：已结束年份的分钟级原始数据 (bars 与 *_pairs) 可由 partitions.py 移到
+# precious_metals_{年份}.db。分区写完后 VACUUM 一次并设为只读，查询时以 immutable
+# 方式按需 ATTACH（免锁、内存映射），只挂载与查询区间相交的年份。写入只落在主库，
+# 已移入分区（或冷数据归档）的时间段不再接受写入，见 cold_boundary。
+PARTITION_MMAP_SIZE = 268435456   # 每个分区的内存映射上限
+MAX_ATTACHED_PARTITIONS = 8       # SQLite 默认单连接最多 ATTACH 10 个库
+
+# (连接 id, 模式名) -> 挂载时分区文件的修改时间；快照连接会在线程间传递，不能按线程记录
+_partition_mtimes = {}
+
+
+def partition_path(year):
+    """某年分区文件路径（与主库同目录）"""
+    base, ext = os.path.splitext(DB_FILE)
+    return f'{base}_{year}{ext}'
+
+
+def year_range(year):
+    """北京时间某年 [开始, 结束) 的时间戳区间"""
+    return to_epoch(datetime(year, 1, 1)), to_epoch(datetime(year + 1, 1, 1))
+
+
+def partition_years(start_ts=None, end_ts=None):
+    """已存在且与 [start_ts, end_ts] 相交的分区年份，按新到旧排列"""
+    base, ext = os.path.splitext(os.path.abspath(DB_FILE))
+    folder, prefix = os.path.split(base)
+    pattern = re.compile(re.escape(prefix) + r'_(\d{4})' + re.escape(ext))
+    years = []
+    for name in os.listdir(folder):
+        match = pattern.fullmatch(name)
+        if not match:
+            continue
+        year = int(match.group(1))
+        first, last = year_range(year)
+        if (start_ts is None or last > start_ts) and (end_ts is None or first <= end_ts):
+            years.append(year)
+    return sorted(years, reverse=True)
+
+
+def attach_partitions(conn, start_ts=None, end_ts=None):
+    """
+    在连接上挂载与区间相交的年度分区，返回模式名列表（如 ['y2025', 'y2024']，新到旧）
+
+    已挂载的分区直接复用；挂载数接近上限时先卸下本次用不到的分区，
+    仍超出上限的更早年份本次不挂载。
+    """
+    years = partition_years(start_ts, end_ts)
+    if not years:
+        return []
+    wanted = [f'y{year}' for year in years]
+    attached = {r[1] for r in conn.execute('PRAGMA database_list') if re.fullmatch(r'y\d{4}', r[1])}
+
+    # immutable 挂载假定文件不变；分区被 partitions.py 重写过（修改时间变化）时重新挂载
+    for name in wanted:
+        mtime = os.stat(partition_path(int(name[1:]))).st_mtime_ns
+        if name in attached and _partition_mtimes.get((id(conn), name)) != mtime:
+            conn.execute(f'DETACH DATABASE {name}')
+            attached.discard(name)
+        _partition_mtimes[(id(conn), name)] = mtime
+
+    missing = [name for name in wanted if name not in attached]
+    if missing:
+        spare = [name for name in attached if name not in wanted]
+        while spare and len(attached) + len(missing) > MAX_ATTACHED_PARTITIONS:
+            name = spare.pop()
+            conn.execute(f'DETACH DATABASE {name}')
+            attached.discard(name)
+        for name in missing[:max(MAX_ATTACHED_PARTITIONS - len(attached), 0)]:
+            path = partition_path(int(name[1:]))
+            conn.execute('ATTACH DATABASE ? AS ' + name, (_file_uri(path, mode='ro', immutable=1),))
+            conn.execute(f'PRAGMA {name}.mmap_size = {PARTITION_MMAP_SIZE}')
+            attached.add(name)
+    return [name for name in wanted if name in attached]
+
+
+def cold_boundary(kind, metal, name):
+    """
+    序列已移出主库的时间上界（年度分区或冷数据归档），没有时返回 None
+
+    kind 为 'bars'（name 为合约代码）或 'pairs'（name 为配对名）。查询只在主库最早时间点
+    之前才读分区与归档、汇总与统计也按分区内数据算过，早于该上界的行再写进主库会遮住
+    冷数据并被重复统计，写入路径直接跳过这些行。
+    """
+    import archive
+    bounds = []
+    years = partition_years()
+    if years:
+        bounds.append(year_range(max(years))[1])
+    months = archive.archived_months(kind, metal, name)
+    if months:
+        bounds.append(archive.month_range(months[-1])[1])
+    return max(bounds) if bounds else None
+
+
+def _skip_cold_rows(rows, boundary):
+    """去掉时间早于 boundary 的行，返回 (保留的行, 跳过的行数)"""
+    if boundary is None:
+        return rows, 0
+    kept = [row for row in rows if row[0] >= boundary]
+    return kept, len(rows) - len(kept)
+
+
+def _upper_bound(end_ts, oldest):
+    """分段向前补数据时的区间上界：不超过 end_ts，且早于已取到的最早时间点"""
+    if oldest is None:
+        return end_ts
+    return oldest - 1 if end_ts is None else min(end_ts, oldest - 1)
+
+
+def _table_columns(conn, table):
+    return [r[1] for r in conn.execute(f'PRAGMA table_xinfo({table})')]
+
+
+def _create_tables(conn):
+    for table, columns in TABLE_DEFINITIONS.items():
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns}) {TABLE_OPTIONS.get(table, "")}')
+    for sql in INDEX_DEFINITIONS + VIEW_DEFINITIONS:
+        conn.execute(sql)
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+
+
+def _ts_expression(columns):
+    """旧表中时间列的取值表达式：已有 ts 直接用，否则从 datetime 文本换算"""
+    if 'ts' in columns:
+        return 'ts'
+    return f"CAST(strftime('%s', datetime) AS INTEGER) - {BEIJING_OFFSET}"
+
+
+def _is_table(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def _migrate_text_to_epoch(conn):
+    """版本0 -> 1: 按表重建，datetime 文本转换为 ts 时间戳（K线表在版本2中处理）"""
+    migrated = {}
+    for table, columns in TABLE_DEFINITIONS.items():
+        old_columns = _table_columns(conn, table)
+        if not old_columns or 'ts' in old_columns or not _is_table(conn, table):
+            continue
+
+        new_table = f'{table}__v1'
+        conn.execute(f'DROP TABLE IF EXISTS {new_table}')
+        conn.execute(f'CREATE TABLE {new_table} ({columns})')
+        new_columns = _table_columns(conn, new_table)
+        copy = [c for c in old_columns if c in new_columns and c not in ('ts', 'datetime')]
+        col_list = ', '.join(copy)
+
+        # strftime('%s') 把文本当作UTC解析，两种格式都能识别；同一时间点的重复行以后写入的为准
+        conn.execute(f'''
+            INSERT OR REPLACE INTO {new_table} ({col_list}, ts)
+            SELECT {col_list}, {_ts_expression(old_columns)}
+            FROM {table}
+            WHERE strftime('%s', datetime) IS NOT NULL
+            ORDER BY id
+        ''')
+        before = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        after = conn.execute(f'SELECT COUNT(*) FROM {new_table}').fetchone()[0]
+
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {new_table} RENAME TO {table}')
+        migrated[table] = (before, after)
+
+    # 旧的 datetime 索引随旧表一起删除
+    return migrated
+
+
+def _migrate_unified_bars(conn):
+    """版本1 -> 2: 四张合约表的数据并入 bars，旧表替换为兼容视图"""
+    total = 0
+    conn.execute(f"CREATE TABLE IF NOT EXISTS instruments ({TABLE_DEFINITIONS['instruments']})")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS bars ({TABLE_DEFINITIONS['bars']}) WITHOUT ROWID")
+
+    for table, (exchange, metal) in LEGACY_BAR_TABLES.items():
+        if not _is_table(conn, table):
+            continue
+        old_columns = _table_columns(conn, table)
+
+        # 合约归属按代码前缀判断，修正历史上写错表的数据（如钯金CME写进了铂金表）
+        for (symbol,) in conn.execute(f'SELECT DISTINCT contract FROM {table}').fetchall():
+            get_instrument_id(symbol, conn, default=(exchange, metal))
+
+        hold = 'hold' if 'hold' in old_columns else 'NULL'
+        conn.execute(f'''
+            INSERT OR REPLACE INTO bars (instrument_id, ts, o, h, l, c, v, oi)
+            SELECT i.instrument_id, t.ts, t.open, t.high, t.low, t.close, t.volume, t.hold
+            FROM (
+                SELECT contract, {_ts_expression(old_columns)} AS ts,
+                       open, high, low, close, volume, {hold} AS hold
+                FROM {table} ORDER BY id
+            ) t
+            JOIN instruments i ON i.symbol = t.contract
+            WHERE t.ts IS NOT NULL
+        ''')
+        total += conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        conn.execute(f'DROP TABLE {table}')
+
+    return {'bars': (total, conn.execute('SELECT COUNT(*) FROM bars').fetchone()[0])}
+
+
+def _migrate_pair_latest(conn):
+    """版本2 -> 3: 建立 pair_latest 并用现有配对数据回填"""
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS pair_latest ({TABLE_DEFINITIONS['pair_latest']}) WITHOUT ROWID"
+    )
+    for metal, table in PAIR_TABLES.items():
+        if not _is_table(conn, table):
+            continue
+        conn.execute(f'''
+            INSERT OR REPLACE INTO pair_latest
+            (metal, pair_name, gfex_contract, cme_contract, ts, gfex_price, cme_usd, cme_cny, spread, spread_pct)
+            SELECT ?, pair_name, gfex_contract, cme_contract, ts, gfex_price, cme_usd, cme_cny, spread, spread_pct
+            FROM {table}
+            WHERE (pair_name, ts) IN (
+                SELECT pair_name, MAX(ts) FROM {table} GROUP BY pair_name
+            )
+        ''', (metal,))
+    return {'pair_latest': (0, conn.execute('SELECT COUNT(*) FROM pair_latest').fetchone()[0])}
+
+
+def _migrate_rollups(conn):
+    """版本3 -> 4: 建立汇总表并按现有数据全量回填；兼容视图的写入触发器重建为同时重算汇总"""
+    for table in ('pair_rollups', 'bar_rollups'):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({TABLE_DEFINITIONS[table]}) WITHOUT ROWID")
+    for table in LEGACY_BAR_TABLES:
+        conn.execute(f'DROP TRIGGER IF EXISTS {table}_insert')
+
+    step = RESOLUTIONS[ROLLUP_LEVELS[0][0]]
+    for metal, table in PAIR_TABLES.items():
+        if not _is_table(conn, table):
+            continue
+        spans = conn.execute(f'SELECT pair_name, MIN(ts), MAX(ts) FROM {table} GROUP BY pair_name').fetchall()
+        for pair_name, first, last in spans:
+            _rollup_pairs(conn, metal, pair_name, range(first, last + step, step))
+
+    spans = conn.execute('SELECT instrument_id, MIN(ts), MAX(ts) FROM bars GROUP BY instrument_id').fetchall()
+    for instrument_id, first, last in spans:
+        _rollup_bars(conn, instrument_id, range(first, last + step, step))
+
+    return {table: (0, conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0])
+            for table in ('pair_rollups', 'bar_rollups')}
+
+
+def _migrate_pair_stats(conn):
+    """版本4 -> 5: 建立 pair_stats，全量统计由日汇总回填，窗口统计按汇总重算"""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS pair_stats ({TABLE_DEFINITIONS['pair_stats']}) WITHOUT ROWID")
+    _rebuild_pair_stats(conn)
+    for metal in PAIR_TABLES:
+        if _is_table(conn, 'platinum_spread' if metal == 'platinum' else 'palladium_spread'):
+            _rebuild_spread_stats(conn, metal)
+    return {'pair_stats': (0, conn.execute('SELECT COUNT(*) FROM pair_stats').fetchone()[0])}
+
+
+def _rebuild_pair_stats(conn):
+    """由日汇总重算所有配对的全量统计，并按汇总重算窗口统计（调用方负责事务）"""
+    conn.execute('''
+        INSERT OR REPLACE INTO pair_stats (metal, pair_name, period, count, sum, sumsq, min, max)
+        SELECT metal, pair_name, 'all', SUM(count), SUM(sum), SUM(sumsq), MIN(low), MAX(high)
+        FROM pair_rollups WHERE resolution = '1d'
+        GROUP BY metal, pair_name
+    ''')
+    for metal, pair_name in conn.execute('SELECT metal, pair_name FROM pair_latest').fetchall():
+        _refresh_stat_windows(conn, metal, pair_name)
+
+
+def _migrate_meta(conn):
+    """版本5 -> 6: 建立 meta 表；兼容视图的写入触发器重建为同时递增数据版本"""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS meta ({TABLE_DEFINITIONS['meta']}) WITHOUT ROWID")
+    for table in LEGACY_BAR_TABLES:
+        conn.execute(f'DROP TRIGGER IF EXISTS {table}_insert')
+
+
+def _migrate_pair_version(conn):
+    """版本6 -> 7: 配对价差表增加 version 列，已有的行记为 0（早于任何游标）"""
+    for table in PAIR_TABLES.values():
+        if _is_table(conn, table) and 'version' not in _table_columns(conn, table):
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+
+# 版本号 -> 升级到该版本的迁移函数
+MIGRATIONS = {
+    1: _migrate_text_to_epoch,
+    2: _migrate_unified_bars,
+    3: _migrate_pair_latest,
+    4: _migrate_rollups,
+    5: _migrate_pair_stats,
+    6: _migrate_meta,
+    7: _migrate_pair_version,
+}
+
+
+def get_schema_version(conn=None):
+    conn = conn or get_connection()
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate_database():
+    """
+    把数据库就地升级到 SCHEMA_VERSION
+
+    全部迁移在一个事务中完成，失败时自动回滚。返回 {表名: (迁移前行数, 迁移后行数)}。
+    """
+    conn = get_connection()
+    version = get_schema_version(conn)
+    report = {}
+    if version >= SCHEMA_VERSION:
+        return report
+
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            report.update(MIGRATIONS[target](conn) or {})
+        _create_tables(conn)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return report
+
+
+def init_database():
+    """初始化数据库表结构（旧版本数据库会先就地迁移）"""
+    conn = get_connection()
+    legacy = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchone()[0]
+
+    if legacy and get_schema_version(conn) < SCHEMA_VERSION:
+        print(f"检测到旧版本表结构，正在迁移到版本 {SCHEMA_VERSION}...")
+        migrate_database()
+    else:
+        with conn:
+            _create_tables(conn)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     print(f"✓ 数据库初始化完成: {DB_FILE}")
 
 
+_instrument_ids = {}
+
+
+def instrument_info(symbol):
+    """根据合约代码前缀判断 (交易所, 品种)，未知前缀返回 None"""
+    return SYMBOL_PREFIXES.get(symbol[:2].upper())
+
+
+def get_instrument_id(symbol, conn=None, default=None):
+    """
+    取合约在 instruments 表中的编号，不存在时自动登记
+
+    交易所/品种优先按代码前缀判断，无法判断时使用 default=(exchange, metal)。
+    编号一经分配不会改变，进程内缓存。
+    """
+    instrument_id = _instrument_ids.get(symbol)
+    if instrument_id is not None:
+        return instrument_id
+
+    info = instrument_info(symbol) or default
+    if info is None:
+        raise ValueError(f"无法识别合约 {symbol} 的交易所/品种")
+
+    conn = conn or get_connection()
+    created = conn.execute(
+        'INSERT OR IGNORE INTO instruments (symbol, exchange, metal) VALUES (?, ?, ?)',
+        (symbol,) + tuple(info)
+    ).rowcount
+    instrument_id = conn.execute(
+        'SELECT instrument_id FROM instruments WHERE symbol = ?', (symbol,)
+    ).fetchone()[0]
+    # 本次新登记的编号所在事务可能回滚，等下次查到已存在时再缓存
+    if not created:
+        _instrument_ids[symbol] = instrument_id
+    return instrument_id
+
+
 def import_json_data():
     """导入现有JSON数据到数据库"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # 导入铂金数据
@@ -166,10 +1033,10 @@ def import_json_data():
             try:
                 cursor.execute('''
                     INSERT OR IGNORE INTO platinum_spread 
-                    (datetime, gfex_price, cme_cny, spread, spread_pct)
+                    (ts, gfex_price, cme_cny, spread, spread_pct)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (
-                    item.get('date', item.get('datetime')),
+                    to_epoch(item.get('date', item.get('datetime'))),
                     item.get('gfex_price', item.get('sge_price')),
                     item.get('cme_cny'),
                     item.get('spread', item.get('spread_sge')),
@@ -179,6 +1046,8 @@ def import_json_data():
             except Exception as e:
                 pass
         
+        _rebuild_spread_stats(conn, 'platinum')
+        bump_data_version(conn)
         conn.commit()
         print(f"✓ 铂金数据导入: {count} 条记录")
     
@@ -192,10 +1061,10 @@ def import_json_data():
             try:
                 cursor.execute('''
                     INSERT OR IGNORE INTO palladium_spread 
-                    (datetime, gfex_price, cme_cny, spread, spread_pct)
+                    (ts, gfex_price, cme_cny, spread, spread_pct)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (
-                    item.get('date', item.get('datetime')),
+                    to_epoch(item.get('date', item.get('datetime'))),
                     item.get('gfex_price', item.get('sge_price')),
                     item.get('cme_cny'),
                     item.get('spread', item.get('spread_sge')),
@@ -205,55 +1074,31 @@ def import_json_data():
             except Exception as e:
                 pass
         
+        _rebuild_spread_stats(conn, 'palladium')
+        bump_data_version(conn)
         conn.commit()
         print(f"✓ 钯金数据导入: {count} 条记录")
-    
-    conn.close()
 
 
 def save_spread_data(metal, datetime_str, gfex_price, cme_usd, cme_cny, spread, spread_pct):
-    """保存单条价差数据"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    table = 'platinum_spread' if metal == 'platinum' else 'palladium_spread'
-    
-    cursor.execute(f'''
-        INSERT OR REPLACE INTO {table} 
-        (datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (datetime_str, gfex_price, cme_usd, cme_cny, spread, spread_pct))
-    
-    conn.commit()
-    conn.close()
+    """保存单条价差数据，返回实际变化的行数（0 表示与库中相同）"""
+    conn = get_connection()
+    with conn:
+        inserted, updated, _ = _store_spreads(
+            conn, metal, [(to_epoch(datetime_str), gfex_price, cme_usd, cme_cny, spread, spread_pct)])
+    return inserted + updated
 
 
 def save_price_snapshot(pt_data, pd_data, exchange_rate):
     """保存价格快照"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO price_snapshots 
-        (datetime, pt_gfex, pt_cme_usd, pt_cme_cny, pt_spread, pt_spread_pct,
-         pd_gfex, pd_cme_usd, pd_cme_cny, pd_spread, pd_spread_pct, exchange_rate)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        pt_data.get('gfex_price'), pt_data.get('cme_usd'), pt_data.get('cme_cny'),
-        pt_data.get('spread'), pt_data.get('spread_pct'),
-        pd_data.get('gfex_price'), pd_data.get('cme_usd'), pd_data.get('cme_cny'),
-        pd_data.get('spread'), pd_data.get('spread_pct'),
-        exchange_rate
-    ))
-    
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        _store_snapshots(conn, [snapshot_row(pt_data, pd_data, exchange_rate)])
 
 
 def get_spread_history(metal, days=30):
     """获取历史价差数据"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     table = 'platinum_spread' if metal == 'platinum' else 'palladium_spread'
@@ -261,106 +1106,714 @@ def get_spread_history(metal, days=30):
     cursor.execute(f'''
         SELECT datetime, gfex_price, cme_cny, spread, spread_pct
         FROM {table}
-        ORDER BY datetime DESC
-        LIMIT ?
-    ''', (days * 24,))  # 假设每小时一条
+        WHERE ts >= ?
+        ORDER BY ts DESC
+    ''', (int(time.time()) - days * 86400,))
     
     rows = cursor.fetchall()
-    conn.close()
     
     return [{'datetime': r[0], 'gfex_price': r[1], 'cme_cny': r[2], 
              'spread': r[3], 'spread_pct': r[4]} for r in rows]
 
 
+def _rebuild_spread_stats(conn, metal):
+    """按旧版价差表全表重算其全量统计（批量导入后使用）"""
+    table = 'platinum_spread' if metal == 'platinum' else 'palladium_spread'
+    conn.execute(f'''
+        INSERT OR REPLACE INTO pair_stats (metal, pair_name, period, count, sum, sumsq, min, max)
+        SELECT ?, ?, 'all', COUNT(spread_pct), COALESCE(SUM(spread_pct), 0),
+               COALESCE(SUM(spread_pct * spread_pct), 0), MIN(spread_pct), MAX(spread_pct)
+        FROM {table}
+    ''', (metal, SPREAD_SERIES))
+
+
+def get_pair_stats(metal, pair_name, period='all'):
+    """
+    读取配对价差统计（写入时维护，无需扫描历史）
+
+    period 为 'all'/'1d'/'7d'/'30d'。返回 {'count', 'avg_spread_pct', 'max_spread_pct',
+    'min_spread_pct', 'std_spread_pct'}，无数据时返回 None。
+    """
+    row = get_read_connection().execute('''
+        SELECT count, sum, sumsq, min, max FROM pair_stats
+        WHERE metal = ? AND pair_name = ? AND period = ?
+    ''', (metal, pair_name, period)).fetchone()
+    if row is None or not row[0]:
+        return None
+    count, total, sumsq, low, high = row
+    mean = total / count
+    return {
+        'count': count,
+        'avg_spread_pct': mean,
+        'max_spread_pct': high,
+        'min_spread_pct': low,
+        'std_spread_pct': math.sqrt(max(sumsq / count - mean * mean, 0.0)),
+    }
+
+
+# *_all_pairs.json 与 /api/pairs 中配对 stats 的字段（页面只读这三项）
+PAIR_JSON_STATS = ('avg_spread_pct', 'max_spread_pct', 'min_spread_pct')
+
+
+def get_pair_json_stats(metal, pair_name):
+    """配对 JSON 中的 stats：全量统计的 PAIR_JSON_STATS 三项，无数据时返回 None"""
+    stats = get_pair_stats(metal, pair_name)
+    return {k: stats[k] for k in PAIR_JSON_STATS} if stats else None
+
+
 def get_statistics(metal):
     """获取统计数据"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     table = 'platinum_spread' if metal == 'platinum' else 'palladium_spread'
     
-    cursor.execute(f'''
-        SELECT 
-            COUNT(*) as total,
-            AVG(spread_pct) as avg,
-            MAX(spread_pct) as max,
-            MIN(spread_pct) as min,
-            (SELECT spread_pct FROM {table} ORDER BY datetime DESC LIMIT 1) as current
-        FROM {table}
-    ''')
-    
+    # 汇总值取自 pair_stats，最新值走 ts 唯一索引
+    stats = get_pair_stats(metal, SPREAD_SERIES) or {}
+    cursor.execute(f'SELECT spread_pct FROM {table} ORDER BY ts DESC LIMIT 1')
     row = cursor.fetchone()
-    conn.close()
     
     return {
-        'total_records': row[0],
-        'avg_spread_pct': row[1],
-        'max_spread_pct': row[2],
-        'min_spread_pct': row[3],
-        'current_spread_pct': row[4]
+        'total_records': stats.get('count', 0),
+        'avg_spread_pct': stats.get('avg_spread_pct'),
+        'max_spread_pct': stats.get('max_spread_pct'),
+        'min_spread_pct': stats.get('min_spread_pct'),
+        'current_spread_pct': row[0] if row else None
     }
 
 
 def save_pair_data(metal, pair_name, gfex_contract, cme_contract, datetime_str, 
                    gfex_price, cme_usd, cme_cny, spread, spread_pct):
-    """保存单条配对价差数据"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    table = 'platinum_pairs' if metal == 'platinum' else 'palladium_pairs'
-    
-    cursor.execute(f'''
-        INSERT OR REPLACE INTO {table} 
-        (pair_name, gfex_contract, cme_contract, datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (pair_name, gfex_contract, cme_contract, datetime_str, gfex_price, cme_usd, cme_cny, spread, spread_pct))
-    
-    conn.commit()
-    conn.close()
+    """保存单条配对价差数据，返回实际变化的行数（0 表示与库中相同）"""
+    conn = get_connection()
+    with conn:
+        inserted, updated, _ = _store_pairs(conn, metal, pair_name, [(to_epoch(datetime_str), gfex_contract, cme_contract,
+                                                                     gfex_price, cme_usd, cme_cny, spread, spread_pct)])
+    return inserted + updated
+
+
+def _refresh_pair_latest(conn, metal, pair_name):
+    """
+    用配对表中该配对时间最新的一行覆盖 pair_latest
+
+    走 (pair_name, ts) 唯一索引倒序取一行，代价与表大小无关；调用方负责事务。
+    """
+    conn.execute(f'''
+        INSERT OR REPLACE INTO pair_latest
+        (metal, pair_name, gfex_contract, cme_contract, ts, gfex_price, cme_usd, cme_cny, spread, spread_pct)
+        SELECT ?, pair_name, gfex_contract, cme_contract, ts, gfex_price, cme_usd, cme_cny, spread, spread_pct
+        FROM {PAIR_TABLES[metal]}
+        WHERE pair_name = ?
+        ORDER BY ts DESC
+        LIMIT 1
+    ''', (metal, pair_name))
+
+
+def _bucket_runs(stamps, step):
+    """把写入的时间点归并为若干段连续的桶区间 [start, end)"""
+    runs = []
+    for bucket in sorted({((ts + BEIJING_OFFSET) // step) * step - BEIJING_OFFSET for ts in stamps}):
+        if runs and runs[-1][1] == bucket:
+            runs[-1][1] = bucket + step
+        else:
+            runs.append([bucket, bucket + step])
+    return runs
+
+
+def _rollup_pairs(conn, metal, pair_name, stamps):
+    """
+    重算 stamps 所在的 5m/1h/1d 桶
+
+    5m 桶从原始分钟数据汇总，更高层级从下一层汇总结果合并，
+    开盘/收盘按桶内首末时间点回原表取值。调用方负责事务。
+    """
+    table = PAIR_TABLES[metal]
+    for resolution, source in ROLLUP_LEVELS:
+        step = RESOLUTIONS[resolution]
+        if source is None:
+            aggregate = f'''
+                SELECT {_bucket_expression(step)} AS bkt, MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+                       MAX(spread_pct) AS high, MIN(spread_pct) AS low, SUM(spread_pct) AS sum,
+                       SUM(spread_pct * spread_pct) AS sumsq, COUNT(spread_pct) AS count
+                FROM {table}
+                WHERE pair_name = ? AND ts >= ? AND ts < ?
+                GROUP BY bkt'''
+            key = (pair_name,)
+        else:
+            aggregate = f'''
+                SELECT {_bucket_expression(step, 'bucket')} AS bkt, MIN(first_ts) AS first_ts,
+                       MAX(last_ts) AS last_ts, MAX(high) AS high, MIN(low) AS low,
+                       SUM(sum) AS sum, SUM(sumsq) AS sumsq, SUM(count) AS count
+                FROM pair_rollups
+                WHERE metal = ? AND pair_name = ? AND resolution = '{source}'
+                  AND bucket >= ? AND bucket < ?
+                GROUP BY bkt'''
+            key = (metal, pair_name)
+
+        for start, end in _bucket_runs(stamps, step):
+            conn.execute(f'''
+                INSERT OR REPLACE INTO pair_rollups
+                (metal, pair_name, resolution, bucket, first_ts, last_ts, open, high, low, close,
+                 sum, sumsq, count, gfex_price, cme_usd, cme_cny, spread)
+                SELECT ?, ?, ?, a.bkt, a.first_ts, a.last_ts, o.spread_pct, a.high, a.low, c.spread_pct,
+                       a.sum, a.sumsq, a.count, c.gfex_price, c.cme_usd, c.cme_cny, c.spread
+                FROM ({aggregate}) a
+                JOIN {table} o ON o.pair_name = ? AND o.ts = a.first_ts
+                JOIN {table} c ON c.pair_name = ? AND c.ts = a.last_ts
+            ''', (metal, pair_name, resolution) + key + (start, end, pair_name, pair_name))
+
+
+def _rollup_bars(conn, instrument_id, stamps):
+    """重算单个合约 stamps 所在的 5m/1h/1d K线桶，做法同 _rollup_pairs"""
+    for resolution, source in ROLLUP_LEVELS:
+        sql = _bar_rollup_sql(resolution, source)
+        for start, end in _bucket_runs(stamps, RESOLUTIONS[resolution]):
+            conn.execute(sql, {'instrument_id': instrument_id, 'start': start, 'end': end})
+
+
+def _update_stats(conn, metal, series, added, removed):
+    """
+    增量更新全量统计 (period='all')
+
+    加上新写入的 spread_pct，减去被覆盖的旧值；被覆盖的旧值触及当前
+    最小/最大值时，极值改为从日汇总（旧版价差表为原表）重算。调用方负责事务。
+    """
+    added = [v for v in added if _is_number(v)]
+    removed = [v for v in removed if _is_number(v)]
+    row = conn.execute(
+        "SELECT count, sum, sumsq, min, max FROM pair_stats WHERE metal = ? AND pair_name = ? AND period = 'all'",
+        (metal, series)
+    ).fetchone()
+    count, total, sumsq, low, high = row or (0, 0.0, 0.0, None, None)
+
+    count += len(added) - len(removed)
+    total += sum(added) - sum(removed)
+    sumsq += sum(v * v for v in added) - sum(v * v for v in removed)
+    if count <= 0:
+        count, total, sumsq = 0, 0.0, 0.0
+
+    if removed and low is not None and (min(removed) <= low or max(removed) >= high):
+        low, high = _stats_extremes(conn, metal, series)
+    else:
+        values = added + ([low, high] if low is not None else [])
+        low, high = (min(values), max(values)) if values else (None, None)
+
+    conn.execute('''
+        INSERT OR REPLACE INTO pair_stats (metal, pair_name, period, count, sum, sumsq, min, max)
+        VALUES (?, ?, 'all', ?, ?, ?, ?, ?)
+    ''', (metal, series, count, total, sumsq, low, high))
+
+
+def _stats_extremes(conn, metal, series):
+    if series == SPREAD_SERIES:
+        table = 'platinum_spread' if metal == 'platinum' else 'palladium_spread'
+        return conn.execute(f'SELECT MIN(spread_pct), MAX(spread_pct) FROM {table}').fetchone()
+    return conn.execute('''
+        SELECT MIN(low), MAX(high) FROM pair_rollups
+        WHERE metal = ? AND pair_name = ? AND resolution = '1d'
+    ''', (metal, series)).fetchone()
+
+
+def _refresh_stat_windows(conn, metal, pair_name):
+    """
+    按汇总表重算 1d/7d/30d 窗口统计
+
+    窗口截止于该配对最新一条数据，起点对齐到所用汇总桶的边界
+    （1d 用 5m 桶，7d/30d 用 1h 桶），每次只读几百行汇总。
+    """
+    for period, (resolution, span) in STATS_WINDOWS.items():
+        conn.execute('''
+            INSERT OR REPLACE INTO pair_stats (metal, pair_name, period, count, sum, sumsq, min, max)
+            SELECT ?, ?, ?, COALESCE(SUM(count), 0), COALESCE(SUM(sum), 0), COALESCE(SUM(sumsq), 0),
+                   MIN(low), MAX(high)
+            FROM pair_rollups
+            WHERE metal = ? AND pair_name = ? AND resolution = ?
+              AND bucket > (SELECT ts FROM pair_latest WHERE metal = ? AND pair_name = ?) - ?
+        ''', (metal, pair_name, period, metal, pair_name, resolution, metal, pair_name, span))
+
+
+def _after_pair_write(conn, metal, pair_name, stamps, added=(), removed=()):
+    """配对数据写入后在同一事务内维护派生表：最新值、各级汇总与统计"""
+    _refresh_pair_latest(conn, metal, pair_name)
+    _rollup_pairs(conn, metal, pair_name, stamps)
+    _update_stats(conn, metal, pair_name, added, removed)
+    _refresh_stat_windows(conn, metal, pair_name)
+
+
+def bump_data_version(conn):
+    """数据版本号加一（与数据写入在同一事务内，调用方负责事务）"""
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+
+
+def _begin_write(conn):
+    """
+    尚未开始事务时立即取得写锁 (BEGIN IMMEDIATE)
+
+    sqlite3 模块要到第一条 INSERT/UPDATE 才发出 BEGIN，之前的读取（高水位预过滤、
+    data_version）不在事务内，其他进程可能在读取与写入之间提交。先取写锁，
+    之后读到的就是提交时的状态。已在事务中时不做任何事。
+    """
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+
+def _next_data_version(conn):
+    """本次写入提交后的数据版本号（必须在 _begin_write 之后读取，调用方随后 bump_data_version）"""
+    return get_data_version(conn) + 1
+
+
+def get_data_version(conn=None):
+    """当前读取到的数据版本号（开启快照读时为快照的版本），数据有任何变化后必然增大"""
+    conn = conn or get_read_connection()
+    row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+    return row[0] if row else 0
+
+
+def _is_number(value):
+    """判断是否为有限数值（过滤 None / NaN / inf）"""
+    return value is not None and isinstance(value, (int, float)) and math.isfinite(value)
+
+
+def _write_rows(conn, table, key_col, key, columns, rows, conflict='REPLACE', track=(), stamp=None):
+    """
+    在调用方的事务内写入 (key_col, *columns) 行，只写真正有变化的行
+
+    rows 的第一列必须是 ts 时间戳，同一批内重复的时间点以最后一条为准。
+    该序列高水位（已有的最大 ts）之后的行一定是新增，不用比对；其余时间点用一次
+    范围查询取出现值逐列比较，完全相同的跳过。写入走 UPSERT（ON CONFLICT DO UPDATE），
+    已有行就地更新，不会像 INSERT OR REPLACE 那样删除重插、重新分配 id 并重写全部索引项。
+    conflict='IGNORE' 时已存在的时间点一律保留原值。key_col 为 None 表示整表只有一个序列。
+    stamp=(列名, 值) 时写入的行同时把该列设为该值（不参与比较），如配对价差表的 version。
+    返回 (written, replaced, unchanged)：written 为实际写入的行，
+    replaced 为 {ts: 被更新行的 track 列旧值}，unchanged 为跳过的行数（含批内被覆盖的重复行）。
+    """
+    unique, total = {}, 0
+    for row in rows:
+        unique[row[0]] = row
+        total += 1
+    if not unique:
+        return [], {}, 0
+
+    keys, params = ([key_col], [key]) if key_col else ([], [])
+    scope = ''.join(f'{col} = ? AND ' for col in keys)
+    high = conn.execute(f'SELECT MAX(ts) FROM {table} WHERE {scope}1', params).fetchone()[0]
+
+    times = list(unique)
+    existing = {}
+    if high is not None and min(times) <= high:
+        existing = {r[0]: r for r in conn.execute(f'''
+            SELECT {', '.join(columns)} FROM {table}
+            WHERE {scope}ts BETWEEN ? AND ?
+        ''', params + [min(times), min(max(times), high)])}
+
+    written, replaced = [], {}
+    for ts, row in unique.items():
+        old = existing.get(ts)
+        if old is None:
+            written.append(row)
+        elif conflict != 'IGNORE' and old != tuple(row):
+            written.append(row)
+            replaced[ts] = tuple(old[columns.index(col)] for col in track)
+    if not written:
+        return [], {}, total
+
+    values = columns[1:]
+    stamped = [stamp[0]] if stamp else []
+    if conflict == 'IGNORE':
+        action = 'NOTHING'
+    else:
+        action = 'UPDATE SET {} WHERE {}'.format(
+            ', '.join(f'{col} = excluded.{col}' for col in list(values) + stamped),
+            ' OR '.join(f'{col} IS NOT excluded.{col}' for col in values),
+        )
+    extra = (stamp[1],) if stamp else ()
+    conn.executemany(f'''
+        INSERT INTO {table} ({', '.join(keys + list(columns) + stamped)})
+        VALUES ({', '.join('?' * (len(keys) + len(columns) + len(stamped)))})
+        ON CONFLICT ({', '.join(keys + ['ts'])}) DO {action}
+    ''', [tuple(params) + tuple(row) + extra for row in written])
+    return written, replaced, total - len(written)
+
+
+def _store_bars(conn, instrument_id, columns, rows):
+    """
+    写入一个合约的K线并更新汇总，返回 (inserted, updated, unchanged)。调用方负责事务
+
+    已移入分区或归档的时间段（cold_boundary 之前）的行不写入，计入 unchanged。
+    """
+    symbol, metal = conn.execute('SELECT symbol, metal FROM instruments WHERE instrument_id = ?',
+                                 (instrument_id,)).fetchone()
+    rows, cold = _skip_cold_rows(list(rows), cold_boundary('bars', metal, symbol))
+    _begin_write(conn)
+    written, replaced, unchanged = _write_rows(conn, 'bars', 'instrument_id', instrument_id, columns, rows)
+    if written:
+        _rollup_bars(conn, instrument_id, [row[0] for row in written])
+        bump_data_version(conn)
+    return len(written) - len(replaced), len(replaced), unchanged + cold
+
+
+def _store_pairs(conn, metal, pair_name, rows, conflict='REPLACE'):
+    """
+    写入一个配对的价差行并维护派生表，返回 (inserted, updated, unchanged)。调用方负责事务
+
+    rows 为 (ts, gfex_contract, cme_contract, gfex_price, cme_usd, cme_cny, spread, spread_pct)。
+    值没有变化的行不写入，也不触发派生表维护；写入的行记下本次的数据版本 (version)。
+    已移入分区或归档的时间段（cold_boundary 之前）的行同样不写入，计入 unchanged。
+    """
+    rows, cold = _skip_cold_rows(list(rows), cold_boundary('pairs', metal, pair_name))
+    _begin_write(conn)
+    written, replaced, unchanged = _write_rows(
+        conn, PAIR_TABLES[metal], 'pair_name', pair_name, PAIR_ROW_COLUMNS, rows, conflict,
+        track=('spread_pct',), stamp=('version', _next_data_version(conn))
+    )
+    if written:
+        _after_pair_write(conn, metal, pair_name, [row[0] for row in written],
+                          added=[row[-1] for row in written], removed=[old[0] for old in replaced.values()])
+        bump_data_version(conn)
+    return len(written) - len(replaced), len(replaced), unchanged + cold
+
+
+def _store_spreads(conn, metal, rows):
+    """
+    写入旧版单一价差表并更新其统计，返回 (inserted, updated, unchanged)。调用方负责事务
+
+    rows 为 (ts, gfex_price, cme_usd, cme_cny, spread, spread_pct)。
+    """
+    table = 'platinum_spread' if metal == 'platinum' else 'palladium_spread'
+    _begin_write(conn)
+    written, replaced, unchanged = _write_rows(
+        conn, table, None, None, SPREAD_ROW_COLUMNS, rows, track=('spread_pct',)
+    )
+    if written:
+        _update_stats(conn, metal, SPREAD_SERIES, [row[-1] for row in written],
+                      [old[0] for old in replaced.values()])
+        bump_data_version(conn)
+    return len(written) - len(replaced), len(replaced), unchanged
+
+
+def _store_snapshots(conn, rows):
+    """写入价格快照行 (ts, pt_gfex, ..., exchange_rate)。调用方负责事务"""
+    conn.executemany('''
+        INSERT INTO price_snapshots 
+        (ts, pt_gfex, pt_cme_usd, pt_cme_cny, pt_spread, pt_spread_pct,
+         pd_gfex, pd_cme_usd, pd_cme_cny, pd_spread, pd_spread_pct, exchange_rate)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    bump_data_version(conn)
+
+
+def snapshot_row(pt_data, pd_data, exchange_rate, ts=None):
+    """由铂金/钯金当前价差字典组装一行价格快照"""
+    return (
+        int(time.time()) if ts is None else ts,
+        pt_data.get('gfex_price'), pt_data.get('cme_usd'), pt_data.get('cme_cny'),
+        pt_data.get('spread'), pt_data.get('spread_pct'),
+        pd_data.get('gfex_price'), pd_data.get('cme_usd'), pd_data.get('cme_cny'),
+        pd_data.get('spread'), pd_data.get('spread_pct'),
+        exchange_rate
+    )
+
+
+def bulk_ingest_bars(symbol, df, offset_hours=0):
+    """
+    批量写入合约K线到 bars 表
+
+    df 可以带 datetime 列，也可以以时间为索引 (tvDatafeed)。offset_hours 用于
+    时区换算（如UTC转北京时间+8）。OHLC 任一缺失的行会被拒绝，成交量/持仓
+    缺失记为0（CME无持仓量）。与库中完全相同的K线不写入。
+    返回 {'inserted', 'updated', 'unchanged', 'rejected'}。
+    """
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+    if df is None or len(df) == 0:
+        return result
+
+    raw_times = df['datetime'] if 'datetime' in df.columns else df.index
+    times = pd.DatetimeIndex(pd.to_datetime(raw_times, errors='coerce'))
+    if offset_hours:
+        times = times + pd.Timedelta(hours=offset_hours)
+
+    source = {'o': 'open', 'h': 'high', 'l': 'low', 'c': 'close', 'v': 'volume'}
+    if instrument_info(symbol) and instrument_info(symbol)[0] == 'GFEX':
+        source['oi'] = 'hold'
+
+    # 一次性转换为列数组，再按有效行掩码过滤
+    values = pd.DataFrame({
+        col: pd.to_numeric(df[name], errors='coerce').to_numpy() if name in df.columns else 0
+        for col, name in source.items()
+    }, index=range(len(df)))
+    valid = (~times.isna()) & values[['o', 'h', 'l', 'c']].notna().all(axis=1).to_numpy()
+    result['rejected'] = int((~valid).sum())
+
+    values = values[valid]
+    columns = ['ts'] + list(source)
+    arrays = [series_to_epoch(times[valid])]
+    arrays += [values[col].tolist() for col in ('o', 'h', 'l', 'c')]
+    arrays += [values[col].fillna(0).astype('int64').tolist() for col in columns[5:]]
+    rows = list(zip(*arrays))
+
+    conn = get_connection()
+    with conn:
+        instrument_id = get_instrument_id(symbol, conn)
+        result['inserted'], result['updated'], result['unchanged'] = _store_bars(conn, instrument_id, columns, rows)
+    return result
+
+
+def bulk_ingest_spreads(metal, pair_name, gfex_contract, cme_contract, history, conflict='REPLACE'):
+    """
+    批量写入配对价差历史
+
+    history 为 calculate_spread 生成的字典列表，或带同名列的DataFrame
+    (date, gfex_price, cme_usd, cme_cny, spread, spread_pct)。
+    conflict='IGNORE' 时保留已有数据（用于小时级历史回填）。
+    每轮重复保存的整段历史中与库中相同的行不写入。
+    返回 {'inserted', 'updated', 'unchanged', 'rejected'}。
+    """
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+    value_cols = PAIR_ROW_COLUMNS[3:]
+
+    if isinstance(history, pd.DataFrame):
+        times = pd.to_datetime(history['date'], errors='coerce')
+        valid_time = times.notna().tolist()
+        stamps = series_to_epoch(times.fillna(pd.Timestamp(0)))
+        stamps = [ts if ok else None for ts, ok in zip(stamps, valid_time)]
+        values = [pd.to_numeric(history[col], errors='coerce').tolist() for col in value_cols]
+    else:
+        stamps = [to_epoch(item.get('date')) for item in history]
+        values = [[item.get(col) for item in history] for col in value_cols]
+
+    rows = []
+    for i, ts in enumerate(stamps):
+        row = tuple(col[i] for col in values)
+        if ts is None or not all(_is_number(v) for v in row):
+            result['rejected'] += 1
+            continue
+        rows.append((ts, gfex_contract, cme_contract) + row)
+
+    conn = get_connection()
+    with conn:
+        result['inserted'], result['updated'], result['unchanged'] = _store_pairs(conn, metal, pair_name, rows, conflict)
+    return result
+
+
+def save_bar(symbol, when, open_, high, low, close, volume=0):
+    """保存单根K线（爬虫实时价格等单点写入），when 为北京时间文本或时间戳；返回实际变化的行数"""
+    conn = get_connection()
+    with conn:
+        inserted, updated, _ = _store_bars(conn, get_instrument_id(symbol, conn), BAR_ROW_COLUMNS,
+                                           [(to_epoch(when), open_, high, low, close, volume)])
+    return inserted + updated
+
+
+def load_bars(symbol, start=None, end=None, limit=None, readonly=False, resolution='1m'):
+    """
+    读取单个合约的K线，返回以北京时间为索引的 DataFrame
+
+    start/end 为北京时间文本、datetime 或时间戳；limit 表示取最近的N根。
+    查询直接落在 bars 的 (instrument_id, ts) 聚簇主键上，主库不足时再读相交的年度分区
+    与冷数据归档；resolution 为 '5m'/'1h'/'1d' 时改读 bar_rollups，索引为桶起点。
+    """
+    conn = get_readonly_connection() if readonly else get_read_connection()
+    row = conn.execute('SELECT instrument_id FROM instruments WHERE symbol = ?', (symbol,)).fetchone()
+    if row is None:
+        return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume', 'hold'])
+
+    if resolution == '1m':
+        table, time_col, clauses, params = 'bars', 'ts', ['instrument_id = ?'], [row[0]]
+    elif resolution in dict(ROLLUP_LEVELS):
+        table, time_col = 'bar_rollups', 'bucket'
+        clauses, params = ['instrument_id = ?', 'resolution = ?'], [row[0], resolution]
+    else:
+        raise ValueError(f"不支持的分辨率: {resolution}")
+
+    start_ts, end_ts = to_epoch(start), to_epoch(end)
+    df = _read_bars(conn, table, time_col, clauses, params, start_ts, end_ts, limit)
+    if resolution == '1m' and (not limit or len(df) < limit):
+        df = _bars_with_partitions(conn, row[0], df, start_ts, end_ts, limit)
+        df = _bars_with_archive(symbol, df, start_ts, end_ts, limit)
+    df['datetime'] = pd.to_datetime(df.pop('ts') + BEIJING_OFFSET, unit='s')
+    return df.set_index('datetime').sort_index()
+
+
+def _read_bars(conn, source, time_col, clauses, params, start_ts, end_ts, limit):
+    """从一张K线表（bars / 某个分区的 bars / bar_rollups）按时间倒序读取最近 limit 根"""
+    clauses, params = list(clauses), list(params)
+    if start_ts is not None:
+        clauses.append(f'{time_col} >= ?')
+        params.append(start_ts)
+    if end_ts is not None:
+        clauses.append(f'{time_col} <= ?')
+        params.append(end_ts)
+    sql = f'''
+        SELECT {time_col} AS ts, o AS open, h AS high, l AS low, c AS close, v AS volume, oi AS hold
+        FROM {source} WHERE {' AND '.join(clauses)}
+        ORDER BY {time_col} DESC
+    '''
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(int(limit))
+    return pd.read_sql_query(sql, conn, params=params)
+
+
+def _bars_with_partitions(conn, instrument_id, df, start_ts, end_ts, limit):
+    """分钟K线不足 limit 根（或不限条数）时，依次合并相交年度分区中更早的K线"""
+    oldest = int(df['ts'].min()) if len(df) else None
+    for schema in attach_partitions(conn, start_ts, _upper_bound(end_ts, oldest)):
+        part = _read_bars(conn, f'{schema}.bars', 'ts', ['instrument_id = ?'], [instrument_id],
+                          start_ts, _upper_bound(end_ts, oldest), limit - len(df) if limit else None)
+        if len(part):
+            df = pd.concat([df, part], ignore_index=True) if len(df) else part
+            oldest = int(part['ts'].min())
+        if limit and len(df) >= limit:
+            break
+    return df
+
+
+def _bars_with_archive(symbol, df, start_ts, end_ts, limit):
+    """分钟K线不足 limit 根（或不限条数）时，合并冷数据归档中更早的K线"""
+    import archive
+    metal = (instrument_info(symbol) or (None, None))[1]
+    if metal is None or not archive.archived_months('bars', metal, symbol):
+        return df
+    if len(df):
+        end_ts = _upper_bound(end_ts, int(df['ts'].min()))
+    old = archive.load_frame('bars', metal, symbol, start_ts, end_ts)
+    old = old.rename(columns={'o': 'open', 'h': 'high', 'l': 'low', 'c': 'close', 'v': 'volume', 'oi': 'hold'})
+    old['volume'] = old['volume'].fillna(0).astype('int64')
+    if limit:
+        old = old.tail(limit - len(df))
+    return pd.concat([old, df], ignore_index=True) if len(old) else df
+
+
+def get_latest_bar(symbol, readonly=False):
+    """返回合约最新一根K线的 (close, datetime文本)，无数据时返回 None"""
+    conn = get_readonly_connection() if readonly else get_read_connection()
+    sql = '''
+        SELECT b.c, b.ts FROM instruments i JOIN {}.bars b ON b.instrument_id = i.instrument_id
+        WHERE i.symbol = ? ORDER BY b.ts DESC LIMIT 1
+    '''
+    row = conn.execute(sql.format('main'), (symbol,)).fetchone()
+    # 主库没有该合约的K线时（整年移入分区的旧合约）再按新到旧查分区
+    for schema in ([] if row else attach_partitions(conn)):
+        row = conn.execute(sql.format(schema), (symbol,)).fetchone()
+        if row is not None:
+            break
+    if row is None:
+        return None
+    return row[0], from_epoch(row[1])
+
+
+# CME 合约月份代码 F(1月) ... Z(12月)
+CME_MONTH_CODES = 'FGHJKMNQUVXZ'
+
+# 查找上一交易日收盘价时向前读取的 1h 汇总桶范围（秒），覆盖长假
+SESSION_QUOTE_LOOKBACK = 14 * 86400
+
+
+def contract_month(symbol):
+    """合约交割年月 (年, 月)：PT2606 -> (2026, 6)，PLJ2026 -> (2026, 4)；无法解析时返回 None"""
+    match = re.fullmatch(r'[A-Z]{2}(\d{2})(\d{2})', symbol.upper())
+    if match:
+        return 2000 + int(match.group(1)), int(match.group(2))
+    match = re.fullmatch(r'[A-Z]{2}([A-Z])(\d{4})', symbol.upper())
+    if match and match.group(1) in CME_MONTH_CODES:
+        return int(match.group(2)), CME_MONTH_CODES.index(match.group(1)) + 1
+    return None
+
+
+def active_instruments(exchange=None, metal=None, conn=None, now=None):
+    """
+    instruments 登记表中未到期的合约 [{'instrument_id', 'symbol', 'exchange', 'metal'}]
+
+    交割月早于当前月份的合约视为已到期；无法解析交割月的合约保留。
+    按交易所、品种、交割月排序（CME 合约代码的字母序不是月份序）。
+    """
+    conn = conn or get_read_connection()
+    now = now or datetime.now()
+    clauses, params = [], []
+    if exchange:
+        clauses.append('exchange = ?')
+        params.append(exchange.upper())
+    if metal:
+        clauses.append('metal = ?')
+        params.append(metal)
+    sql = 'SELECT instrument_id, symbol, exchange, metal FROM instruments'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+
+    result = []
+    for instrument_id, symbol, exch, met in conn.execute(sql, params):
+        month = contract_month(symbol)
+        if month is not None and month < (now.year, now.month):
+            continue
+        result.append({'instrument_id': instrument_id, 'symbol': symbol, 'exchange': exch, 'metal': met,
+                       'month': month})
+    result.sort(key=lambda i: (i['exchange'], i['metal'], i['month'] or (9999, 12), i['symbol']))
+    for item in result:
+        del item['month']
+    return result
+
+
+def get_session_quotes(sessions, lookback=SESSION_QUOTE_LOOKBACK):
+    """
+    多个合约本交易日的开/高/低/最新价与上一交易日收盘价，一次查询完成
+
+    sessions 为 [(instrument_id, 本交易日开盘时间戳)]。读写入时维护的 1h 汇总桶（各交易所
+    开盘都在整点，桶不会跨越交易日），按 (合约, 是否属于本交易日) 分区用窗口函数取首尾桶与极值，
+    不扫描分钟K线。返回 {instrument_id: {'open', 'high', 'low', 'last', 'last_ts',
+    'prev_close', 'prev_ts'}}，本交易日尚无成交时 open/high/low/last 为 None；
+    lookback 秒内没有任何K线的合约不出现在结果中。
+    """
+    if not sessions:
+        return {}
+    conn = get_read_connection()
+    values = ', '.join(['(?, ?)'] * len(sessions))
+    params = [value for session in sessions for value in session] + [lookback]
+    rows = conn.execute(f'''
+        WITH sessions(instrument_id, session_start) AS (VALUES {values}),
+        ranked AS (
+            SELECT r.instrument_id, r.bucket >= s.session_start AS in_session, r.o, r.c, r.last_ts,
+                   MAX(r.h) OVER part AS high, MIN(r.l) OVER part AS low,
+                   ROW_NUMBER() OVER (part ORDER BY r.bucket) AS first_rank,
+                   ROW_NUMBER() OVER (part ORDER BY r.bucket DESC) AS last_rank
+            FROM sessions s
+            JOIN bar_rollups r ON r.instrument_id = s.instrument_id AND r.resolution = '1h'
+                 AND r.bucket >= s.session_start - ?
+            WINDOW part AS (PARTITION BY r.instrument_id, r.bucket >= s.session_start)
+        )
+        SELECT instrument_id,
+               MAX(CASE WHEN in_session AND first_rank = 1 THEN o END),
+               MAX(CASE WHEN in_session THEN high END),
+               MIN(CASE WHEN in_session THEN low END),
+               MAX(CASE WHEN in_session AND last_rank = 1 THEN c END),
+               MAX(CASE WHEN in_session AND last_rank = 1 THEN last_ts END),
+               MAX(CASE WHEN NOT in_session AND last_rank = 1 THEN c END),
+               MAX(CASE WHEN NOT in_session AND last_rank = 1 THEN last_ts END)
+        FROM ranked
+        WHERE first_rank = 1 OR last_rank = 1
+        GROUP BY instrument_id
+    ''', params).fetchall()
+    return {row[0]: dict(zip(('open', 'high', 'low', 'last', 'last_ts', 'prev_close', 'prev_ts'), row[1:]))
+            for row in rows}
 
 
 def save_pair_history(metal, pair_name, gfex_contract, cme_contract, history):
     """批量保存配对历史数据"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    table = 'platinum_pairs' if metal == 'platinum' else 'palladium_pairs'
-    
-    for item in history:
-        try:
-            cursor.execute(f'''
-                INSERT OR REPLACE INTO {table} 
-                (pair_name, gfex_contract, cme_contract, datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (pair_name, gfex_contract, cme_contract, 
-                  item['date'], item['gfex_price'], item['cme_usd'], item['cme_cny'], 
-                  item['spread'], item['spread_pct']))
-        except:
-            pass
-    
-    conn.commit()
-    conn.close()
+    return bulk_ingest_spreads(metal, pair_name, gfex_contract, cme_contract, history)
 
 
 def get_all_pairs(metal):
-    """获取所有配对的最新数据"""
-    conn = sqlite3.connect(DB_FILE)
+    """获取所有配对的最新数据（读 pair_latest，不扫描历史表）"""
+    conn = get_read_connection()
     cursor = conn.cursor()
     
-    table = 'platinum_pairs' if metal == 'platinum' else 'palladium_pairs'
-    
-    # 获取每个配对的最新数据
-    cursor.execute(f'''
+    cursor.execute('''
         SELECT pair_name, gfex_contract, cme_contract, datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct
-        FROM {table}
-        WHERE (pair_name, datetime) IN (
-            SELECT pair_name, MAX(datetime) FROM {table} GROUP BY pair_name
-        )
+        FROM pair_latest
+        WHERE metal = ?
         ORDER BY spread_pct DESC
-    ''')
+    ''', (metal,))
     
     rows = cursor.fetchall()
-    conn.close()
     
     pairs = {}
     for r in rows:
@@ -381,26 +1834,211 @@ def get_all_pairs(metal):
     return pairs
 
 
-def get_pair_history(metal, pair_name, limit=5000):
-    """获取指定配对的历史数据"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    table = 'platinum_pairs' if metal == 'platinum' else 'palladium_pairs'
-    
-    cursor.execute(f'''
-        SELECT datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct
-        FROM {table}
-        WHERE pair_name = ?
-        ORDER BY datetime DESC
-        LIMIT ?
-    ''', (pair_name, limit))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [{'date': r[0], 'gfex_price': r[1], 'cme_usd': r[2], 
-             'cme_cny': r[3], 'spread': r[4], 'spread_pct': r[5]} for r in reversed(rows)]
+def get_pair_history(metal, pair_name, start=None, end=None, resolution='1m', agg='last', limit=5000):
+    """
+    获取指定配对的历史数据
+
+    start/end 为北京时间文本、datetime 或时间戳（闭区间，可省略）。
+    resolution 为 '1m'/'5m'/'1h'/'1d'，分桶在 SQLite（或 query_backend 选择的 DuckDB）内完成：
+      agg='last'  每个桶取最后一条，字段与原始数据相同
+      agg='ohlc'  另外给出 spread_pct 的 open/high/low/close、均值 avg 与条数 count
+    date 为桶起点。limit 限制返回最近的桶数，结果按时间升序。
+    5m/1h/1d 读写入时维护的 pair_rollups，时间范围按桶匹配（与区间有交集的桶）；
+    1m 先查主库，不足时再依次读相交的年度分区与冷数据归档。
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"不支持的分辨率: {resolution}")
+    if agg not in HISTORY_AGGS:
+        raise ValueError(f"不支持的聚合方式: {agg}")
+
+    bounds = []
+    for value in (start, end):
+        ts = to_epoch(value)
+        if value is not None and ts is None:
+            raise ValueError(f"无法解析时间: {value}")
+        bounds.append(ts)
+    start_ts, end_ts = bounds
+
+    conn = get_read_connection()
+    table = PAIR_TABLES[metal]
+    step = RESOLUTIONS[resolution]
+
+    if resolution in dict(ROLLUP_LEVELS):
+        clauses, params = ['metal = ?', 'pair_name = ?', 'resolution = ?'], [metal, pair_name, resolution]
+        if start_ts is not None:
+            clauses.append('bucket > ?')
+            params.append(start_ts - step)
+        if end_ts is not None:
+            clauses.append('bucket <= ?')
+            params.append(end_ts)
+        rows = conn.execute(f'''
+            SELECT bucket, gfex_price, cme_usd, cme_cny, spread, close, open, high, low, sum, count
+            FROM pair_rollups
+            WHERE {' AND '.join(clauses)}
+            ORDER BY bucket DESC
+            LIMIT ?
+        ''', params + [limit]).fetchall()
+        return _history_items(reversed(rows), agg)
+
+    # DuckDB 后端：库内、分区与归档数据在一个向量化查询中完成分桶
+    if agg == 'ohlc':
+        import query_backend
+        if query_backend.get_backend() == 'duckdb':
+            df = query_backend.pair_ohlc(metal, pair_name, step, start_ts, end_ts, limit)
+            return _history_items(query_backend.records(df), agg)
+
+    # 分钟级：主库 -> 相交的年度分区（新到旧）-> 冷数据归档，前一段不足 limit 时依次往更早补
+    history, oldest = _minute_history(conn, table, pair_name, start_ts, end_ts, step, agg, limit)
+    if len(history) < limit:
+        for schema in attach_partitions(conn, start_ts, _upper_bound(end_ts, oldest)):
+            part, first = _minute_history(conn, f'{schema}.{table}', pair_name, start_ts,
+                                          _upper_bound(end_ts, oldest), step, agg, limit - len(history))
+            history = part + history
+            oldest = first if first is not None else oldest
+            if len(history) >= limit:
+                break
+    return _with_archive(metal, pair_name, start_ts, end_ts, agg, limit, history, oldest)
+
+
+# 增量查询一次最多返回的变化点（桶）数，超过时让调用方整体重新加载
+MAX_CHANGES = 5000
+
+
+def get_pair_changes(metal, since, pair_name=None, resolution='1m', agg='last', limit=MAX_CHANGES):
+    """
+    配对价差在游标 since 之后新增或修改的点
+
+    游标即数据版本号：每行价差记录最后一次写入时的 data_version，取 since < version <= 当前版本
+    的行（先读当前版本，之后写入的行留给下一次）。返回 {'cursor': 新游标, 'reset': bool,
+    'pairs': {配对: [点...]}}，点的字段同 get_pair_history；pair_name 为 None 时包括该品种全部配对。
+    1m/last 只返回变化的分钟点；其他分辨率/聚合方式返回每个配对从最早变化点所在桶起的全部桶。
+    reset 为 True 表示无法从该游标继续（游标大于当前版本，来自别的库或更早的快照；或变化超过
+    limit），调用方应丢弃本地数据重新全量加载，此时 pairs 为空。
+    只跟踪写入，移入年度分区或归档而删除的行不会出现在结果中。
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"不支持的分辨率: {resolution}")
+    if agg not in HISTORY_AGGS:
+        raise ValueError(f"不支持的聚合方式: {agg}")
+
+    conn = get_read_connection()
+    cursor = get_data_version(conn)
+    result = {'cursor': cursor, 'reset': False, 'pairs': {}}
+    if since > cursor:
+        result['reset'] = True
+        return result
+
+    table = PAIR_TABLES[metal]
+    clauses, params = ['version > ?', 'version <= ?'], [since, cursor]
+    if pair_name is not None:
+        clauses.append('pair_name = ?')
+        params.append(pair_name)
+    where = ' AND '.join(clauses)
+
+    if resolution == '1m' and agg == 'last':
+        rows = conn.execute(f'''
+            SELECT pair_name, ts, gfex_price, cme_usd, cme_cny, spread, spread_pct
+            FROM {table}
+            WHERE {where}
+            ORDER BY pair_name, ts
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+        if len(rows) > limit:
+            result['reset'] = True
+            return result
+        for r in rows:
+            result['pairs'].setdefault(r[0], []).append(
+                {'date': from_epoch(r[1]), 'gfex_price': r[2], 'cme_usd': r[3],
+                 'cme_cny': r[4], 'spread': r[5], 'spread_pct': r[6]})
+        return result
+
+    # 聚合结果：桶内任一点变化都会改变该桶，从最早变化点所在的桶起重新取
+    step = RESOLUTIONS[resolution]
+    changed = conn.execute(f'SELECT pair_name, MIN(ts) FROM {table} WHERE {where} GROUP BY pair_name',
+                           params).fetchall()
+    for name, first in changed:
+        start = first - (first + BEIJING_OFFSET) % step
+        history = get_pair_history(metal, name, start=start, resolution=resolution, agg=agg, limit=limit)
+        if len(history) >= limit:
+            result['reset'] = True
+            result['pairs'] = {}
+            return result
+        result['pairs'][name] = history
+    return result
+
+
+def _minute_history(conn, source, pair_name, start_ts, end_ts, step, agg, limit):
+    """在一张分钟级配对表（主库或某个年度分区）中查询，返回 (history, 最早的时间点/桶)"""
+    clauses, params = ['pair_name = ?'], [pair_name]
+    if start_ts is not None:
+        clauses.append('ts >= ?')
+        params.append(start_ts)
+    if end_ts is not None:
+        clauses.append('ts <= ?')
+        params.append(end_ts)
+    where = ' AND '.join(clauses)
+
+    if agg == 'last':
+        rows = conn.execute(f'''
+            SELECT ts, gfex_price, cme_usd, cme_cny, spread, spread_pct
+            FROM {source}
+            WHERE {where}
+            ORDER BY ts DESC
+            LIMIT ?
+        ''', params + [limit]).fetchall()
+        history = [{'date': from_epoch(r[0]), 'gfex_price': r[1], 'cme_usd': r[2],
+                    'cme_cny': r[3], 'spread': r[4], 'spread_pct': r[5]} for r in reversed(rows)]
+        return history, rows[-1][0] if rows else None
+
+    # 分钟级 OHLC：在 (pair_name, ts) 索引上按桶聚合，再按桶内首/末时间点回表取开盘/收盘行
+    rows = conn.execute(f'''
+        WITH buckets AS (
+            SELECT {_bucket_expression(step)} AS bucket,
+                   MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+                   MIN(spread_pct) AS low, MAX(spread_pct) AS high,
+                   SUM(spread_pct) AS sum, COUNT(spread_pct) AS count
+            FROM {source}
+            WHERE {where}
+            GROUP BY bucket
+            ORDER BY bucket DESC
+            LIMIT ?
+        )
+        SELECT b.bucket, c.gfex_price, c.cme_usd, c.cme_cny, c.spread, c.spread_pct,
+               o.spread_pct, b.high, b.low, b.sum, b.count
+        FROM buckets b
+        JOIN {source} c ON c.pair_name = ? AND c.ts = b.last_ts
+        JOIN {source} o ON o.pair_name = ? AND o.ts = b.first_ts
+        ORDER BY b.bucket
+    ''', params + [limit, pair_name, pair_name]).fetchall()
+    return _history_items(rows, agg), rows[0][0] if rows else None
+
+
+def _with_archive(metal, pair_name, start_ts, end_ts, agg, limit, history, oldest):
+    """
+    分钟级查询结果不足 limit 条时，用冷数据归档中更早的数据补足
+
+    oldest 为库内结果中最早的时间点（桶），归档只取它之前的部分。
+    """
+    if len(history) >= limit:
+        return history
+    import archive
+    if not archive.archived_months('pairs', metal, pair_name):
+        return history
+    return archive.pair_history(metal, pair_name, start_ts, _upper_bound(end_ts, oldest), agg,
+                                limit - len(history)) + history
+
+
+def _history_items(rows, agg):
+    """(桶起点, 末条四个价格字段, close, open, high, low, sum, count) 行转换为历史记录字典"""
+    history = []
+    for r in rows:
+        item = {'date': from_epoch(r[0]), 'gfex_price': r[1], 'cme_usd': r[2],
+                'cme_cny': r[3], 'spread': r[4], 'spread_pct': r[5]}
+        if agg == 'ohlc':
+            item.update({'open': r[6], 'high': r[7], 'low': r[8], 'close': r[5],
+                         'avg': r[9] / r[10] if r[10] else None, 'count': r[10]})
+        history.append(item)
+    return history
 
 
 def main():
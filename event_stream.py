@@ -0,0 +1,342 @@
+"""
+服务器推送事件 (SSE)
+/api/stream 的所有连接共享同一个内存广播：数据版本变化时 ChangeFeed 只查询一次增量
+（最新价、各配对新增的价差点、价差越过警报阈值），编码成一条 SSE 消息放进环形缓冲区，
+每个连接发送的是同一份字节。服务器负载随数据更新次数增长，与客户端数量、轮询频率无关。
+  - 每条消息带递增的 id，浏览器断线重连时自动带上 Last-Event-ID，从缓冲区补发错过的消息；
+    缓冲区已不包含时发送 reset，客户端重新加载全量数据；
+  - 连接建立时先发送 hello（当前最新价与正在越界的警报），页面不必再单独请求；
+  - 空闲时每 HEARTBEAT 秒发送一行注释，防止代理断开空闲连接；
+  - asyncio 模式下订阅者在事件循环中等待，不占线程；线程模式每个订阅占用一个连接线程。
+消息类型:
+  prices  {'cme': {合约: {price, datetime, open_price}}, 'gfex': {...}}   只含有变化的合约
+  spreads {'columns': [...], 'points': {品种: {配对: [[ts, ...], ...]}}}   各配对新增的价差点
+  alert   {'metal', 'pair_name', 'spread_pct', 'state': 'above'|'below'|'normal', 'threshold', 'ts'}
+  job     数据同步任务开始/结束时的状态（同 GET /api/jobs/<id>）
+用法: python event_stream.py [--url http://localhost:8080/api/stream]   # 打印收到的事件
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from database import PAIR_TABLES, get_connection, get_data_version, get_read_connection, refresh_snapshot
+
+BACKLOG = 256                     # 保留的最近消息数（供断线重连补发）
+HEARTBEAT = 15                    # 空闲时发送心跳注释的间隔（秒）
+RETRY_MS = 5000                   # 建议浏览器断线后的重连间隔
+POLL_INTERVAL = 5                 # ChangeFeed 检查数据版本的间隔（秒）
+MAX_POINTS = 500                  # 每个配对单条消息最多推送的新增价差点
+ALERT_CONFIG_FILE = 'alert_config.json'
+
+SPREAD_COLUMNS = ['ts', 'gfex_price', 'cme_usd', 'cme_cny', 'spread', 'spread_pct']
+HEARTBEAT_LINE = b': ping\n\n'
+
+
+def encode_event(event, data, event_id=None):
+    """编码一条 SSE 消息（data 为紧凑 JSON，单行）"""
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines += [f'event: {event}', 'data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':'))]
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class Broadcaster:
+    """
+    单个内存广播：publish 编码一次，所有订阅者读取同一份字节
+
+    id 从启动时的毫秒时间戳起递增，服务重启后旧的 Last-Event-ID 必然早于缓冲区，触发 reset。
+    """
+
+    def __init__(self, backlog=BACKLOG):
+        self._events = deque(maxlen=backlog)      # (id, 编码后的消息)
+        self._last_id = int(time.time() * 1000)
+        self._cond = threading.Condition()
+        self._waiters = set()                     # asyncio 订阅者: (事件循环, asyncio.Event)
+        self._stats = {'published': 0, 'subscribers': 0, 'max_subscribers': 0, 'total_subscribers': 0}
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event, data):
+        """广播一条消息，返回其 id"""
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, encode_event(event, data, self._last_id)))
+            self._stats['published'] += 1
+            self._cond.notify_all()
+            waiters = list(self._waiters)
+        for loop, ready in waiters:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass                              # 事件循环已关闭
+        return self._last_id
+
+    def since(self, last_id):
+        """
+        返回 (当前 id, last_id 之后的消息列表)
+
+        last_id 已不在缓冲区范围内（或来自上次启动）时消息列表为 None。
+        """
+        with self._cond:
+            if last_id == self._last_id:
+                return self._last_id, []
+            if last_id > self._last_id or not self._events or last_id < self._events[0][0] - 1:
+                return self._last_id, None
+            return self._last_id, [payload for event_id, payload in self._events if event_id > last_id]
+
+    def wait(self, last_id, timeout):
+        """阻塞等待 last_id 之后的新消息（线程模式），返回是否有新消息"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_id != last_id, timeout)
+
+    def _subscribed(self, delta, waiter=None):
+        with self._cond:
+            self._stats['subscribers'] += delta
+            if delta > 0:
+                self._stats['total_subscribers'] += 1
+                self._stats['max_subscribers'] = max(self._stats['max_subscribers'], self._stats['subscribers'])
+            if waiter is not None:
+                (self._waiters.add if delta > 0 else self._waiters.discard)(waiter)
+
+    def get_stats(self):
+        with self._cond:
+            return dict(self._stats, last_id=self._last_id, backlog=len(self._events))
+
+
+class EventStream:
+    """
+    一个 SSE 连接的响应体
+
+    hello 为返回当前状态的无参函数。线程模式用 for 迭代（阻塞等待），asyncio 模式用
+    async for 迭代；两者都先发送 hello（重连时改为补发错过的消息），之后有新消息就发送，
+    空闲时发送心跳。
+    """
+
+    def __init__(self, broadcaster, hello, last_event_id=None):
+        self.broadcaster = broadcaster
+        self.last_id = broadcaster.last_id
+        first = [f'retry: {RETRY_MS}\n\n'.encode('ascii')]
+        missed = None if last_event_id is None else broadcaster.since(last_event_id)[1]
+        if missed is not None:
+            # 重连且缓冲区仍包含错过的消息：只补发，不再发送全量状态
+            self.last_id = last_event_id
+        else:
+            if last_event_id is not None:
+                first.append(encode_event('reset', {}))
+            # 先取 id 再取状态：两者之间发布的消息会再发送一次，不会漏掉
+            first.append(encode_event('hello', hello()))
+        self.first = b''.join(first)
+
+    def _pending(self):
+        """自上次发送以来的新消息（拼接后的字节），没有时返回 b''"""
+        self.last_id, events = self.broadcaster.since(self.last_id)
+        if events is None:
+            events = [encode_event('reset', {})]
+        return b''.join(events)
+
+    def __iter__(self):
+        self.broadcaster._subscribed(1)
+        try:
+            yield self.first + self._pending()
+            while True:
+                self.broadcaster.wait(self.last_id, HEARTBEAT)
+                yield self._pending() or HEARTBEAT_LINE
+        finally:
+            self.broadcaster._subscribed(-1)
+
+    async def __aiter__(self):
+        ready = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), ready)
+        self.broadcaster._subscribed(1, waiter)
+        try:
+            yield self.first + self._pending()
+            while True:
+                # 先清标记再检查，检查之后发布的消息会重新置位，不会漏掉
+                ready.clear()
+                chunk = self._pending()
+                if not chunk:
+                    try:
+                        await asyncio.wait_for(ready.wait(), HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        yield HEARTBEAT_LINE
+                        continue
+                    chunk = self._pending()
+                if chunk:
+                    yield chunk
+        finally:
+            self.broadcaster._subscribed(-1, waiter)
+
+
+def load_thresholds():
+    """alert_config.json 中各品种的价差百分比阈值 {品种: (下限, 上限)}，未配置时为空"""
+    if not os.path.exists(ALERT_CONFIG_FILE):
+        return {}
+    try:
+        with open(ALERT_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {metal: (limits.get('min', -999), limits.get('max', 999))
+            for metal, limits in config.get('thresholds', {}).items()}
+
+
+def alert_state(spread_pct, limits):
+    """价差相对阈值的状态: above / below / normal（与 alert_manager.check_and_alert 的判断一致）"""
+    if limits is None or spread_pct is None:
+        return 'normal'
+    low, high = limits
+    if spread_pct > high:
+        return 'above'
+    if spread_pct < low:
+        return 'below'
+    return 'normal'
+
+
+class ChangeFeed:
+    """
+    数据版本变化时计算增量并广播
+
+    latest_sources: {名称: 无参函数}，返回 {合约: 最新价信息}（如 cme / gfex 的最新价查询）。
+    第一次检查只记录基线，不广播；之后每个数据版本只查询一次，与连接数无关。
+    """
+
+    def __init__(self, broadcaster, latest_sources):
+        self.broadcaster = broadcaster
+        self.latest_sources = latest_sources
+        self.version = None
+        self.prices = {name: {} for name in latest_sources}
+        self.cursors = {}                 # (品种, 配对) -> 已推送的最新 ts
+        self.alerts = {}                  # (品种, 配对) -> 当前警报状态信息
+        self._lock = threading.Lock()
+
+    def hello(self):
+        """新连接收到的当前状态"""
+        with self._lock:
+            return {'version': self.version, 'prices': dict(self.prices),
+                    'alerts': [a for a in self.alerts.values() if a['state'] != 'normal']}
+
+    def _price_changes(self):
+        changes = {}
+        for name, fetch in self.latest_sources.items():
+            latest = fetch()
+            changed = {contract: quote for contract, quote in latest.items()
+                       if self.prices[name].get(contract) != quote}
+            if changed:
+                changes[name] = changed
+            self.prices[name] = dict(latest)
+        return changes
+
+    def _new_points(self, conn):
+        """各配对在游标之后新增的价差点 {品种: {配对: [行, ...]}}"""
+        points = {}
+        rows = conn.execute('SELECT metal, pair_name, ts FROM pair_latest').fetchall()
+        for metal, pair_name, latest_ts in rows:
+            key = (metal, pair_name)
+            cursor = self.cursors.get(key)
+            self.cursors[key] = latest_ts
+            if self.version is None or (cursor is not None and latest_ts <= cursor) or metal not in PAIR_TABLES:
+                continue
+            new = conn.execute(f'''
+                SELECT {', '.join(SPREAD_COLUMNS)} FROM {PAIR_TABLES[metal]}
+                WHERE pair_name = ? AND ts > ? ORDER BY ts DESC LIMIT ?
+            ''', (pair_name, cursor if cursor is not None else -1, MAX_POINTS)).fetchall()
+            if new:
+                points.setdefault(metal, {})[pair_name] = [list(row) for row in reversed(new)]
+        return points
+
+    def _alert_changes(self, conn):
+        """价差相对阈值的状态发生变化的配对（进入/离开越界区间）"""
+        thresholds = load_thresholds()
+        changes = []
+        rows = conn.execute('SELECT metal, pair_name, ts, spread_pct FROM pair_latest').fetchall()
+        for metal, pair_name, ts, spread_pct in rows:
+            limits = thresholds.get(metal)
+            state = alert_state(spread_pct, limits)
+            key = (metal, pair_name)
+            previous = self.alerts.get(key, {}).get('state', 'normal')
+            self.alerts[key] = {'metal': metal, 'pair_name': pair_name, 'spread_pct': spread_pct, 'state': state,
+                                'threshold': None if state == 'normal' else limits[0 if state == 'below' else 1],
+                                'ts': ts}
+            if self.version is not None and state != previous:
+                changes.append(self.alerts[key])
+        return changes
+
+    def check(self):
+        """
+        数据版本变化时查询增量并广播，返回本次广播的消息数
+
+        以主库的数据版本判断有无写入（独立运行的采集脚本只写主库，不发布快照），
+        有变化时先发布快照再从快照读取增量。快照被最短间隔推迟时本次不广播，
+        补发后的下一次检查再推送。
+        """
+        with self._lock:
+            if get_data_version(get_connection()) == self.version:
+                return 0
+            refresh_snapshot()
+            version = get_data_version()
+            if version == self.version:
+                return 0
+            conn = get_read_connection()
+            messages = []
+            prices = self._price_changes()
+            if prices:
+                messages.append(('prices', prices))
+            points = self._new_points(conn)
+            if points:
+                messages.append(('spreads', {'columns': SPREAD_COLUMNS, 'points': points}))
+            messages += [('alert', alert) for alert in self._alert_changes(conn)]
+
+            baseline = self.version is None
+            self.version = version
+            if baseline:
+                return 0
+            for event, data in messages:
+                self.broadcaster.publish(event, data)
+            return len(messages)
+
+    def watch(self, interval=POLL_INTERVAL):
+        """后台循环检查数据版本（覆盖刷新流程之外的写入，如独立运行的采集脚本）"""
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"推送增量检查失败: {e}")
+            time.sleep(interval)
+
+    def start(self, interval=POLL_INTERVAL):
+        thread = threading.Thread(target=self.watch, args=(interval,), daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    import urllib.request
+
+    url = sys.argv[sys.argv.index('--url') + 1] if '--url' in sys.argv else 'http://localhost:8080/api/stream'
+    print("=" * 60)
+    print(f"订阅 {url}")
+    print("=" * 60)
+    try:
+        with urllib.request.urlopen(url) as resp:
+            event = 'message'
+            for raw in resp:
+                line = raw.decode('utf-8').rstrip('\n')
+                if line.startswith('event: '):
+                    event = line[7:]
+                elif line.startswith('data: '):
+                    data = line[6:]
+                    print(f"[{time.strftime('%H:%M:%S')}] {event}: {data[:200]}{'...' if len(data) > 200 else ''}")
+                    event = 'message'
+    except KeyboardInterrupt:
+        print("[OK] 已停止")
+    except Exception as e:
+        print(f"[X] 订阅失败: {e}")
+
+
+if __name__ == "__main__":
+    main()
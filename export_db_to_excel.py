@@ -1,37 +1,38 @@
-import sqlite3
 import pandas as pd
 import os
+from database import DB_FILE, PAIR_TABLES, BEIJING_OFFSET
+import query_backend
 
-DB_FILE = 'precious_metals.db'
 OUTPUT_FILE = 'precious_metals_data.xlsx'
 
 def export_to_excel():
     print(f"Reading database: {DB_FILE}")
-    conn = sqlite3.connect(DB_FILE)
-    
-    # 我们关注这两个新表
-    target_tables = ['platinum_pairs', 'palladium_pairs']
+    print(f"Query backend: {query_backend.get_backend()}")
     
     with pd.ExcelWriter(OUTPUT_FILE, engine='openpyxl') as writer:
-        for table in target_tables:
+        for metal, table in PAIR_TABLES.items():
             print(f"Exporting table: {table}")
             
             try:
-                # 获取该表中的所有 pair_name
-                query_pairs = f"SELECT DISTINCT pair_name FROM {table}"
-                df_pairs = pd.read_sql_query(query_pairs, conn)
+                # 一次扫描读出该品种所有配对（含冷数据归档），再按配对拆分
+                data = query_backend.load_pairs(metal)
+                data.insert(1, 'datetime', pd.to_datetime(data['ts'] + BEIJING_OFFSET, unit='s').dt.strftime('%Y-%m-%d %H:%M'))
+                
+                # Pt/Pd prefix
+                prefix = "Pt" if "platinum" in table else "Pd"
                 
-                pairs = df_pairs['pair_name'].tolist()
+                pairs = data['pair_name'].unique().tolist()
                 print(f"  Found pairs: {pairs}")
                 
-                for pair in pairs:
-                    # 读取每个配对的数据
-                    query = f"SELECT * FROM {table} WHERE pair_name = '{pair}' ORDER BY datetime DESC"
-                    df = pd.read_sql_query(query, conn)
+                if pairs:
+                    summary = query_backend.pair_summary(metal)
+                    summary.to_excel(writer, sheet_name=f"{prefix}_summary")
+                    print(f"  Saved sheet: {prefix}_summary")
+                
+                for pair, df in data.groupby('pair_name', sort=False):
+                    df = df.sort_values('ts', ascending=False)
                     
                     # Sheet name naming: Pt_2610-2601 or Pd_2606-2604
-                    # Pt/Pd prefix
-                    prefix = "Pt" if "platinum" in table else "Pd"
                     sheet_name = f"{prefix}_{pair}"
                     
                     # Ensure valid sheet name length (max 31)
@@ -43,7 +44,6 @@ def export_to_excel():
             except Exception as e:
                 print(f"  Error exporting {table}: {e}")
 
-    conn.close()
     print(f"\nCreated: {os.path.abspath(OUTPUT_FILE)}")
 
 if __name__ == "__main__":
@@ -7,141 +7,71 @@ import os
 os.environ['HTTP_PROXY'] = 'http://127.0.0.1:7890'
 os.environ['HTTPS_PROXY'] = 'http://127.0.0.1:7890'
 
-import sqlite3
 import akshare as ak
-import pandas as pd
 from datetime import datetime
 from tvDatafeed import TvDatafeed, Interval
+from database import get_connection, init_database, bulk_ingest_bars
+import backfill_planner
+import write_queue
 
-DB_FILE = 'precious_metals.db'
 OZ_TO_GRAM = 31.1035
 RATE = 7.04
 
 def init_contracts_table():
-    """创建各月份合约数据表"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # 广期所铂金各月份合约表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS gfex_platinum_contracts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            contract TEXT NOT NULL,
-            datetime TEXT NOT NULL,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            volume INTEGER,
-            hold INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(contract, datetime)
-        )
-    ''')
-    
-    # CME铂金各月份合约表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS cme_platinum_contracts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            contract TEXT NOT NULL,
-            datetime TEXT NOT NULL,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            volume INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(contract, datetime)
-        )
-    ''')
-    
-    # 创建索引
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_gfex_pt_contract ON gfex_platinum_contracts(contract, datetime)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cme_pt_contract ON cme_platinum_contracts(contract, datetime)')
-    
-    conn.commit()
-    conn.close()
+    """创建各月份合约数据表（表结构统一定义在 database.py）"""
+    init_database()
     print("[OK] 合约数据表初始化完成")
 
 def fetch_and_save_gfex(contracts):
-    """获取并保存广期所铂金合约数据"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
+    """获取并保存广期所铂金合约数据（库中小时线没有缺口的合约不抓取）"""
     for symbol in contracts:
-        print(f"\n正在获取广期所 {symbol}...")
+        plan = backfill_planner.plan_instrument(symbol)
+        if not plan['fetches']:
+            print(f"\n[OK] 广期所 {symbol} 无缺口，跳过")
+            continue
+        print(f"\n正在获取广期所 {symbol} (缺口 {len(plan['gaps'])} 个)...")
         try:
-            df = ak.futures_zh_minute_sina(symbol=symbol, period='60')
+            df = ak.futures_zh_minute_sina(symbol=symbol, period=plan['fetches'][0]['interval'])
             if df is None or len(df) == 0:
                 print(f"  [X] {symbol} 无数据")
                 continue
             
-            df['datetime'] = pd.to_datetime(df['datetime'])
-            count = 0
-            for _, row in df.iterrows():
-                cursor.execute('''
-                    INSERT OR REPLACE INTO gfex_platinum_contracts 
-                    (contract, datetime, open, high, low, close, volume, hold)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    symbol,
-                    row['datetime'].strftime('%Y-%m-%d %H:%M'),
-                    float(row['open']),
-                    float(row['high']),
-                    float(row['low']),
-                    float(row['close']),
-                    int(row['volume']) if pd.notna(row['volume']) else 0,
-                    int(row['hold']) if pd.notna(row['hold']) else 0
-                ))
-                count += 1
-            
-            conn.commit()
-            print(f"  [OK] {symbol}: 保存 {count} 条小时数据")
+            result = bulk_ingest_bars(symbol, df)
+            print(f"  [OK] {symbol}: 保存 {result['inserted'] + result['updated']} 条小时数据 "
+                  f"(新增 {result['inserted']}, 更新 {result['updated']}, 未变 {result['unchanged']}, 拒绝 {result['rejected']})")
         except Exception as e:
             print(f"  [X] {symbol} 获取失败: {e}")
-    
-    conn.close()
 
 def fetch_and_save_cme(tv, contracts):
-    """获取并保存CME铂金合约分钟数据 (使用 tvDatafeed 历史数据)"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    for symbol, desc in contracts:
-        print(f"\n正在获取CME {symbol} ({desc}) 分钟数据...")
-        try:
-            # 获取分钟级数据，最多 5000 条
-            df = tv.get_hist(symbol=symbol, exchange='NYMEX', 
-                            interval=Interval.in_1_minute, n_bars=5000)
-            if df is None or len(df) == 0:
-                print(f"  [X] {symbol} 无数据")
-                continue
-            
-            df = df.sort_index()
-            count = 0
-            for idx, row in df.iterrows():
-                cursor.execute('''
-                    INSERT OR REPLACE INTO cme_platinum_contracts 
-                    (contract, datetime, open, high, low, close, volume)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    symbol,
-                    idx.strftime('%Y-%m-%d %H:%M'),
-                    float(row['open']),
-                    float(row['high']),
-                    float(row['low']),
-                    float(row['close']),
-                    int(row['volume']) if pd.notna(row.get('volume', 0)) else 0
-                ))
-                count += 1
-            
-            conn.commit()
-            print(f"  [OK] {symbol}: 保存 {count} 条分钟数据")
-        except Exception as e:
-            print(f"  [X] {symbol} 获取失败: {e}")
-    
-    conn.close()
+    """
+    获取并保存CME铂金合约分钟数据 (使用 tvDatafeed 历史数据)
 
+    按 backfill_planner 的计划只抓缺口: 条数刚好够到最早的缺口，1分钟线够不到的
+    旧缺口用更粗的周期补，粗周期K线只写入缺口内的部分。
+    """
+    for symbol, desc in contracts:
+        plan = backfill_planner.plan_instrument(symbol)
+        if not plan['fetches']:
+            print(f"\n[OK] CME {symbol} ({desc}) 无缺口，跳过")
+            continue
+        print(f"\n正在获取CME {symbol} ({desc}) 缺口数据 (缺口 {len(plan['gaps'])} 个，约 {plan['missing']} 根)...")
+        for fetch in plan['fetches']:
+            try:
+                df = tv.get_hist(symbol=symbol, exchange='NYMEX',
+                                interval=getattr(Interval, fetch['interval']), n_bars=fetch['n_bars'])
+                if df is None or len(df) == 0:
+                    print(f"  [X] {symbol} {fetch['interval']} 无数据")
+                    continue
+                
+                df = df.sort_index()
+                if fetch['step'] > plan['step']:
+                    df = df[backfill_planner.in_gaps(df.index, fetch['gaps'])]
+                result = bulk_ingest_bars(symbol, df)
+                print(f"  [OK] {symbol} {fetch['interval']} × {fetch['n_bars']}: "
+                      f"保存 {result['inserted'] + result['updated']} 条 "
+                      f"(新增 {result['inserted']}, 更新 {result['updated']}, 未变 {result['unchanged']}, 拒绝 {result['rejected']})")
+            except Exception as e:
+                print(f"  [X] {symbol} {fetch['interval']} 获取失败: {e}")
 
 def fetch_realtime_with_scraper(contracts):
     """使用 TradingView 爬虫获取实时价格和实际时间戳"""
@@ -151,9 +81,6 @@ def fetch_realtime_with_scraper(contracts):
         print("  [!] tv_scraper 模块未找到，跳过实时爬取")
         return {}
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
     scraper = TradingViewScraper()
     results = {}
     
@@ -171,26 +98,20 @@ def fetch_realtime_with_scraper(contracts):
                     time_str = datetime.now().strftime('%Y-%m-%d %H:%M')
                     print(f"    [!] 未获取到数据时间，使用当前时间: {time_str}")
                 
-                cursor.execute('''
-                    INSERT OR REPLACE INTO cme_platinum_contracts 
-                    (contract, datetime, open, high, low, close, volume)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (symbol, time_str, price, price, price, price, 0))
+                write_queue.put_bar(symbol, time_str, price, price, price, price)
                 print(f"    [OK] {symbol}: ${price} @ {time_str} (已保存)")
             else:
                 print(f"    [X] {symbol}: 获取失败")
-        
-        conn.commit()
     finally:
         scraper.close()
-        conn.close()
+        write_queue.flush()
     
     return results
 
 
 def show_summary():
     """显示数据库中的合约数据统计"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     print("\n" + "=" * 70)
@@ -218,8 +139,6 @@ def show_summary():
     ''')
     for row in cursor.fetchall():
         print(f"  {row[0]}: {row[1]:>5} 条 | {row[2]} ~ {row[3]}")
-    
-    conn.close()
 
 def main():
     print("=" * 70)
@@ -4,7 +4,7 @@
 import time
 import pandas as pd
 from datetime import datetime
-import json
+from json_artifacts import write_json
 import akshare as ak
 
 from selenium import webdriver
@@ -202,8 +202,7 @@ def main():
             'contracts': results,
         }
         
-        with open('contract_convergence_data.json', 'w', encoding='utf-8') as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
+        write_json('contract_convergence_data.json', output)
         
         print(f"\n{'='*60}")
         print("✓ 数据已保存到 contract_convergence_data.json")
@@ -1,12 +1,7 @@
 import akshare as ak
 from tvDatafeed import TvDatafeed, Interval
-import pandas as pd
-import sqlite3
 import time
-from datetime import datetime, timedelta
-
-# 数据库文件
-DB_FILE = 'precious_metals.db'
+from database import bulk_ingest_bars
 
 # 目标合约列表 (2025-12基准)
 # 广期所: 偶数月份
@@ -21,73 +16,13 @@ CME_CONTRACTS = {
 }
 
 def save_gfex_data(contract, df):
-    if df is None or df.empty:
-        return 0
-        
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    count = 0
-    
-    for _, row in df.iterrows():
-        try:
-            # 转换时间格式
-            dt_str = str(row['datetime']) # 已经是YYYY-MM-DD HH:MM:SS
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO gfex_palladium_contracts 
-                (contract, datetime, open, high, low, close, volume, hold)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                contract, dt_str,
-                float(row['open']), float(row['high']),
-                float(row['low']), float(row['close']),
-                int(row['volume']), int(row.get('hold', 0))
-            ))
-            count += 1
-        except Exception as e:
-            # print(f"Error saving {contract}: {e}")
-            pass
-            
-    conn.commit()
-    conn.close()
-    return count
+    result = bulk_ingest_bars(contract, df)
+    return result['inserted'] + result['updated']
 
 def save_cme_data(contract, df):
-    if df is None or df.empty:
-        return 0
-        
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    count = 0
-    
-    for idx, row in df.iterrows():
-        try:
-            # 处理时间 (CME数据是UTC时间，需要+8转北京时间，且注意tvDatafeed特性)
-            # tvDatafeed返回的index是datetime对象
-            # 这里统一加8小时转为北京时间
-            # 但之前的经验显示，TvDatafeed获取的特定合约可能需要特殊处理
-            # 暂时假设直接+8小时
-            
-            dt = idx + timedelta(hours=8)
-            dt_str = dt.strftime('%Y-%m-%d %H:%M:%S')
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO cme_palladium_contracts 
-                (contract, datetime, open, high, low, close, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                contract, dt_str,
-                float(row['open']), float(row['high']),
-                float(row['low']), float(row['close']),
-                int(row['volume'])
-            ))
-            count += 1
-        except Exception as e:
-            pass
-            
-    conn.commit()
-    conn.close()
-    return count
+    # CME数据是UTC时间，加8小时转为北京时间
+    result = bulk_ingest_bars(contract, df, offset_hours=8)
+    return result['inserted'] + result['updated']
 
 def main():
     print("="*50)
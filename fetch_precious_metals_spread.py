@@ -7,7 +7,7 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import json
+from json_artifacts import write_json
 import akshare as ak
 
 # 常量
@@ -150,8 +150,7 @@ def main():
                 'history': history
             }
         
-        with open('precious_metals_spread_history.json', 'w', encoding='utf-8') as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
+        write_json('precious_metals_spread_history.json', output)
         
         print(f"\n✓ 数据已保存到 precious_metals_spread_history.json")
     else:
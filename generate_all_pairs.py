@@ -11,13 +11,12 @@ if platform.system() == 'Windows':
     os.environ['HTTP_PROXY'] = 'http://127.0.0.1:7890'
     os.environ['HTTPS_PROXY'] = 'http://127.0.0.1:7890'
 
-import json
+from json_artifacts import write_json
 import akshare as ak
 import pandas as pd
-import numpy as np
 from datetime import datetime
 from tvDatafeed import TvDatafeed, Interval
-from database import init_database, save_pair_history, get_pair_history
+from database import init_database, save_pair_history, get_pair_history, get_pair_json_stats, load_bars
 from alert_manager import check_and_alert
 
 OZ_TO_GRAM = 31.1035
@@ -49,31 +48,16 @@ def fetch_gfex_data(symbol):
         return None
 
 
-import sqlite3
-DB_FILE = 'precious_metals.db'
-
 def fetch_cme_data(tv, symbol):
     """从数据库获取CME分钟数据"""
     try:
-        conn = sqlite3.connect(DB_FILE)
         # 读取最近 5000 条数据
-        query = f'''
-            SELECT datetime, open, high, low, close, volume 
-            FROM cme_platinum_contracts 
-            WHERE contract = '{symbol}'
-            ORDER BY datetime DESC
-            LIMIT 5000
-        '''
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        df = load_bars(symbol, limit=5000)
         
-        if df is None or len(df) == 0:
+        if len(df) == 0:
             print(f"  ✗ 数据库中无 {symbol} 数据")
             return None
-            
-        df['datetime'] = pd.to_datetime(df['datetime'])
-        df = df.set_index('datetime').sort_index()
-        return df
+        return df.drop(columns=['hold'])
     except Exception as e:
         print(f"  ✗ 数据库读取 {symbol} 失败: {e}")
         return None
@@ -166,7 +150,6 @@ def main():
             history = calculate_spread(gfex_data[gfex_sym], cme_data[cme_sym], gfex_sym, cme_sym)
             
             if len(history) > 0:
-                spreads = [h['spread_pct'] for h in history]
                 latest = history[-1]
                 
                 pair_data = {
@@ -182,32 +165,24 @@ def main():
                         'spread': latest['spread'],
                         'spread_pct': latest['spread_pct']
                     },
-                    'stats': {
-                        'avg_spread_pct': float(np.mean(spreads)),
-                        'max_spread_pct': float(np.max(spreads)),
-                        'min_spread_pct': float(np.min(spreads))
-                    },
+                    'stats': None,
                     'history': history
                 }
                 
                 all_pairs[pair_name] = pair_data
                 
                 # 保存到数据库
-                save_pair_history('platinum', pair_name, gfex_sym, cme_sym, history)
+                saved = save_pair_history('platinum', pair_name, gfex_sym, cme_sym, history)
                 
                 # 从数据库读取完整历史（包括导入的小时级数据）
                 db_history = get_pair_history('platinum', pair_name)
                 if db_history:
                     pair_data['history'] = db_history
-                    # 重新计算统计数据
-                    all_spreads = [h['spread_pct'] for h in db_history]
-                    pair_data['stats'] = {
-                        'avg_spread_pct': float(np.mean(all_spreads)),
-                        'max_spread_pct': float(np.max(all_spreads)),
-                        'min_spread_pct': float(np.min(all_spreads))
-                    }
+                # 统计数据由写入路径维护，直接读取
+                pair_data['stats'] = get_pair_json_stats('platinum', pair_name)
                 
-                print(f"  [OK] {pair_name}: {len(pair_data['history'])} 条数据, 当前价差: {latest['spread_pct']:+.2f}%")
+                print(f"  [OK] {pair_name}: {len(pair_data['history'])} 条数据, 当前价差: {latest['spread_pct']:+.2f}% "
+                      f"(写入 {saved['inserted'] + saved['updated']} 条变化, {saved['unchanged']} 条未变)")
                 
                 # 检查报警
                 check_and_alert(
@@ -224,8 +199,7 @@ def main():
         'pairs': all_pairs
     }
     
-    with open('platinum_all_pairs.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_json('platinum_all_pairs.json', output)
     
     print("\n" + "=" * 80)
     print("配对汇总")
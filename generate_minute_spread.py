@@ -9,7 +9,7 @@ import os
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import json
+from json_artifacts import write_json
 import akshare as ak
 
 # 设置代理 (TradingView需要)
@@ -172,15 +172,13 @@ def main():
     # 生成铂金数据
     pt_data = generate_spread_data('platinum', period='60')  # 使用60分钟便于测试
     if pt_data:
-        with open('platinum_spread_analysis.json', 'w', encoding='utf-8') as f:
-            json.dump(pt_data, f, ensure_ascii=False, indent=2)
+        write_json('platinum_spread_analysis.json', pt_data)
         print(f"\n✓ 铂金数据已保存到 platinum_spread_analysis.json")
     
     # 生成钯金数据
     pd_data = generate_spread_data('palladium', period='60')
     if pd_data:
-        with open('palladium_spread_analysis.json', 'w', encoding='utf-8') as f:
-            json.dump(pd_data, f, ensure_ascii=False, indent=2)
+        write_json('palladium_spread_analysis.json', pd_data)
         print(f"\n✓ 钯金数据已保存到 palladium_spread_analysis.json")
 
 
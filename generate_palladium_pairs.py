@@ -11,14 +11,13 @@ if platform.system() == 'Windows':
     os.environ['HTTP_PROXY'] = 'http://127.0.0.1:7890'
     os.environ['HTTPS_PROXY'] = 'http://127.0.0.1:7890'
 
-import json
+from json_artifacts import write_json
 import akshare as ak
 import pandas as pd
-import numpy as np
 from datetime import datetime
 from tvDatafeed import TvDatafeed, Interval
 import time
-from database import save_pair_history, get_pair_history
+from database import save_pair_history, get_pair_history, get_pair_json_stats
 from alert_manager import check_and_alert
 
 OZ_TO_GRAM = 31.1035
@@ -158,7 +157,6 @@ def main():
             history = calculate_spread(gfex_data[gfex_sym], cme_data[cme_sym], gfex_sym, cme_sym)
             
             if len(history) > 0:
-                spreads = [h['spread_pct'] for h in history]
                 latest = history[-1]
                 
                 pair_data = {
@@ -174,32 +172,24 @@ def main():
                         'spread': latest['spread'],
                         'spread_pct': latest['spread_pct']
                     },
-                    'stats': {
-                        'avg_spread_pct': float(np.mean(spreads)),
-                        'max_spread_pct': float(np.max(spreads)),
-                        'min_spread_pct': float(np.min(spreads))
-                    },
+                    'stats': None,
                     'history': history
                 }
                 
                 all_pairs[pair_name] = pair_data
                 
                 # 保存到数据库
-                save_pair_history('palladium', pair_name, gfex_sym, cme_sym, history)
+                saved = save_pair_history('palladium', pair_name, gfex_sym, cme_sym, history)
                 
                 # 从数据库读取完整历史（包括导入的小时级数据）
                 db_history = get_pair_history('palladium', pair_name)
                 if db_history:
                     pair_data['history'] = db_history
-                    # 重新计算统计数据
-                    all_spreads = [h['spread_pct'] for h in db_history]
-                    pair_data['stats'] = {
-                        'avg_spread_pct': float(np.mean(all_spreads)),
-                        'max_spread_pct': float(np.max(all_spreads)),
-                        'min_spread_pct': float(np.min(all_spreads))
-                    }
+                # 统计数据由写入路径维护，直接读取
+                pair_data['stats'] = get_pair_json_stats('palladium', pair_name)
                 
-                print(f"  [OK] {pair_name}: {len(pair_data['history'])} 条数据, 当前价差: {latest['spread_pct']:+.2f}%")
+                print(f"  [OK] {pair_name}: {len(pair_data['history'])} 条数据, 当前价差: {latest['spread_pct']:+.2f}% "
+                      f"(写入 {saved['inserted'] + saved['updated']} 条变化, {saved['unchanged']} 条未变)")
                 
                 # 检查报警
                 check_and_alert(
@@ -216,8 +206,7 @@ def main():
         'pairs': all_pairs
     }
     
-    with open('palladium_all_pairs.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_json('palladium_all_pairs.json', output)
     
     print("\n" + "=" * 80)
     print("配对汇总")
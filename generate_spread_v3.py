@@ -8,7 +8,7 @@ import os
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import json
+from json_artifacts import write_json
 import akshare as ak
 
 # 设置代理
@@ -176,15 +176,13 @@ def main():
     # 铂金
     pt_data = generate_spread_data('platinum')
     if pt_data:
-        with open('platinum_spread_analysis.json', 'w', encoding='utf-8') as f:
-            json.dump(pt_data, f, ensure_ascii=False, indent=2)
+        write_json('platinum_spread_analysis.json', pt_data)
         print(f"\n✓ platinum_spread_analysis.json ({len(pt_data['history'])} 条)")
     
     # 钯金
     pd_data = generate_spread_data('palladium')
     if pd_data:
-        with open('palladium_spread_analysis.json', 'w', encoding='utf-8') as f:
-            json.dump(pd_data, f, ensure_ascii=False, indent=2)
+        write_json('palladium_spread_analysis.json', pd_data)
         print(f"\n✓ palladium_spread_analysis.json ({len(pd_data['history'])} 条)")
     
     # 价格数据 - 用于前端和套利计算器
@@ -220,8 +218,7 @@ def main():
                 'pd_spread_pct': pd_last['spread_pct']
             }
         }
-        with open('prices_data.json', 'w', encoding='utf-8') as f:
-            json.dump(prices_data, f, ensure_ascii=False, indent=2)
+        write_json('prices_data.json', prices_data)
         print(f"\n✓ prices_data.json 已更新")
 
 
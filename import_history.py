@@ -1,10 +1,10 @@
 import os
 import platform
-import sqlite3
 import pandas as pd
 import akshare as ak
 from tvDatafeed import TvDatafeed, Interval
-from database import DB_FILE, save_pair_history
+from database import bulk_ingest_spreads
+import backfill_planner
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -59,10 +59,10 @@ def fetch_gfex_hourly(symbol):
         print(f"  Error fetching GFEX {symbol}: {e}")
         return None
 
-def fetch_cme_hourly(tv, symbol):
+def fetch_cme_hourly(tv, symbol, n_bars):
     try:
-        # Use n_bars=1000 to cover enough hourly history (1000 hours ~ 40 days)
-        df = tv.get_hist(symbol=symbol, exchange='NYMEX', interval=Interval.in_1_hour, n_bars=1000)
+        # n_bars comes from the backfill plan: just enough to reach the oldest gap
+        df = tv.get_hist(symbol=symbol, exchange='NYMEX', interval=Interval.in_1_hour, n_bars=n_bars)
         if df is None or df.empty:
             return None
         df.index = pd.to_datetime(df.index)
@@ -74,36 +74,14 @@ def fetch_cme_hourly(tv, symbol):
         return None
 
 def save_hourly_history(metal, pair_name, gfex_contract, cme_contract, history):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    table = 'platinum_pairs' if metal == 'platinum' else 'palladium_pairs'
-    
-    count = 0
-    for item in history:
-        try:
-            # Use INSERT OR IGNORE to respect existing minute data
-            cursor.execute(f'''
-                INSERT OR IGNORE INTO {table} 
-                (pair_name, gfex_contract, cme_contract, datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (pair_name, gfex_contract, cme_contract, 
-                  item['date'], item['gfex_price'], item['cme_usd'], item['cme_cny'], 
-                  item['spread'], item['spread_pct']))
-            if cursor.rowcount > 0:
-                count += 1
-        except Exception as e:
-            # print(e)
-            pass
-    
-    conn.commit()
-    conn.close()
-    return count
+    # Use IGNORE to respect existing minute data
+    result = bulk_ingest_spreads(metal, pair_name, gfex_contract, cme_contract, history, conflict='IGNORE')
+    return result['inserted']
 
-def fetch_fx_hourly(tv):
+def fetch_fx_hourly(tv, n_bars):
     try:
-        # Fetch USDCNH hourly data
-        # n_bars=1000 to cover the whole month
-        df = tv.get_hist(symbol='USDCNH', exchange='FX_IDC', interval=Interval.in_1_hour, n_bars=1000)
+        # Fetch USDCNH hourly data back to the oldest gap
+        df = tv.get_hist(symbol='USDCNH', exchange='FX_IDC', interval=Interval.in_1_hour, n_bars=n_bars)
         if df is None or df.empty:
             print("  Warning: USDCNH data empty. Using static rate.")
             return None
@@ -115,11 +93,32 @@ def fetch_fx_hourly(tv):
         print(f"  Error fetching FX data: {e}")
         return None
 
+def plan_metal(metal_name, gfex_symbols, cme_map):
+    # Only pairs with gaps in the stored hourly history need fetching
+    plans = {}
+    for g_sym in gfex_symbols:
+        for c_code, c_sym in cme_map.items():
+            plan = backfill_planner.plan_pair(metal_name, f"{g_sym[-4:]}-{c_code}")
+            if plan['fetches']:
+                plans[g_sym, c_sym] = plan
+    return plans
+
 def process_metal(metal_name, gfex_symbols, cme_map, tv, default_rate):
     print(f"\nProcessing {metal_name}...")
     
+    plans = plan_metal(metal_name, gfex_symbols, cme_map)
+    if not plans:
+        print("  No gaps in stored hourly history, skipping.")
+        return
+    print(f"  {len(plans)} pairs have gaps.")
+    gfex_symbols = [s for s in gfex_symbols if any(g == s for g, _ in plans)]
+    cme_bars = {}
+    for (g_sym, c_sym), plan in plans.items():
+        cme_bars[c_sym] = max(cme_bars.get(c_sym, 0), plan['fetches'][0]['n_bars'])
+    since = min(backfill_planner.oldest_gap(plan) for plan in plans.values())
+    
     # 0. Fetch FX data
-    fx_df = fetch_fx_hourly(tv)
+    fx_df = fetch_fx_hourly(tv, backfill_planner.bars_needed('FX', since, 3600))
     if fx_df is not None:
         print(f"  Fetched {len(fx_df)} FX rate records.")
     else:
@@ -135,8 +134,10 @@ def process_metal(metal_name, gfex_symbols, cme_map, tv, default_rate):
             
     cme_data = {}
     for k, v in cme_map.items():
-        print(f"  Fetching CME {v}...")
-        df = fetch_cme_hourly(tv, v)
+        if v not in cme_bars:
+            continue
+        print(f"  Fetching CME {v} ({cme_bars[v]} bars)...")
+        df = fetch_cme_hourly(tv, v, cme_bars[v])
         if df is not None:
             cme_data[v] = df
             
@@ -146,7 +147,7 @@ def process_metal(metal_name, gfex_symbols, cme_map, tv, default_rate):
         for c_code, c_sym in cme_map.items():
             pair_name = f"{g_expiry}-{c_code}"
             
-            if c_sym not in cme_data:
+            if (g_sym, c_sym) not in plans or c_sym not in cme_data:
                 continue
                 
             df_g = gfex_data[g_sym].copy()
@@ -0,0 +1,116 @@
+"""
+仪表盘静态 JSON 及其预压缩版本
+platinum_all_pairs.json 等由前端直接下载的 JSON 文件，写入时同时生成 .gz / .br 兄弟文件，
+API 服务器按 Accept-Encoding 直接发送压缩好的文件，不必每次请求再压缩几 MB 的数据。
+  - 先写临时文件再替换，服务器不会读到写了一半的文件；
+  - 兄弟文件比 JSON 旧（例如 VPS 上 git pull 只更新了 .json）时视为过期，服务器改为现场压缩；
+  - brotli 为可选依赖 (pip install brotli)，未安装时只生成 .gz。
+用法: python json_artifacts.py [文件 ...]   # 为已有的 JSON 补生成压缩文件，默认处理仪表盘用到的文件
+"""
+import gzip
+import json
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 仪表盘直接下载的 JSON 文件
+DASHBOARD_FILES = [
+    'platinum_all_pairs.json',
+    'palladium_all_pairs.json',
+    'precious_metals_spread_history.json',
+    'contract_convergence_data.json',
+    'prices_data.json',
+]
+
+# 编码 -> 兄弟文件后缀，按优先顺序排列
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# 预压缩文件只生成一次，用最高压缩级别；API 响应现场压缩用较快的级别
+ARTIFACT_LEVELS = {'br': 11, 'gzip': 9}
+RESPONSE_LEVELS = {'br': 5, 'gzip': 6}
+
+
+def encodings():
+    """本机可用的压缩编码（按优先顺序）"""
+    return [encoding for encoding in SUFFIXES if encoding != 'br' or brotli is not None]
+
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=RESPONSE_LEVELS['br'] if level is None else level)
+    return gzip.compress(data, compresslevel=RESPONSE_LEVELS['gzip'] if level is None else level, mtime=0)
+
+
+def _atomic_write(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_compressed(path, raw=None):
+    """为 path 生成全部可用编码的兄弟文件，返回 {编码: 压缩后字节数}"""
+    if raw is None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    sizes = {}
+    for encoding in encodings():
+        data = compress(raw, encoding, ARTIFACT_LEVELS[encoding])
+        _atomic_write(path + SUFFIXES[encoding], data)
+        sizes[encoding] = len(data)
+    return sizes
+
+
+def write_json(path, data, indent=2):
+    """写入 JSON（格式同原来的 json.dump(..., ensure_ascii=False, indent=2)）并生成压缩版本"""
+    raw = json.dumps(data, ensure_ascii=False, indent=indent).encode('utf-8')
+    _atomic_write(path, raw)
+    write_compressed(path, raw)
+
+
+def fresh_sibling(path, encoding):
+    """path 的某个编码的兄弟文件，不存在或比原文件旧时返回 None"""
+    sibling = path + SUFFIXES[encoding]
+    try:
+        if os.stat(sibling).st_mtime_ns >= os.stat(path).st_mtime_ns:
+            return sibling
+    except OSError:
+        pass
+    return None
+
+
+def refresh_stale(paths=DASHBOARD_FILES):
+    """为缺少或过期兄弟文件的 JSON 重新生成压缩版本，返回处理过的文件列表"""
+    refreshed = []
+    for path in paths:
+        if os.path.isfile(path) and any(fresh_sibling(path, encoding) is None for encoding in encodings()):
+            write_compressed(path)
+            refreshed.append(path)
+    return refreshed
+
+
+def main():
+    print("=" * 60)
+    print("生成预压缩 JSON")
+    print("=" * 60)
+
+    if brotli is None:
+        print("[!] 未安装 brotli (pip install brotli)，只生成 .gz")
+    paths = sys.argv[1:] or DASHBOARD_FILES
+    for path in paths:
+        if not os.path.isfile(path):
+            print(f"  [X] {path} 不存在")
+            continue
+        size = os.path.getsize(path)
+        sizes = write_compressed(path)
+        detail = ', '.join(f"{encoding} {n / 1024:.0f}KB ({size / max(n, 1):.0f}x)" for encoding, n in sizes.items())
+        print(f"  ✓ {path}: {size / 1024:.0f}KB -> {detail}")
+    print("[OK] 完成")
+
+
+if __name__ == "__main__":
+    main()
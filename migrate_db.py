@@ -0,0 +1,51 @@
+"""
+数据库表结构迁移工具
+把现有 precious_metals.db 就地升级到 database.SCHEMA_VERSION，迁移前自动备份
+用法: python migrate_db.py [--no-backup]
+"""
+import os
+import sys
+import sqlite3
+from datetime import datetime
+from database import DB_FILE, SCHEMA_VERSION, get_connection, get_schema_version, migrate_database
+
+
+def backup_database():
+    """用 SQLite 在线备份接口复制一份完整数据库"""
+    backup_file = f"{DB_FILE}.{datetime.now().strftime('%Y%m%d_%H%M%S')}.bak"
+    target = sqlite3.connect(backup_file)
+    try:
+        get_connection().backup(target)
+    finally:
+        target.close()
+    return backup_file
+
+
+def main():
+    print("=" * 60)
+    print("数据库表结构迁移")
+    print("=" * 60)
+
+    if not os.path.exists(DB_FILE):
+        print(f"[X] 未找到数据库文件: {DB_FILE}")
+        return
+
+    version = get_schema_version()
+    print(f"当前版本: {version}  目标版本: {SCHEMA_VERSION}")
+    if version >= SCHEMA_VERSION:
+        print("[OK] 已是最新版本，无需迁移")
+        return
+
+    if '--no-backup' not in sys.argv:
+        print(f"[OK] 已备份到 {backup_database()}")
+
+    report = migrate_database()
+    for table, (before, after) in report.items():
+        note = f"  (去重/丢弃 {before - after} 条)" if after < before else ''
+        print(f"  {table:<28} {before:>8} -> {after:>8}{note}")
+
+    print(f"[OK] 迁移完成，当前版本: {get_schema_version()}")
+
+
+if __name__ == "__main__":
+    main()
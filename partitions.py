@@ -0,0 +1,155 @@
+"""
+年度分区
+把已结束年份的分钟级原始数据 (bars / platinum_pairs / palladium_pairs) 从 precious_metals.db
+移到按年拆分的 precious_metals_{年份}.db:
+  - 分区文件与主库表结构相同，写完后 VACUUM 一次、改为 DELETE 日志模式并设为只读文件；
+  - 查询由 database.attach_partitions 按时间区间以 immutable 方式 ATTACH（免锁、内存映射），
+    只挂载与区间相交的年份，主库保持小而浅的索引；
+  - 已分区的年份只读：写入路径跳过最新分区年末之前的行（database.cold_boundary），
+    重复抓取的旧数据不会再进主库；主库中早先留下的迟到数据，再次运行本脚本时并入分区。
+汇总表、统计、pair_latest 与 instruments 留在主库。archive.py（按月归档为 npz）只处理主库数据。
+用法: python partitions.py [--keep-years N] [--dry-run]
+"""
+import os
+import stat
+import sys
+from datetime import datetime
+
+from database import (
+    PAIR_TABLES, RESOLUTIONS, ROLLUP_LEVELS, TABLE_DEFINITIONS, TABLE_OPTIONS,
+    get_connection, partition_path, partition_years, year_range, from_epoch, bump_data_version,
+    _rollup_pairs, _rollup_bars, _rebuild_pair_stats,
+)
+
+PARTITIONED_TABLES = ['bars'] + list(PAIR_TABLES.values())
+
+
+def _stored_columns(conn, table, schema='main'):
+    """表中实际存储的列（排除 datetime 等生成列）"""
+    return [r[1] for r in conn.execute(f'PRAGMA {schema}.table_xinfo({table})') if r[6] == 0]
+
+
+def _set_writable(path, writable):
+    mode = os.stat(path).st_mode
+    write_bits = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+    os.chmod(path, (mode | stat.S_IWUSR) if writable else (mode & ~write_bits))
+
+
+def _rebuild_rollups(conn, start, end):
+    """重算主库中该年全部配对/合约的汇总桶（迟到数据并入分区前使用）"""
+    stamps = range(start, end, RESOLUTIONS[ROLLUP_LEVELS[0][0]])
+    for metal, table in PAIR_TABLES.items():
+        for (pair_name,) in conn.execute(
+                f'SELECT DISTINCT pair_name FROM main.{table} WHERE ts >= ? AND ts < ?', (start, end)).fetchall():
+            _rollup_pairs(conn, metal, pair_name, stamps)
+    for (instrument_id,) in conn.execute(
+            'SELECT DISTINCT instrument_id FROM main.bars WHERE ts >= ? AND ts < ?', (start, end)).fetchall():
+        _rollup_bars(conn, instrument_id, stamps)
+    _rebuild_pair_stats(conn)
+
+
+def partition_year(year, dry_run=False):
+    """
+    把一个年份的分钟级数据从主库移入该年分区，返回 {表名: 主库中该年的行数}
+
+    分区已存在时（之后又写入了迟到数据），先把分区数据放回主库合并（主库优先），
+    按完整数据重算该年汇总与统计，再整体重写分区。先提交分区写入、后从主库删除，
+    两步之间中断只会留下重复行（查询以主库为准），重新运行即可。
+    """
+    start, end = year_range(year)
+    conn = get_connection()
+    counts = {table: conn.execute(f'SELECT COUNT(*) FROM main.{table} WHERE ts >= ? AND ts < ?',
+                                  (start, end)).fetchone()[0]
+              for table in PARTITIONED_TABLES}
+    if not any(counts.values()) or dry_run:
+        return counts
+
+    path = partition_path(year)
+    existed = os.path.exists(path)
+    # 本连接上以 immutable 只读方式挂载的该年分区要先卸下
+    if f'y{year}' in [r[1] for r in conn.execute('PRAGMA database_list')]:
+        conn.execute(f'DETACH DATABASE y{year}')
+    if existed:
+        _set_writable(path, True)
+
+    conn.execute('ATTACH DATABASE ? AS part', (path,))
+    try:
+        conn.execute('PRAGMA part.journal_mode = DELETE')
+        for table in PARTITIONED_TABLES:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS part.{table} ({TABLE_DEFINITIONS[table]}) '
+                         f'{TABLE_OPTIONS.get(table, "")}')
+        # 旧版本建立的分区可能缺少后来新增的列（如配对表的 version），只搬两边都有的列
+        columns = {table: ', '.join(c for c in _stored_columns(conn, table)
+                                    if c in _stored_columns(conn, table, 'part'))
+                   for table in PARTITIONED_TABLES}
+
+        if existed:
+            with conn:
+                for table, cols in columns.items():
+                    conn.execute(f'INSERT OR IGNORE INTO main.{table} ({cols}) SELECT {cols} FROM part.{table}')
+                _rebuild_rollups(conn, start, end)
+
+        with conn:
+            for table, cols in columns.items():
+                conn.execute(f'DELETE FROM part.{table}')
+                conn.execute(f'''
+                    INSERT INTO part.{table} ({cols})
+                    SELECT {cols} FROM main.{table} WHERE ts >= ? AND ts < ?
+                ''', (start, end))
+        with conn:
+            for table in PARTITIONED_TABLES:
+                conn.execute(f'DELETE FROM main.{table} WHERE ts >= ? AND ts < ?', (start, end))
+            bump_data_version(conn)
+        conn.execute('VACUUM part')
+    finally:
+        conn.execute('DETACH DATABASE part')
+    _set_writable(path, False)
+    return counts
+
+
+def partition_closed_years(keep_years=0, dry_run=False):
+    """
+    把所有已结束年份移入年度分区
+
+    今年以及之前 keep_years 年保留在主库。返回 [(year, {表名: 行数})]。
+    """
+    cutoff = datetime.now().year - keep_years
+    conn = get_connection()
+    firsts = [conn.execute(f'SELECT MIN(ts) FROM main.{table}').fetchone()[0] for table in PARTITIONED_TABLES]
+    firsts = [ts for ts in firsts if ts is not None]
+    if not firsts:
+        return []
+
+    report = []
+    for year in range(int(from_epoch(min(firsts), '%Y')), cutoff):
+        counts = partition_year(year, dry_run)
+        if any(counts.values()):
+            report.append((year, counts))
+    return report
+
+
+def main():
+    print("=" * 60)
+    print("年度分区")
+    print("=" * 60)
+
+    keep_years = 0
+    if '--keep-years' in sys.argv:
+        keep_years = int(sys.argv[sys.argv.index('--keep-years') + 1])
+    dry_run = '--dry-run' in sys.argv
+
+    report = partition_closed_years(keep_years, dry_run)
+    for year, counts in report:
+        detail = ', '.join(f"{table} {rows}" for table, rows in counts.items() if rows)
+        print(f"  {year}: {detail}")
+    if not report:
+        print("  主库中没有需要分区的已结束年份")
+
+    if dry_run:
+        print(f"[OK] 预演完成，共 {len(report)} 个年份可移入分区（未做任何修改）")
+    else:
+        print(f"[OK] 分区完成，现有分区: {', '.join(map(str, sorted(partition_years()))) or '无'}")
+
+
+if __name__ == "__main__":
+    main()
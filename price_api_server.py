@@ -3,15 +3,35 @@
 提供广期所/CME贵金属价格的HTTP接口
 支持手动数据持久化存储
 支持从数据库读取配对数据
+用法: python price_api_server.py [--async] [--port 8080]
+      --async 使用 asyncio 服务器（keep-alive，单线程处理全部连接，阻塞工作交给有界线程池）
 """
-from http.server import HTTPServer, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
-import sqlite3
 import akshare as ak
 from datetime import datetime
+from email.utils import formatdate
+from urllib.parse import unquote
+import functools
+import hashlib
+import mimetypes
+import select
+import socket
 import pandas as pd
 import os
-from database import get_all_pairs, get_pair_history
+import sys
+from database import (get_all_pairs, get_pair_history, get_read_connection, day_range,
+                      get_data_version, enable_snapshot_reads, publish_snapshot, snapshot_pending,
+                      active_instruments, get_session_quotes, instrument_info, from_epoch, to_epoch,
+                      PAIR_TABLES, get_pair_changes, get_pair_json_stats)
+from backfill_planner import trading_day_bounds
+import read_cache
+import json_artifacts
+import columnar
+import event_stream
+import quote_aggregator
+import refresh_jobs
+from async_server import AsyncHTTPServer, Request, RequestStats
 import subprocess
 import platform
 import threading
@@ -23,9 +43,55 @@ MANUAL_DATA_FILE = 'manual_prices.json'
 # 全局刷新间隔（秒），默认2分钟
 REFRESH_INTERVAL = 120
 
-def run_data_sync():
-    """执行数据同步（Windows运行脚本，Linux拉取代码）"""
-    global last_refresh_time
+# 配对数据的实时来源：Windows 本地由采集脚本直接写库；Linux/VPS 同步时只 git pull 下 JSON 文件，
+# 库不在 git 中、可能过期或为空，仪表盘应读 *_all_pairs.json（/api/server-stats 中的 pairs_source）
+PAIRS_SOURCE = 'database' if platform.system() == 'Windows' else 'json'
+
+# 服务模式: threading（每个连接一个线程）或 asyncio（--async）
+SERVER_MODE = 'threading'
+request_stats = RequestStats()
+
+# 数据库查询走进程内缓存，数据版本变化（有新数据写入/发布新快照）前重复请求不再查库
+cached_all_pairs = read_cache.cached(get_all_pairs)
+cached_pair_history = read_cache.cached(get_pair_history)
+cached_pair_changes = read_cache.cached(get_pair_changes)
+cached_pair_stats = read_cache.cached(get_pair_json_stats)
+
+# 响应缓存：按 (路径, 查询参数, 数据版本) 保存编码好的 JSON 及其 gzip 版本，带强 ETag。
+# 仪表盘轮询时浏览器带 If-None-Match 重新验证，数据未变只回 304，不再查询、序列化与压缩
+RESPONSE_CACHE_BYTES = 128 * 1024 * 1024
+MIN_COMPRESS_BYTES = 1024         # 小于此大小的响应不压缩
+response_cache = read_cache.ReadCache(RESPONSE_CACHE_BYTES)
+
+# 值得压缩的静态文件类型（图片、xlsx 等本身已压缩）
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+# 推送：数据版本变化时只计算一次增量（最新价、新增价差点、警报），广播给全部 /api/stream 连接
+broadcaster = event_stream.Broadcaster()
+change_feed = event_stream.ChangeFeed(broadcaster, {
+    'cme': lambda: query_exchange_latest('CME', session_key()),
+    'gfex': lambda: query_exchange_latest('GFEX', session_key()),
+})
+
+# 数据同步任务队列：手动刷新、定时调度与启动时的同步共用一个工作线程，不会重叠；
+# 任务开始/结束时通过推送广播状态
+jobs = refresh_jobs.JobManager(on_change=lambda job: broadcaster.publish('job', job.to_dict()))
+
+# 实时报价：各数据源按自己的 TTL（秒）在后台并行刷新，/api/prices 直接读内存
+QUOTE_TTLS = {'gfex': 10, 'cme': 30, 'exchange_rate': 600}
+quotes = quote_aggregator.QuoteAggregator({
+    'gfex': (lambda: get_gfex_prices(), QUOTE_TTLS['gfex']),
+    'cme': (lambda: get_cme_prices(), QUOTE_TTLS['cme']),
+    'exchange_rate': (lambda: get_exchange_rate(), QUOTE_TTLS['exchange_rate']),
+})
+
+def run_data_sync(job=None):
+    """
+    执行数据同步（Windows运行脚本，Linux拉取代码）
+
+    job 为 refresh_jobs.Job 时记录各阶段耗时；应通过 jobs 队列调用（submit_sync），保证同步不重叠。
+    """
+    stage = job.stage if job is not None else refresh_jobs.untimed_stage
     
     is_windows = platform.system() == 'Windows'
     python_cmd = 'python' if is_windows else 'python3'
@@ -39,35 +105,55 @@ def run_data_sync():
             print("  [Windows] 运行数据采集脚本...")
             
             # 1. 更新铂金
-            p1 = subprocess.run([python_cmd, 'generate_all_pairs.py'], capture_output=True, text=True)
-            if p1.returncode != 0:
-                print(f"铂金更新失败: {p1.stderr}")
-                raise Exception(f"铂金更新失败: {p1.stderr}")
+            with stage('generate_all_pairs'):
+                p1 = subprocess.run([python_cmd, 'generate_all_pairs.py'], capture_output=True, text=True)
+                if p1.returncode != 0:
+                    print(f"铂金更新失败: {p1.stderr}")
+                    raise Exception(f"铂金更新失败: {p1.stderr}")
             
             # 2. 更新钯金
-            p2 = subprocess.run([python_cmd, 'generate_palladium_pairs.py'], capture_output=True, text=True)
-            if p2.returncode != 0:
-                print(f"钯金更新失败: {p2.stderr}")
-                raise Exception(f"钯金更新失败: {p2.stderr}")
+            with stage('generate_palladium_pairs'):
+                p2 = subprocess.run([python_cmd, 'generate_palladium_pairs.py'], capture_output=True, text=True)
+                if p2.returncode != 0:
+                    print(f"钯金更新失败: {p2.stderr}")
+                    raise Exception(f"钯金更新失败: {p2.stderr}")
             
             # 3. 独立存储CME数据（不依赖广期所交易时间）
-            p3 = subprocess.run([python_cmd, 'fetch_2026_contracts.py'], capture_output=True, text=True)
-            if p3.returncode != 0:
-                print(f"CME独立存储失败: {p3.stderr}")
-                # 不抛异常，CME存储失败不阻断整体流程
+            with stage('fetch_2026_contracts') as record:
+                p3 = subprocess.run([python_cmd, 'fetch_2026_contracts.py'], capture_output=True, text=True)
+                if p3.returncode != 0:
+                    print(f"CME独立存储失败: {p3.stderr}")
+                    # 不抛异常，CME存储失败不阻断整体流程
+                    record['error'] = p3.stderr[-500:]
                 
             message = '数据已更新（本地采集）'
         else:
             # Linux/VPS：从GitHub拉取最新数据
             print("  [Linux/VPS] 从GitHub拉取最新数据...")
             
-            p = subprocess.run(['git', 'pull', 'origin', 'master'], capture_output=True, text=True)
-            if p.returncode != 0:
-                print(f"git pull 失败: {p.stderr}")
-                raise Exception(f"git pull 失败: {p.stderr}")
+            with stage('git_pull'):
+                p = subprocess.run(['git', 'pull', 'origin', 'master'], capture_output=True, text=True)
+                if p.returncode != 0:
+                    print(f"git pull 失败: {p.stderr}")
+                    raise Exception(f"git pull 失败: {p.stderr}")
             
             # print(f"  git pull 输出: {p.stdout}")
+            # git 只同步 .json，预压缩文件在本机重新生成
+            with stage('compress_json'):
+                json_artifacts.refresh_stale()
             message = '数据已同步（从GitHub拉取）'
+        
+        # 发布新的只读快照，API 请求随即切换到最新数据（数据没变时跳过，距上次发布太近时推迟到间隔满）
+        with stage('publish_snapshot') as record:
+            if publish_snapshot() is None:
+                record['skipped'] = 'deferred' if snapshot_pending() else 'unchanged'
+        # 立即推送增量（不等后台检查）；CME 报价来自数据库，随之刷新
+        try:
+            with stage('push_changes'):
+                change_feed.check()
+        except Exception as e:
+            print(f"推送增量失败: {e}")
+        quotes.refresh('cme')
             
         print(f"[{datetime.now().strftime('%H:%M:%S')}] 同步成功: {message}")
         return True, message
@@ -75,8 +161,14 @@ def run_data_sync():
         print(f"[{datetime.now().strftime('%H:%M:%S')}] 同步失败: {e}")
         return False, str(e)
 
+
+def submit_sync(source):
+    """把一次数据同步放进任务队列，已有同步在排队时并入该任务（执行中则排在其后），返回 (任务, 是否新建)"""
+    return jobs.submit('sync', run_data_sync, source=source)
+
+
 def auto_refresh_scheduler():
-    """后台定时刷新任务，使用全局REFRESH_INTERVAL"""
+    """后台定时刷新任务，使用全局REFRESH_INTERVAL；与手动刷新共用任务队列，不会重叠执行"""
     global REFRESH_INTERVAL
     print(f"启动自动刷新调度器，初始间隔 {REFRESH_INTERVAL} 秒")
     while True:
@@ -85,378 +177,748 @@ def auto_refresh_scheduler():
             current_interval = REFRESH_INTERVAL
             time.sleep(current_interval)
             print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 触发定时自动更新 (间隔{current_interval}秒)...")
-            run_data_sync()
+            # 等本轮结束再开始计时，间隔从同步完成时算起
+            job, _ = submit_sync('scheduler')
+            job.wait()
         except Exception as e:
             print(f"定时更新出错: {e}")
 
 
+# ==================== 路由（与传输方式无关） ====================
+# 每个处理函数接收 async_server.Request，返回 (状态码, 响应头, 响应体)。
+# 线程模式 (PriceAPIHandler) 与 asyncio 模式 (async_server.AsyncHTTPServer) 共用。
 
-class PriceAPIHandler(SimpleHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/api/prices':
-            self.send_price_data()
-        elif self.path == '/api/saved-prices':
-            self.send_saved_prices()
-        elif self.path == '/api/platinum-pairs':
-            self.send_pairs_data('platinum')
-        elif self.path == '/api/palladium-pairs':
-            self.send_pairs_data('palladium')
-        elif self.path.startswith('/api/pair-history'):
-            self.send_pair_history()
-        elif self.path == '/api/cme-latest':
-            self.send_cme_latest()
-        elif self.path == '/api/gfex-latest':
-            self.send_gfex_latest()
-        elif self.path == '/api/alert-config':
-            self.send_alert_config()
-        elif self.path == '/api/refresh-interval':
-            self.send_refresh_interval()
+def json_response(data, status=200):
+    """JSON 响应（允许跨域）"""
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    return status, {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, body
+
+
+def error_json(e, status=500):
+    return json_response({'error': str(e)}, status)
+
+
+def accepted_encodings(request):
+    """Accept-Encoding 中客户端接受的编码（q=0 的除外）"""
+    accepted = set()
+    for item in request.headers.get('accept-encoding', '').split(','):
+        coding, _, params = item.partition(';')
+        try:
+            q = float(params.split('=', 1)[1]) if '=' in params else 1.0
+        except ValueError:
+            q = 0
+        if coding.strip() and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_encoding(request, available):
+    """在可用的编码中选出客户端接受的最优编码（br 优先），都不接受时返回 None"""
+    accepted = accepted_encodings(request)
+    for encoding in available:
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+def _etag_matches(request, etags):
+    """If-None-Match 是否命中（弱比较，忽略 W/ 前缀）"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return '*' in candidates or bool(candidates & set(etags))
+
+
+def encode_entry(headers, body, tag=None):
+    """
+    预先编码一次的响应: 原文及各压缩编码的内容，每种表示有各自的强 ETag
+
+    tag 默认取内容摘要；静态文件传入由修改时间与大小构成的标记。
+    """
+    tag = tag or hashlib.blake2b(body, digest_size=12).hexdigest()
+    entry = {'headers': headers, 'bodies': {None: body}, 'etags': {None: f'"{tag}"'}}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        for encoding in json_artifacts.encodings():
+            entry['bodies'][encoding] = json_artifacts.compress(body, encoding)
+            entry['etags'][encoding] = f'"{tag}-{encoding}"'
+    return entry
+
+
+def conditional_response(request, entry):
+    """按 If-None-Match 与 Accept-Encoding 从预编码的响应中选出要发送的内容"""
+    encoding = choose_encoding(request, [e for e in entry['bodies'] if e])
+    headers = {'ETag': entry['etags'][encoding], 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding',
+               'Access-Control-Allow-Origin': '*'}
+    if _etag_matches(request, entry['etags'].values()):
+        return 304, headers, b''
+    headers.update(entry['headers'])
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return 200, headers, entry['bodies'][encoding]
+
+
+def cached_response(build, vary=None):
+    """
+    包装 JSON 路由: 成功的响应按 (路径, 查询参数, 数据版本) 缓存编码后的字节
+
+    vary 返回键中额外的部分（如按交易日变化的接口传入当天日期）。数据版本变化后
+    旧条目整体作废；错误响应不缓存。
+    """
+    @functools.wraps(build)
+    def route(request):
+        version = get_data_version()
+        query = tuple(sorted((name, tuple(values)) for name, values in request.query.items()))
+        key = (request.path, query, vary() if vary else None)
+        hit, entry = response_cache.get(key, version)
+        if not hit:
+            status, headers, body = build(request)
+            if status != 200:
+                return status, headers, body
+            entry = encode_entry(headers, body)
+            response_cache.put(key, version, entry)
+        return conditional_response(request, entry)
+    return route
+
+
+def today():
+    return day_range()[0]
+
+
+# 交易所 -> 交易日历（backfill_planner），决定交易日从何时算起
+SESSION_CALENDARS = {'GFEX': 'GFEX', 'CME': 'CME'}
+_session_bounds = {}              # 交易所 -> (本交易日开盘, 下一交易日开盘)
+
+
+def session_starts():
+    """各交易所当前交易日的开盘时间戳（缓存到下一交易日开盘）"""
+    now = to_epoch(datetime.now())
+    starts = {}
+    for exchange, calendar in SESSION_CALENDARS.items():
+        bounds = _session_bounds.get(exchange)
+        if bounds is None or bounds[0] is None or (bounds[1] is not None and now >= bounds[1]):
+            bounds = _session_bounds[exchange] = trading_day_bounds(calendar, now)
+        # 日历范围内找不到开盘时间时退回自然日
+        starts[exchange] = bounds[0] if bounds[0] is not None else today()
+    return starts
+
+
+def session_key():
+    """可哈希的 ((交易所, 开盘时间), ...)，作为交易日相关查询的缓存键"""
+    return tuple(sorted(session_starts().items()))
+
+
+def api_options(request):
+    """处理 CORS 预检请求"""
+    return 200, {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type',
+    }, b''
+
+
+def api_refresh_data(request):
+    """提交后台数据更新任务，立即返回任务 id（已有同步在排队时并入该任务，执行中则排一个后续任务）"""
+    try:
+        job, created = submit_sync('api')
+        return json_response({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'deduplicated': not created,
+            'url': f'/api/jobs/{job.id}',
+        }, 202)
+    except Exception as e:
+        print(f"提交更新任务出错: {e}")
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+def api_jobs(request):
+    """最近的数据同步任务（新的在前）"""
+    return json_response({'jobs': jobs.recent(int(request.param('limit', '10')))})
+
+
+def api_job(request):
+    """任务状态与各阶段耗时: /api/jobs/<id>"""
+    job = jobs.get(request.path.rsplit('/', 1)[-1])
+    if job is None:
+        return error_json('任务不存在或已过期', 404)
+    return json_response(job.to_dict())
+
+
+def api_alert_config(request):
+    """发送警报配置"""
+    try:
+        config_file = 'alert_config.json'
+        if os.path.exists(config_file):
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
         else:
-            super().do_GET()
-    
+            config = {
+                'webhook_url': '',
+                'thresholds': {'platinum': {'min': 5, 'max': 25}, 'palladium': {'min': 5, 'max': 25}},
+                'cooldown_minutes': 60,
+                'enabled': False
+            }
+        return json_response(config)
+    except Exception as e:
+        return error_json(e)
+
+
+def api_save_alert_config(request):
+    """保存警报配置"""
+    try:
+        new_config = request.json()
+        
+        # 读取现有配置以保留 webhook_url（前端不应修改）
+        config_file = 'alert_config.json'
+        if os.path.exists(config_file):
+            with open(config_file, 'r', encoding='utf-8') as f:
+                existing = json.load(f)
+            # 保留 webhook_url
+            new_config['webhook_url'] = existing.get('webhook_url', '')
+        
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump(new_config, f, ensure_ascii=False, indent=2)
+        
+        return json_response({'success': True, 'message': '配置已保存'})
+    except Exception as e:
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+def api_refresh_interval(request):
+    """返回当前刷新间隔"""
+    return json_response({
+        'interval': REFRESH_INTERVAL,
+        'interval_minutes': REFRESH_INTERVAL / 60
+    })
+
+
+def api_set_refresh_interval(request):
+    """设置刷新间隔"""
+    global REFRESH_INTERVAL
+    try:
+        data = request.json()
+        
+        new_interval = int(data.get('interval', 120))
+        # 限制范围：最小1分钟，最大120分钟
+        new_interval = max(60, min(7200, new_interval))
+        
+        REFRESH_INTERVAL = new_interval
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 刷新间隔已更新为 {new_interval} 秒 ({new_interval/60:.0f}分钟)")
+        
+        return json_response({
+            'success': True,
+            'interval': REFRESH_INTERVAL,
+            'message': f'刷新间隔已设置为 {REFRESH_INTERVAL/60:.0f} 分钟'
+        })
+    except Exception as e:
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+def api_cache_stats(request):
+    """返回读缓存（及响应缓存）的命中率与占用"""
+    return json_response(dict(read_cache.get_stats(), responses=response_cache.get_stats()))
+
+
+def api_server_stats(request):
+    """返回服务模式、配对数据来源、连接数、在途请求、最近请求的耗时分位数、推送订阅数与各报价源状态"""
+    return json_response(dict(request_stats.get_stats(), mode=SERVER_MODE, pairs_source=PAIRS_SOURCE,
+                              stream=broadcaster.get_stats(), quotes=quotes.get_stats()))
+
+
+def api_stream(request):
+    """SSE 推送：最新价、新增价差点与警报（断线重连按 Last-Event-ID 补发）"""
+    last_event_id = request.headers.get('last-event-id') or request.param('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    return 200, {
+        'Content-Type': 'text/event-stream; charset=utf-8',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',           # 经 nginx 反向代理时不缓冲
+        'Access-Control-Allow-Origin': '*',
+    }, event_stream.EventStream(broadcaster, change_feed.hello, last_event_id)
+
+
+def api_prices(request):
+    """
+    返回内存中的实时价格（由行情聚合器在后台刷新）
+
+    ages 为各数据源距上次成功获取的秒数；errors 为最近一次获取失败的数据源（仍返回旧值）。
+    """
+    try:
+        snapshot = quotes.snapshot()
+        data = assemble_prices(snapshot['gfex']['value'] or dict(EMPTY_QUOTE),
+                               snapshot['cme']['value'] or dict(EMPTY_QUOTE),
+                               snapshot['exchange_rate']['value'])
+        fetched = [source['fetched_at'] for source in snapshot.values() if source['fetched_at']]
+        if fetched:
+            data['update_time'] = datetime.fromtimestamp(max(fetched)).strftime('%Y/%m/%d %H:%M:%S')
+        data['ages'] = {name: source['age'] for name, source in snapshot.items()}
+        errors = {name: source['error'] for name, source in snapshot.items() if source['error']}
+        if errors:
+            data['errors'] = errors
+        return json_response(data)
+    except Exception as e:
+        return error_json(e)
+
+
+def api_saved_prices(request):
+    """返回保存的手动价格数据"""
+    try:
+        return json_response(load_saved_prices())
+    except Exception as e:
+        return error_json(e)
+
+
+def api_save_prices(request):
+    """保存手动输入的价格数据"""
+    try:
+        data = request.json()
+        
+        # 添加保存时间
+        data['save_time'] = datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+        
+        # 保存到文件
+        with open(MANUAL_DATA_FILE, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 手动数据已保存")
+        return json_response({'success': True, 'save_time': data['save_time']})
+    except Exception as e:
+        print(f"保存失败: {e}")
+        return error_json(e)
+
+
+def pairs_update_time(pairs):
+    """
+    配对数据的更新时间：各配对最新一条数据中最晚的时间
+
+    响应按数据版本缓存，取请求时刻会把第一次请求的时间冻结在缓存里，所以从数据本身取。
+    """
+    stamps = [to_epoch(pair['current']['datetime']) for pair in pairs.values() if pair.get('current')]
+    stamps = [ts for ts in stamps if ts is not None]
+    return from_epoch(max(stamps), '%Y-%m-%d %H:%M:%S') if stamps else None
+
+
+def api_pairs(request, metal):
+    """返回配对数据（从数据库读取）"""
+    try:
+        pairs = cached_all_pairs(metal)
+        return json_response({
+            'update_time': pairs_update_time(pairs),
+            'pairs': pairs
+        })
+    except Exception as e:
+        return error_json(e)
+
+
+def api_pair_history(request):
+    """返回指定配对的历史数据"""
+    try:
+        # 解析参数: /api/pair-history?metal=platinum&pair=2610-2601
+        #   可选: start/end (北京时间或时间戳), resolution=1m|5m|1h|1d, agg=last|ohlc, limit
+        #   since=<cursor>: 只返回上次响应的 cursor 之后新增或修改的点
+        #   format=json|columnar|binary: 历史的编码方式（见 columnar.py）
+        metal = request.param('metal', 'platinum')
+        pair_name = request.param('pair', '')
+        start = request.param('start')
+        end = request.param('end')
+        resolution = request.param('resolution', '1m')
+        agg = request.param('agg', 'last')
+        limit = int(request.param('limit', '5000'))
+        since = request.param('since')
+        fmt = history_format(request)
+
+        result = {'pair_name': pair_name, 'metal': metal, 'resolution': resolution, 'agg': agg}
+        if since is not None:
+            changes = cached_pair_changes(metal, int(since), pair_name, resolution=resolution, agg=agg)
+            if not changes['reset']:
+                result.update(cursor=changes['cursor'], reset=False,
+                              history=changes['pairs'].get(pair_name, []))
+                return history_response(result, fmt)
+        # 全量：游标在查询前读取，之后写入的点下次增量会再给一遍（客户端按时间覆盖）
+        result['cursor'] = get_data_version()
+        result['reset'] = since is not None
+        result['history'] = cached_pair_history(
+            metal, pair_name,
+            start=int(start) if start and start.isdigit() else start,
+            end=int(end) if end and end.isdigit() else end,
+            resolution=resolution, agg=agg, limit=limit
+        )
+        return history_response(result, fmt)
+    except (KeyError, ValueError) as e:
+        # 参数错误（未知品种/分辨率、无法解析的时间等）
+        return error_json(e, 400)
+    except Exception as e:
+        return error_json(e)
+
+
+def history_format(request):
+    fmt = request.param('format', 'json')
+    if fmt not in columnar.FORMATS:
+        raise ValueError(f"不支持的格式: {fmt}")
+    return fmt
+
+
+def history_response(result, fmt):
+    """按 format 编码带 history 的响应：json 原样，columnar 改为平行数组，binary 为列式二进制"""
+    if fmt == 'binary':
+        result = dict(result)
+        body = columnar.encode_binary(result.pop('history'), result)
+        return 200, {'Content-Type': columnar.BINARY_TYPE, 'Access-Control-Allow-Origin': '*'}, body
+    if fmt == 'columnar':
+        result = dict(result, format='columnar', history=columnar.to_columns(result['history']))
+    return json_response(result)
+
+
+def pair_entries(metal, histories, fmt='json'):
+    """配对条目（同 *_all_pairs.json 的 pairs）：合约、最新值、统计，history 取自 histories"""
+    latest = cached_all_pairs(metal)
+    pairs = {}
+    for name, history in histories.items():
+        pair = dict(latest.get(name) or {'pair_name': name})
+        pair['stats'] = cached_pair_stats(metal, name)
+        pair['history'] = columnar.to_columns(history) if fmt == 'columnar' else history
+        pairs[name] = pair
+    return pairs
+
+
+def api_pairs_delta(request):
+    """
+    一个品种全部配对的增量: /api/pairs/delta?metal=platinum&since=<cursor>
+
+    返回 {'update_time', 'cursor', 'reset', 'pairs'}，pairs 的结构同 *_all_pairs.json；
+    format=columnar 时各配对的 history 为平行数组（binary 只用于单个配对的 /api/pair-history）。
+    不带 since（或游标失效）时 reset 为 true，pairs 为全部配对及最近的分钟历史，客户端整体替换；
+    否则只包括有变化的配对，history 只含 cursor 之后新增或修改的点，客户端按 date 合并。
+    """
+    try:
+        metal = request.param('metal', 'platinum')
+        if metal not in PAIR_TABLES:
+            raise ValueError(f"未知品种: {metal}")
+        since = request.param('since')
+        fmt = history_format(request)
+        if fmt == 'binary':
+            raise ValueError("binary 格式只用于单个配对的 /api/pair-history")
+        if since is not None:
+            changes = cached_pair_changes(metal, int(since))
+            if not changes['reset']:
+                return json_response({
+                    'update_time': pairs_update_time(cached_all_pairs(metal)),
+                    'cursor': changes['cursor'],
+                    'reset': False,
+                    'pairs': pair_entries(metal, changes['pairs'], fmt),
+                })
+        cursor = get_data_version()
+        return json_response({
+            'update_time': pairs_update_time(cached_all_pairs(metal)),
+            'cursor': cursor,
+            'reset': True,
+            'pairs': pair_entries(metal, {name: cached_pair_history(metal, name)
+                                          for name in cached_all_pairs(metal)}, fmt),
+        })
+    except ValueError as e:
+        return error_json(e, 400)
+    except Exception as e:
+        return error_json(e)
+
+
+def api_latest(request):
+    """登记表中全部活跃合约的本交易日开/高/低/最新价与涨跌，可按 exchange、metal 过滤"""
+    try:
+        exchange = (request.param('exchange') or '').upper() or None
+        metal = request.param('metal') or None
+        if exchange is not None and exchange not in SESSION_CALENDARS:
+            raise ValueError(f"未知交易所: {exchange}")
+        if metal is not None and metal not in PAIR_TABLES:
+            raise ValueError(f"未知品种: {metal}")
+        key = session_key()
+        return json_response({
+            'session_start': {name: from_epoch(start) for name, start in key},
+            'contracts': query_latest(exchange, metal, key),
+        })
+    except ValueError as e:
+        return error_json(e, 400)
+    except Exception as e:
+        return error_json(e)
+
+
+def api_cme_latest(request):
+    """返回所有CME合约的最新价格和本交易日开盘价"""
+    try:
+        return json_response(query_exchange_latest('CME', session_key()))
+    except Exception as e:
+        return error_json(e)
+
+
+def api_gfex_latest(request):
+    """返回所有广期所合约的最新价格和本交易日开盘价"""
+    try:
+        return json_response(query_exchange_latest('GFEX', session_key()))
+    except Exception as e:
+        return error_json(e)
+
+
+def _static_path(request):
+    """请求对应的当前目录内的文件路径，目录取其 index.html，不存在或越界时返回 None"""
+    root = os.path.abspath(os.getcwd())
+    path = os.path.abspath(os.path.join(root, unquote(request.path).lstrip('/')))
+    if path != root and not path.startswith(root + os.sep):
+        return None
+    if os.path.isdir(path):
+        path = next((os.path.join(path, name) for name in ('index.html', 'index.htm')
+                     if os.path.isfile(os.path.join(path, name))), path)
+    return path if os.path.isfile(path) else None
+
+
+def serve_static(request):
+    """
+    静态文件（监控页面、仪表盘 JSON 等），按 Accept-Encoding 协商压缩
+
+    有新鲜的预压缩兄弟文件 (.br/.gz，由 json_artifacts 生成) 时直接发送；否则可压缩的
+    文件现场压缩一次，按 (路径, 修改时间, 大小) 缓存。ETag/Last-Modified 支持 304。
+    """
+    path = _static_path(request)
+    if path is None:
+        return error_json('File not found', 404)
+    stat = os.stat(path)
+    tag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    headers = {'Content-Type': content_type, 'Last-Modified': formatdate(stat.st_mtime, usegmt=True)}
+
+    # 预压缩文件：直接读出发送
+    siblings = {e: json_artifacts.fresh_sibling(path, e) for e in json_artifacts.encodings()}
+    encoding = choose_encoding(request, [e for e, sibling in siblings.items() if sibling])
+    if encoding:
+        etags = [f'"{tag}"'] + [f'"{tag}-{e}"' for e, sibling in siblings.items() if sibling]
+        headers.update({'ETag': f'"{tag}-{encoding}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'})
+        if _etag_matches(request, etags):
+            return 304, headers, b''
+        with open(siblings[encoding], 'rb') as f:
+            body = f.read()
+        headers['Content-Encoding'] = encoding
+        return 200, headers, body
+
+    if not content_type.startswith(COMPRESSIBLE_TYPES):
+        headers.update({'ETag': f'"{tag}"', 'Cache-Control': 'no-cache'})
+        if _etag_matches(request, [f'"{tag}"']):
+            return 304, headers, b''
+        with open(path, 'rb') as f:
+            return 200, headers, f.read()
+
+    key = ('static', path, tag)
+    version = get_data_version()
+    hit, entry = response_cache.get(key, version)
+    if not hit:
+        with open(path, 'rb') as f:
+            entry = encode_entry(headers, f.read(), tag)
+        response_cache.put(key, version, entry)
+    return conditional_response(request, entry)
+
+
+# (方法, 路径) -> (处理函数, 类别)。类别决定 asyncio 模式下在哪里执行:
+#   db 数据库/本地文件线程池，upstream 网络/子进程线程池（限制在途数量），inline 事件循环内
+ROUTES = {
+    ('GET', '/api/prices'): (api_prices, 'db'),
+    ('GET', '/api/saved-prices'): (api_saved_prices, 'db'),
+    ('GET', '/api/platinum-pairs'): (cached_response(functools.partial(api_pairs, metal='platinum')), 'db'),
+    ('GET', '/api/palladium-pairs'): (cached_response(functools.partial(api_pairs, metal='palladium')), 'db'),
+    ('GET', '/api/pair-history'): (cached_response(api_pair_history), 'db'),
+    ('GET', '/api/pairs/delta'): (cached_response(api_pairs_delta), 'db'),
+    ('GET', '/api/latest'): (cached_response(api_latest, vary=session_key), 'db'),
+    ('GET', '/api/cme-latest'): (cached_response(api_cme_latest, vary=session_key), 'db'),
+    ('GET', '/api/gfex-latest'): (cached_response(api_gfex_latest, vary=session_key), 'db'),
+    ('GET', '/api/alert-config'): (api_alert_config, 'db'),
+    ('GET', '/api/refresh-interval'): (api_refresh_interval, 'inline'),
+    ('GET', '/api/cache-stats'): (api_cache_stats, 'inline'),
+    ('GET', '/api/server-stats'): (api_server_stats, 'inline'),
+    ('GET', '/api/stream'): (api_stream, 'db'),
+    ('POST', '/api/save-prices'): (api_save_prices, 'db'),
+    ('POST', '/api/refresh-data'): (api_refresh_data, 'inline'),
+    ('GET', '/api/jobs'): (api_jobs, 'inline'),
+    ('POST', '/api/alert-config'): (api_save_alert_config, 'db'),
+    ('POST', '/api/refresh-interval'): (api_set_refresh_interval, 'inline'),
+}
+
+
+def resolve(request):
+    """查找请求对应的 (处理函数, 类别)，未知路径返回 None；GET 非 API 路径为静态文件"""
+    if request.method == 'OPTIONS':
+        return api_options, 'inline'
+    route = ROUTES.get((request.method, request.path))
+    if route is None and request.method == 'GET' and request.path.startswith('/api/jobs/'):
+        route = api_job, 'inline'
+    if route is None and request.method == 'GET':
+        route = serve_static, 'db'
+    return route
+
+
+class PriceAPIHandler(BaseHTTPRequestHandler):
+    """线程模式：每个连接一个线程，路由（含静态文件与压缩协商）与 asyncio 模式共用"""
+
+    def setup(self):
+        super().setup()
+        request_stats.connection(1)
+
+    def finish(self):
+        request_stats.connection(-1)
+        super().finish()
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch()
+
     def do_POST(self):
-        if self.path == '/api/save-prices':
-            self.save_manual_prices()
-        elif self.path == '/api/refresh-data':
-            self.trigger_data_refresh()
-        elif self.path == '/api/alert-config':
-            self.save_alert_config()
-        elif self.path == '/api/refresh-interval':
-            self.set_refresh_interval()
+        self.dispatch()
+
+    def do_OPTIONS(self):
+        self.dispatch()
+
+    def dispatch(self):
+        """执行匹配的路由并写回响应"""
+        started = time.perf_counter()
+        method = 'GET' if self.command == 'HEAD' else self.command
+        request = Request(method, self.path, dict(self.headers))
+        route = resolve(request)
+        if route is None:
+            status, headers, body = error_json('Not Found', 404)
         else:
-            self.send_response(404)
-            self.end_headers()
+            length = int(self.headers.get('Content-Length') or 0)
+            request.body = self.rfile.read(length) if length else b''
+            status, headers, body = route[0](request)
+        if not isinstance(body, bytes):
+            request_stats.record(time.perf_counter() - started, status)
+            self.send_stream(status, headers, body)
+            return
 
-    def trigger_data_refresh(self):
-        """触发后台数据更新"""
-        try:
-            success, message = run_data_sync()
-            
-            if success:
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({'success': True, 'message': message}).encode('utf-8'))
-            else:
-                self.send_response(500)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({'success': False, 'error': message}).encode('utf-8'))
-            
-        except Exception as e:
-            print(f"更新过程出错: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode('utf-8'))
-
-    def send_alert_config(self):
-        """发送警报配置"""
-        try:
-            config_file = 'alert_config.json'
-            if os.path.exists(config_file):
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                config = {
-                    'webhook_url': '',
-                    'thresholds': {'platinum': {'min': 5, 'max': 25}, 'palladium': {'min': 5, 'max': 25}},
-                    'cooldown_minutes': 60,
-                    'enabled': False
-                }
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(config, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
-
-    def save_alert_config(self):
-        """保存警报配置"""
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            new_config = json.loads(post_data.decode('utf-8'))
-            
-            # 读取现有配置以保留 webhook_url（前端不应修改）
-            config_file = 'alert_config.json'
-            if os.path.exists(config_file):
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    existing = json.load(f)
-                # 保留 webhook_url
-                new_config['webhook_url'] = existing.get('webhook_url', '')
-            
-            with open(config_file, 'w', encoding='utf-8') as f:
-                json.dump(new_config, f, ensure_ascii=False, indent=2)
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': True, 'message': '配置已保存'}).encode('utf-8'))
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode('utf-8'))
-
-    def send_refresh_interval(self):
-        """返回当前刷新间隔"""
-        global REFRESH_INTERVAL
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_response(status)
+        if status not in (204, 304):
+            self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps({
-            'interval': REFRESH_INTERVAL,
-            'interval_minutes': REFRESH_INTERVAL / 60
-        }).encode('utf-8'))
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        request_stats.record(time.perf_counter() - started, status)
 
-    def set_refresh_interval(self):
-        """设置刷新间隔"""
-        global REFRESH_INTERVAL
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            new_interval = int(data.get('interval', 120))
-            # 限制范围：最小1分钟，最大120分钟
-            new_interval = max(60, min(7200, new_interval))
-            
-            REFRESH_INTERVAL = new_interval
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] 刷新间隔已更新为 {new_interval} 秒 ({new_interval/60:.0f}分钟)")
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': True,
-                'interval': REFRESH_INTERVAL,
-                'message': f'刷新间隔已设置为 {REFRESH_INTERVAL/60:.0f} 分钟'
-            }).encode('utf-8'))
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode('utf-8'))
-    
-    def do_OPTIONS(self):
-        """处理 CORS 预检请求"""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+    def send_stream(self, status, headers, body):
+        """流式响应（SSE）：不带 Content-Length，逐段写出，客户端断开或流结束后关闭连接"""
+        self.close_connection = True
+        self.send_response(status)
+        self.send_header('Connection', 'close')
+        for name, value in headers.items():
+            self.send_header(name, value)
         self.end_headers()
-    
-    def send_price_data(self):
-        """获取并返回实时价格数据"""
-        try:
-            data = get_all_prices()
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
-    
-    def send_saved_prices(self):
-        """返回保存的手动价格数据"""
+        if self.command == 'HEAD':
+            return
+        request_stats.in_flight('stream', 1)
+        chunks = iter(body)
         try:
-            data = load_saved_prices()
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
-    
-    def save_manual_prices(self):
-        """保存手动输入的价格数据"""
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            # 添加保存时间
-            data['save_time'] = datetime.now().strftime('%Y/%m/%d %H:%M:%S')
-            
-            # 保存到文件
-            with open(MANUAL_DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] 手动数据已保存")
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': True, 'save_time': data['save_time']}).encode('utf-8'))
-        except Exception as e:
-            print(f"保存失败: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
-    
-    def send_pairs_data(self, metal):
-        """返回配对数据（从数据库读取）"""
-        try:
-            pairs = get_all_pairs(metal)
-            data = {
-                'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'pairs': pairs
-            }
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
-    
-    def send_pair_history(self):
-        """返回指定配对的历史数据"""
-        try:
-            # 解析参数: /api/pair-history?metal=platinum&pair=2610-2601
-            from urllib.parse import urlparse, parse_qs
-            parsed = urlparse(self.path)
-            params = parse_qs(parsed.query)
-            metal = params.get('metal', ['platinum'])[0]
-            pair_name = params.get('pair', [''])[0]
-            
-            history = get_pair_history(metal, pair_name)
-            data = {
-                'pair_name': pair_name,
-                'metal': metal,
-                'history': history
-            }
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            for chunk in chunks:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+                if self.client_closed():
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            chunks.close()
+            request_stats.in_flight('stream', -1)
 
-    def send_cme_latest(self):
-        """返回所有CME合约的最新价格和今日开盘价"""
+    def client_closed(self):
+        """客户端是否已关闭连接（可读且读到 EOF）；写入已关闭的连接第一次往往不会报错"""
         try:
-            conn = sqlite3.connect('precious_metals.db')
-            cursor = conn.cursor()
-            
-            result = {}
-            
-            # 获取每个合约的最新数据
-            for contract in ['PLF2026', 'PLJ2026', 'PLN2026', 'PLV2026']:
-                # 最新价格
-                cursor.execute('''
-                    SELECT close, datetime FROM cme_platinum_contracts 
-                    WHERE contract = ? ORDER BY datetime DESC LIMIT 1
-                ''', (contract,))
-                latest = cursor.fetchone()
-                
-                # 今日开盘价 (今天第一条数据)
-                today = datetime.now().strftime('%Y-%m-%d')
-                cursor.execute('''
-                    SELECT close FROM cme_platinum_contracts 
-                    WHERE contract = ? AND datetime LIKE ? 
-                    ORDER BY datetime ASC LIMIT 1
-                ''', (contract, f'{today}%'))
-                open_row = cursor.fetchone()
-                
-                if latest:
-                    result[contract] = {
-                        'price': latest[0],
-                        'datetime': latest[1],
-                        'open_price': open_row[0] if open_row else latest[0]
-                    }
-            
-            conn.close()
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, ensure_ascii=False).encode('utf-8'))
-            
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            readable = select.select([self.connection], [], [], 0)[0]
+            return bool(readable) and self.connection.recv(1, socket.MSG_PEEK) == b''
+        except OSError:
+            return True
 
-    def send_gfex_latest(self):
-        """返回所有广期所合约的最新价格和今日开盘价"""
-        try:
-            conn = sqlite3.connect('precious_metals.db')
-            cursor = conn.cursor()
-            
-            result = {}
-            
-            # 获取每个广期所合约的最新数据
-            for contract in ['PT2606', 'PT2610', 'PD2606', 'PD2610']:
-                # 最新价格
-                cursor.execute('''
-                    SELECT close, datetime FROM gfex_platinum_contracts 
-                    WHERE contract = ? ORDER BY datetime DESC LIMIT 1
-                ''', (contract,))
-                latest = cursor.fetchone()
-                
-                # 今日开盘价 (今天第一条数据的 close)
-                today = datetime.now().strftime('%Y-%m-%d')
-                cursor.execute('''
-                    SELECT close FROM gfex_platinum_contracts 
-                    WHERE contract = ? AND datetime LIKE ? 
-                    ORDER BY datetime ASC LIMIT 1
-                ''', (contract, f'{today}%'))
-                open_row = cursor.fetchone()
-                
-                if latest:
-                    result[contract] = {
-                        'price': latest[0],
-                        'datetime': latest[1],
-                        'open_price': open_row[0] if open_row else latest[0]
-                    }
-            
-            conn.close()
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, ensure_ascii=False).encode('utf-8'))
-            
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+
+@read_cache.cached
+def query_latest(exchange, metal, sessions):
+    """
+    活跃合约的本交易日行情 {合约: {...}}（按数据版本与交易日缓存）
+
+    合约来自 instruments 登记表，sessions 为 session_key() 的结果；
+    涨跌相对本交易日开盘价（与仪表盘的涨跌幅一致），本交易日尚无成交时最新价取上一交易日收盘。
+    """
+    starts = dict(sessions)
+    instruments = [i for i in active_instruments(exchange, metal) if i['exchange'] in starts]
+    quotes = get_session_quotes([(i['instrument_id'], starts[i['exchange']]) for i in instruments])
+
+    result = {}
+    for instrument in instruments:
+        quote = quotes.get(instrument['instrument_id'])
+        if quote is None:
+            continue
+        traded = quote['last'] is not None
+        last = quote['last'] if traded else quote['prev_close']
+        last_ts = quote['last_ts'] if traded else quote['prev_ts']
+        change = last - quote['open'] if traded and quote['open'] else None
+        result[instrument['symbol']] = {
+            'exchange': instrument['exchange'],
+            'metal': instrument['metal'],
+            'open': quote['open'],
+            'high': quote['high'],
+            'low': quote['low'],
+            'last': last,
+            'datetime': from_epoch(last_ts) if last_ts is not None else None,
+            'prev_close': quote['prev_close'],
+            'change': round(change, 4) if change is not None else None,
+            'change_pct': round(change / quote['open'] * 100, 4) if change is not None else None,
+        }
+    return result
+
+
+# /api/cme-latest、/api/gfex-latest 固定返回的合约（旧接口的约定，新合约请用 /api/latest）
+LEGACY_LATEST_CONTRACTS = {
+    'CME': ['PLF2026', 'PLJ2026', 'PLN2026', 'PLV2026'],
+    'GFEX': ['PT2606', 'PT2610', 'PD2606', 'PD2610'],
+}
+
+
+@read_cache.cached
+def query_exchange_latest(exchange, sessions):
+    """
+    /api/cme-latest、/api/gfex-latest 的旧格式 {合约: {'price', 'datetime', 'open_price'}}（按交易日缓存）
+
+    只含 LEGACY_LATEST_CONTRACTS 中的合约；open_price 为本交易日第一根K线的收盘价，
+    本交易日还没有K线时取最新价。合约按代码前缀读对应品种的兼容视图（钯金合约读钯金数据）。
+    """
+    session_start = dict(sessions)[exchange]
+    conn = get_read_connection()
+    cursor = conn.cursor()
+
+    result = {}
+    for contract in LEGACY_LATEST_CONTRACTS[exchange]:
+        table = f"{exchange.lower()}_{instrument_info(contract)[1]}_contracts"
+        # 最新价格
+        cursor.execute(f'''
+            SELECT close, datetime FROM {table}
+            WHERE contract = ? ORDER BY ts DESC LIMIT 1
+        ''', (contract,))
+        latest = cursor.fetchone()
+
+        # 本交易日开盘价 (本交易日第一条数据的 close)
+        cursor.execute(f'''
+            SELECT close FROM {table}
+            WHERE contract = ? AND ts >= ?
+            ORDER BY ts ASC LIMIT 1
+        ''', (contract, session_start))
+        open_row = cursor.fetchone()
+
+        if latest:
+            result[contract] = {
+                'price': latest[0],
+                'datetime': latest[1],
+                'open_price': open_row[0] if open_row else latest[0]
+            }
+    return result
 
 
 def load_saved_prices():
@@ -467,10 +929,14 @@ def load_saved_prices():
     return None
 
 
+# 单个交易所的报价结构（某一品种取不到时为 None）
+EMPTY_QUOTE = {'pt': None, 'pd': None, 'pt_time': None, 'pd_time': None}
+
+
 def get_gfex_prices():
     """获取广期所铂金钯金实时价格 (新浪实时行情)"""
     import requests
-    result = {'pt': None, 'pd': None, 'pt_time': None, 'pd_time': None}
+    result = dict(EMPTY_QUOTE)
     
     # 使用新浪实时行情接口
     try:
@@ -522,11 +988,11 @@ def get_gfex_prices():
 
 def get_cme_prices():
     """获取CME铂金钯金价格 (优先从本地数据库获取爬虫数据)"""
-    result = {'pt': None, 'pd': None, 'pt_time': None, 'pd_time': None}
+    result = dict(EMPTY_QUOTE)
     
     # 1. 获取铂金 (从数据库读取最新的爬虫数据)
     try:
-        conn = sqlite3.connect('precious_metals.db')
+        conn = get_read_connection()
         cursor = conn.cursor()
         
         # 获取最新的 PLJ2026 或其他活跃合约
@@ -534,7 +1000,7 @@ def get_cme_prices():
         cursor.execute('''
             SELECT close, datetime, contract 
             FROM cme_platinum_contracts 
-            ORDER BY datetime DESC, created_at DESC 
+            ORDER BY ts DESC 
             LIMIT 1
         ''')
         row = cursor.fetchone()
@@ -544,7 +1010,6 @@ def get_cme_prices():
             result['pt_time'] = row[1]
             print(f"  [DB] 铂金({row[2]}): ${result['pt']} ({result['pt_time']})")
         
-        conn.close()
     except Exception as e:
         print(f"  [DB] 数据库读取铂金失败: {e}")
 
@@ -595,6 +1060,11 @@ def get_all_prices():
     print(f"  CME: Pt=${cme['pt']} ({cme['pt_time']}), Pd=${cme['pd']} ({cme['pd_time']})")
     print(f"  汇率: {rate}")
     
+    return assemble_prices(gfex, cme, rate)
+
+
+def assemble_prices(gfex, cme, rate):
+    """组装 /api/prices 的响应结构"""
     return {
         'update_time': datetime.now().strftime('%Y/%m/%d %H:%M:%S'),
         'exchange_rate': rate,
@@ -611,23 +1081,50 @@ if __name__ == '__main__':
     data = get_all_prices()
     print(json.dumps(data, indent=2, ensure_ascii=False))
     
+    port = int(sys.argv[sys.argv.index('--port') + 1]) if '--port' in sys.argv else 8080
+    if '--async' in sys.argv:
+        SERVER_MODE = 'asyncio'
+    
     print("\n" + "=" * 50)
-    print("启动价格API服务器 http://localhost:8080")
+    print(f"启动价格API服务器 http://localhost:{port} ({SERVER_MODE})")
     print("API端点:")
-    print("  GET  /api/prices       - 获取实时价格")
+    print("  GET  /api/prices       - 获取实时价格（内存中的最新报价，ages 为各数据源的秒数）")
     print("  GET  /api/saved-prices - 获取保存的手动价格")
     print("  POST /api/save-prices  - 保存手动输入的价格")
-    print("=" * 50)
+    print("  GET  /api/server-stats - 连接数与请求耗时分位数")
+    print("  GET  /api/stream       - SSE 推送最新价、新增价差点与警报")
+    print("  GET  /api/pair-history - 配对历史 (?format=columnar|binary 为列式编码)")
+    print("  GET  /api/pairs/delta  - 配对价差增量 (?metal=&since=<cursor>)，不带 since 为全量")
+    print("  GET  /api/latest       - 活跃合约本交易日开/高/低/最新价与涨跌 (?exchange=&metal=)")
+    print("  POST /api/refresh-data - 提交数据同步任务，返回任务 id")
+    print("  GET  /api/jobs/<id>    - 同步任务状态与各阶段耗时")
     print("=" * 50)
     
-    # 1. 启动时立即执行一次数据更新 (使用独立线程，避免阻塞服务器启动)
+    # 1. 启动时立即执行一次数据更新 (放进任务队列，由工作线程执行，避免阻塞服务器启动)
     print("启动后台数据更新线程...")
-    initial_sync_thread = threading.Thread(target=run_data_sync, daemon=True)
-    initial_sync_thread.start()
+    jobs.start()
+    submit_sync('startup')
 
     # 2. 启动自动刷新线程 (使用全局REFRESH_INTERVAL变量)
     refresh_thread = threading.Thread(target=auto_refresh_scheduler, daemon=True)
     refresh_thread.start()
     
-    server = ThreadingHTTPServer(('', 8080), PriceAPIHandler)
-    server.serve_forever()
+    # 3. API 只读快照：请求不再与采集脚本的写入争锁
+    enable_snapshot_reads()
+    try:
+        publish_snapshot(min_interval=0)
+    except Exception as e:
+        print(f"发布初始快照失败，暂时直接读取主库: {e}")
+
+    # 4. 推送增量的后台检查（数据版本不变时只是一次查询）
+    change_feed.start()
+
+    # 5. 行情聚合器：按 TTL 在后台并行刷新报价，/api/prices 只读内存
+    quotes.start()
+    
+    if SERVER_MODE == 'asyncio':
+        # 单个事件循环处理全部 keep-alive 连接，阻塞的查询/网络请求交给有界线程池
+        AsyncHTTPServer(resolve, port=port, stats=request_stats).serve_forever()
+    else:
+        server = ThreadingHTTPServer(('', port), PriceAPIHandler)
+        server.serve_forever()
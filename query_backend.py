@@ -0,0 +1,307 @@
+"""
+分析查询后端
+长区间的分桶聚合、窗口函数与多配对扫描可以交给 DuckDB 以列式向量化方式执行：
+DuckDB 通过 sqlite 扩展直接挂载 precious_metals.db（开启快照读时挂载最新快照），
+相交的年度分区文件同样挂载，冷数据归档的 npz 列读成 DataFrame 后注册为视图，与库内数据一起查询。
+未安装 duckdb 时退回 SQLite 读取 + pandas 计算，两条路径结果一致。
+
+选择后端: 环境变量 PM_QUERY_BACKEND=auto|duckdb|sqlite（默认 auto，装了 duckdb 就用），
+或在代码中 query_backend.set_backend('sqlite')。
+database.get_pair_history 的分钟级 OHLC 聚合在 DuckDB 后端下也走这里。
+"""
+import os
+import threading
+
+import pandas as pd
+
+from database import (
+    PAIR_ROW_COLUMNS, PAIR_TABLES, BEIJING_OFFSET,
+    attach_partitions, get_read_connection, partition_path, partition_years, read_db_file, to_epoch,
+)
+
+BACKENDS = ('auto', 'duckdb', 'sqlite')
+
+_backend = os.environ.get('PM_QUERY_BACKEND', 'auto').lower()
+_local = threading.local()
+_warned = False
+
+
+def duckdb_available():
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def set_backend(name):
+    """切换查询后端: 'auto'/'duckdb'/'sqlite'"""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的查询后端: {name}")
+    _backend = name
+
+
+def get_backend():
+    """实际使用的后端；要求 duckdb 但未安装时提示一次并退回 sqlite"""
+    global _warned
+    if _backend == 'sqlite':
+        return 'sqlite'
+    if duckdb_available():
+        return 'duckdb'
+    if _backend == 'duckdb' and not _warned:
+        print("  [!] 未安装 duckdb (pip install duckdb)，查询改用 SQLite")
+        _warned = True
+    return 'sqlite'
+
+
+def _duckdb():
+    """当前线程的 DuckDB 连接，查询库文件变化（发布了新快照）时重新挂载"""
+    import duckdb
+    con = getattr(_local, 'duckdb', None)
+    if con is None:
+        con = _local.duckdb = duckdb.connect()
+        con.execute('INSTALL sqlite')
+        con.execute('LOAD sqlite')
+        _local.attached = None
+        _local.partitions = set()
+
+    path = os.path.abspath(read_db_file())
+    if _local.attached != path:
+        if _local.attached is not None:
+            con.execute('DETACH pm')
+        quoted = path.replace("'", "''")
+        con.execute(f"ATTACH '{quoted}' AS pm (TYPE SQLITE, READ_ONLY)")
+        _local.attached = path
+    return con
+
+
+def _duckdb_partitions(con, start_ts, end_ts):
+    """在 DuckDB 连接上挂载与区间相交的年度分区，返回模式名列表"""
+    names = []
+    for year in partition_years(start_ts, end_ts):
+        name = f'y{year}'
+        if name not in _local.partitions:
+            quoted = os.path.abspath(partition_path(year)).replace("'", "''")
+            con.execute(f"ATTACH '{quoted}' AS {name} (TYPE SQLITE, READ_ONLY)")
+            _local.partitions.add(name)
+        names.append(name)
+    return names
+
+
+def close():
+    """关闭当前线程的 DuckDB 连接"""
+    con = getattr(_local, 'duckdb', None)
+    if con is not None:
+        con.close()
+        _local.duckdb = _local.attached = None
+        _local.partitions = set()
+
+
+def _bounds(start, end):
+    bounds = []
+    for value in (start, end):
+        ts = to_epoch(value)
+        if value is not None and ts is None:
+            raise ValueError(f"无法解析时间: {value}")
+        bounds.append(ts)
+    return bounds
+
+
+def _where(pair_names, start_ts, end_ts):
+    clauses, params = [], []
+    if pair_names is not None:
+        clauses.append(f"pair_name IN ({', '.join('?' * len(pair_names))})")
+        params.extend(pair_names)
+    if start_ts is not None:
+        clauses.append('ts >= ?')
+        params.append(start_ts)
+    if end_ts is not None:
+        clauses.append('ts <= ?')
+        params.append(end_ts)
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def _archived(metal, pair_names, start_ts, end_ts, columns):
+    """冷数据归档中的配对数据（带 pair_name 列），没有归档时返回 None"""
+    import archive
+    folder = os.path.join(archive.ARCHIVE_DIR, 'pairs', metal)
+    names = pair_names if pair_names is not None else (
+        sorted(os.listdir(folder)) if os.path.isdir(folder) else [])
+
+    frames = []
+    for name in names:
+        df = archive.load_frame('pairs', metal, name, start_ts, end_ts, columns)
+        if len(df):
+            df.insert(0, 'pair_name', name)
+            frames.append(df[['pair_name'] + columns])
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def _duckdb_source(con, metal, pair_names, start_ts, end_ts, columns):
+    """
+    库内 + 年度分区 + 归档数据的 DuckDB 子查询 (SQL, 参数)
+
+    同一 (pair_name, ts) 在多处都有时只取一条，优先级与 database 的分层读取一致：主库 > 分区 > 归档。
+    """
+    where, params = _where(pair_names, start_ts, end_ts)
+    cols = ', '.join(['pair_name'] + columns)
+    schemas = ['pm'] + _duckdb_partitions(con, start_ts, end_ts)
+    parts = [f'SELECT {cols}, {tier} AS tier FROM {schema}.{PAIR_TABLES[metal]}{where}'
+             for tier, schema in enumerate(schemas)]
+    params = params * len(schemas)
+    archived = _archived(metal, pair_names, start_ts, end_ts, columns)
+    if archived is not None:
+        con.register('archived_pairs', archived)
+        parts.append(f'SELECT {cols}, {len(schemas)} AS tier FROM archived_pairs')
+    if len(parts) == 1:
+        return f'SELECT {cols} FROM pm.{PAIR_TABLES[metal]}{where}', params
+    sql = (f'SELECT {cols} FROM ({" UNION ALL ".join(parts)}) '
+           'QUALIFY ROW_NUMBER() OVER (PARTITION BY pair_name, ts ORDER BY tier) = 1')
+    return sql, params
+
+
+def _query(metal, pair_names, start, end, columns, template):
+    """在 DuckDB 中执行 template（{source} 为数据源子查询），返回 DataFrame"""
+    start_ts, end_ts = _bounds(start, end)
+    con = _duckdb()
+    source, params = _duckdb_source(con, metal, pair_names, start_ts, end_ts, columns)
+    try:
+        return con.execute(template.format(source=source), params).df()
+    finally:
+        if 'archived_pairs' in source:
+            con.unregister('archived_pairs')
+
+
+def _frame(metal, pair_names, start, end, columns):
+    """
+    SQLite 路径：库内 + 年度分区 + 归档数据读成一个按 (pair_name, ts) 排序的 DataFrame
+
+    同一 (pair_name, ts) 在多处都有时只保留一条：主库 > 分区 > 归档（与 _duckdb_source 一致）。
+    """
+    start_ts, end_ts = _bounds(start, end)
+    where, params = _where(pair_names, start_ts, end_ts)
+    cols = ', '.join(['pair_name'] + columns)
+    conn = get_read_connection()
+    frames = [pd.read_sql_query(f'SELECT {cols} FROM {schema}.{PAIR_TABLES[metal]}{where}', conn, params=params)
+              for schema in ['main'] + attach_partitions(conn, start_ts, end_ts)]
+    archived = _archived(metal, pair_names, start_ts, end_ts, columns)
+    if archived is not None:
+        frames.append(archived)
+    if len(frames) == 1:
+        df = frames[0]
+    else:
+        df = pd.concat(frames, ignore_index=True).drop_duplicates(['pair_name', 'ts'], keep='first')
+    return df.sort_values(['pair_name', 'ts'], kind='stable').reset_index(drop=True)
+
+
+def records(df):
+    """DataFrame -> 元组列表，数值转为 Python 类型、缺失值转为 None（便于 JSON 输出）"""
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def load_pairs(metal, pair_names=None, start=None, end=None, columns=None):
+    """
+    多配对扫描：返回指定配对（默认全部）在区间内的原始数据，含冷数据归档
+
+    结果带 pair_name 列，按 (pair_name, ts) 升序。
+    """
+    columns = list(columns or PAIR_ROW_COLUMNS)
+    if 'ts' not in columns:
+        columns = ['ts'] + columns
+    if get_backend() == 'sqlite':
+        return _frame(metal, pair_names, start, end, columns)
+    return _query(metal, pair_names, start, end, columns,
+                  'SELECT * FROM ({source}) ORDER BY pair_name, ts')
+
+
+def pair_summary(metal, start=None, end=None):
+    """
+    区间内每个配对的价差统计，返回以 pair_name 为索引的 DataFrame:
+    count, avg, std (总体标准差), min, max, last (最新价差), last_ts, zscore (最新值偏离均值的标准差倍数)
+    区间内有数据但价差全为空的配对同样列出（count 为 0，其余为空），两个后端返回相同的行。
+    """
+    columns = ['ts', 'spread_pct']
+    if get_backend() == 'sqlite':
+        df = _frame(metal, None, start, end, columns)
+        spread = df.groupby('pair_name')['spread_pct']
+        latest = df.dropna(subset=['spread_pct']).groupby('pair_name').last()
+        summary = pd.DataFrame({
+            'count': spread.count(), 'avg': spread.mean(), 'std': spread.std(ddof=0),
+            'min': spread.min(), 'max': spread.max(),
+            'last': latest['spread_pct'], 'last_ts': latest['ts'],
+        })
+    else:
+        summary = _query(metal, None, start, end, columns, '''
+            SELECT pair_name, COUNT(spread_pct) AS count, AVG(spread_pct) AS avg,
+                   STDDEV_POP(spread_pct) AS std, MIN(spread_pct) AS min, MAX(spread_pct) AS max,
+                   ARG_MAX(spread_pct, ts) FILTER (WHERE spread_pct IS NOT NULL) AS last,
+                   MAX(ts) FILTER (WHERE spread_pct IS NOT NULL) AS last_ts
+            FROM ({source})
+            GROUP BY pair_name
+            ORDER BY pair_name
+        ''').set_index('pair_name')
+    summary['zscore'] = (summary['last'] - summary['avg']) / summary['std'].where(summary['std'] > 0)
+    return summary
+
+
+def pair_ohlc(metal, pair_name, step, start=None, end=None, limit=None):
+    """
+    单个配对按任意步长（秒，北京时间对齐）聚合的价差 K 线，按桶升序，含冷数据归档
+
+    列为 bucket, gfex_price, cme_usd, cme_cny, spread（桶内最后一条）, close, open, high, low, sum, count，
+    与 pair_rollups 的查询列一致；limit 为最近的桶数。
+    """
+    columns = list(PAIR_ROW_COLUMNS)
+    if get_backend() == 'sqlite':
+        df = _frame(metal, [pair_name], start, end, columns)
+        df['bucket'] = (df['ts'] + BEIJING_OFFSET) // step * step - BEIJING_OFFSET
+        # 数据已按 ts 排序：每桶首行即开盘行，末行即收盘行
+        first = df.drop_duplicates('bucket', keep='first').set_index('bucket')
+        last = df.drop_duplicates('bucket', keep='last').set_index('bucket')
+        spread = df.groupby('bucket')['spread_pct']
+        result = pd.DataFrame({
+            'gfex_price': last['gfex_price'], 'cme_usd': last['cme_usd'], 'cme_cny': last['cme_cny'],
+            'spread': last['spread'], 'close': last['spread_pct'], 'open': first['spread_pct'],
+            'high': spread.max(), 'low': spread.min(), 'sum': spread.sum(), 'count': spread.count(),
+        }).rename_axis('bucket').reset_index()
+        return result.tail(limit).reset_index(drop=True) if limit else result
+
+    sql = f'''
+        SELECT (ts + {BEIJING_OFFSET}) // {int(step)} * {int(step)} - {BEIJING_OFFSET} AS bucket,
+               ARG_MAX(gfex_price, ts) AS gfex_price, ARG_MAX(cme_usd, ts) AS cme_usd,
+               ARG_MAX(cme_cny, ts) AS cme_cny, ARG_MAX(spread, ts) AS spread,
+               ARG_MAX(spread_pct, ts) AS close, ARG_MIN(spread_pct, ts) AS open,
+               MAX(spread_pct) AS high, MIN(spread_pct) AS low,
+               SUM(spread_pct) AS sum, COUNT(spread_pct) AS count
+        FROM ({{source}})
+        GROUP BY bucket
+        ORDER BY bucket DESC
+    '''
+    if limit:
+        sql += f' LIMIT {int(limit)}'
+    df = _query(metal, [pair_name], start, end, columns, sql)
+    return df.iloc[::-1].reset_index(drop=True)
+
+
+def rolling_zscore(metal, pair_name, window=240, start=None, end=None):
+    """
+    价差滚动 Z 分数（窗口函数）：返回 ts, spread_pct, mean, std, zscore
+
+    window 为窗口内的数据条数（分钟数据即分钟数），窗口不满时按已有数据计算。
+    """
+    columns = ['ts', 'spread_pct']
+    if get_backend() == 'sqlite':
+        df = _frame(metal, [pair_name], start, end, columns)[columns]
+        rolling = df['spread_pct'].rolling(window, min_periods=1)
+        df['mean'] = rolling.mean()
+        df['std'] = rolling.std(ddof=0)
+    else:
+        df = _query(metal, [pair_name], start, end, columns, f'''
+            SELECT ts, spread_pct, AVG(spread_pct) OVER w AS mean, STDDEV_POP(spread_pct) OVER w AS std
+            FROM ({{source}})
+            WINDOW w AS (ORDER BY ts ROWS BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW)
+            ORDER BY ts
+        ''')
+    df['zscore'] = (df['spread_pct'] - df['mean']) / df['std'].where(df['std'] > 0)
+    return df
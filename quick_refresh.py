@@ -9,13 +9,13 @@ if platform.system() == 'Windows':
     os.environ['HTTP_PROXY'] = 'http://127.0.0.1:7890'
     os.environ['HTTPS_PROXY'] = 'http://127.0.0.1:7890'
 
-import json
-import sqlite3
+from json_artifacts import write_json
 import akshare as ak
 import pandas as pd
 from datetime import datetime
+from database import get_all_pairs, get_latest_bar, get_pair_history, get_pair_json_stats
+import write_queue
 
-DB_FILE = 'precious_metals.db'
 OZ_TO_GRAM = 31.1035
 RATE = 7.04
 
@@ -44,16 +44,8 @@ def get_latest_cme_price(symbol, use_scraper=True):
                 price, data_time = scraper.get_price_with_time(symbol, 'NYMEX')
                 if price:
                     time_str = data_time.strftime('%Y-%m-%d %H:%M') if data_time else datetime.now().strftime('%Y-%m-%d %H:%M')
-                    # 保存到数据库
-                    conn = sqlite3.connect(DB_FILE)
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO cme_platinum_contracts 
-                        (contract, datetime, open, high, low, close, volume)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (symbol, time_str, price, price, price, price, 0))
-                    conn.commit()
-                    conn.close()
+                    # 放入写入队列
+                    write_queue.put_bar(symbol, time_str, price, price, price, price)
                     return {'price': price, 'datetime': time_str, 'realtime': True}
             finally:
                 scraper.close()
@@ -62,14 +54,7 @@ def get_latest_cme_price(symbol, use_scraper=True):
     
     # 2. 回退到数据库
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT close, datetime FROM cme_platinum_contracts 
-            WHERE contract = ? ORDER BY datetime DESC LIMIT 1
-        ''', (symbol,))
-        row = cursor.fetchone()
-        conn.close()
+        row = get_latest_bar(symbol)
         if row:
             return {'price': row[0], 'datetime': row[1], 'realtime': False}
     except Exception as e:
@@ -85,19 +70,8 @@ def update_pair_latest(metal, pair_name, gfex_contract, cme_contract, gfex_data,
     spread_pct = (spread / cme_cny) * 100
     datetime_str = gfex_data['datetime']
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    table = 'platinum_pairs' if metal == 'platinum' else 'palladium_pairs'
-    
-    cursor.execute(f'''
-        INSERT OR REPLACE INTO {table} 
-        (pair_name, gfex_contract, cme_contract, datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (pair_name, gfex_contract, cme_contract, datetime_str, gfex_price, cme_usd, cme_cny, spread, spread_pct))
-    
-    conn.commit()
-    conn.close()
+    write_queue.put_pair(metal, pair_name, gfex_contract, cme_contract, datetime_str,
+                         gfex_price, cme_usd, cme_cny, spread, spread_pct)
     
     return {
         'gfex_price': gfex_price,
@@ -145,16 +119,8 @@ def quick_refresh():
                 price, data_time = scraper.get_price_with_time(sym, 'NYMEX')
                 if price:
                     time_str = data_time.strftime('%Y-%m-%d %H:%M') if data_time else datetime.now().strftime('%Y-%m-%d %H:%M')
-                    # 保存到数据库
-                    conn = sqlite3.connect(DB_FILE)
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO cme_platinum_contracts 
-                        (contract, datetime, open, high, low, close, volume)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (sym, time_str, price, price, price, price, 0))
-                    conn.commit()
-                    conn.close()
+                    # 放入写入队列（按合约代码归入铂金/钯金）
+                    write_queue.put_bar(sym, time_str, price, price, price, price)
                     cme_prices[sym] = {'price': price, 'datetime': time_str}
                     print(f"    {sym}: ${price} @ {time_str} (实时)")
         finally:
@@ -207,7 +173,8 @@ def quick_refresh():
             print(f"    {pair_name}: 价差 {result['spread_pct']:+.2f}%")
             updated_count += 1
     
-    # 更新JSON文件（从数据库读取最新数据）
+    # 更新JSON文件（从数据库读取最新数据，先等写入队列提交完）
+    write_queue.flush()
     print("  更新JSON文件...")
     update_json_files()
     
@@ -216,64 +183,22 @@ def quick_refresh():
 
 def update_json_files():
     """从数据库读取最新数据并更新JSON文件"""
-    conn = sqlite3.connect(DB_FILE)
-    
-    for metal, table, json_file in [
-        ('platinum', 'platinum_pairs', 'platinum_all_pairs.json'),
-        ('palladium', 'palladium_pairs', 'palladium_all_pairs.json')
+    for metal, json_file in [
+        ('platinum', 'platinum_all_pairs.json'),
+        ('palladium', 'palladium_all_pairs.json')
     ]:
-        cursor = conn.cursor()
-        
-        # 获取每个配对的最新数据
-        cursor.execute(f'''
-            SELECT pair_name, gfex_contract, cme_contract, datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct
-            FROM {table}
-            WHERE (pair_name, datetime) IN (
-                SELECT pair_name, MAX(datetime) FROM {table} GROUP BY pair_name
-            )
-        ''')
-        
+        # 每个配对的最新数据直接取自 pair_latest
         pairs = {}
-        for row in cursor.fetchall():
-            pair_name = row[0]
-            
+        for pair_name, latest in get_all_pairs(metal).items():
             # 获取该配对的历史数据
-            cursor.execute(f'''
-                SELECT datetime, gfex_price, cme_usd, cme_cny, spread, spread_pct
-                FROM {table}
-                WHERE pair_name = ?
-                ORDER BY datetime DESC
-                LIMIT 5000
-            ''', (pair_name,))
-            
-            history = [{'date': r[0], 'gfex_price': r[1], 'cme_usd': r[2], 
-                       'cme_cny': r[3], 'spread': r[4], 'spread_pct': r[5]} 
-                      for r in reversed(cursor.fetchall())]
-            
-            # 计算统计数据
-            spreads = [h['spread_pct'] for h in history] if history else []
-            stats = None
-            if spreads:
-                import numpy as np
-                stats = {
-                    'avg_spread_pct': float(np.mean(spreads)),
-                    'max_spread_pct': float(np.max(spreads)),
-                    'min_spread_pct': float(np.min(spreads))
-                }
+            history = get_pair_history(metal, pair_name, limit=5000)
             
             pairs[pair_name] = {
-                'gfex_contract': row[1],
-                'cme_contract': row[2],
+                'gfex_contract': latest['gfex_contract'],
+                'cme_contract': latest['cme_contract'],
                 'pair_name': pair_name,
-                'current': {
-                    'datetime': row[3],
-                    'gfex_price': row[4],
-                    'cme_usd': row[5],
-                    'cme_cny': row[6],
-                    'spread': row[7],
-                    'spread_pct': row[8]
-                },
-                'stats': stats,
+                'current': latest['current'],
+                'stats': get_pair_json_stats(metal, pair_name),  # 统计数据由写入路径维护，直接读取
                 'history': history
             }
         
@@ -282,12 +207,10 @@ def update_json_files():
             'pairs': pairs
         }
         
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
+        write_json(json_file, output)
         
         print(f"    {json_file}: {len(pairs)} 个配对")
     
-    conn.close()
 
 if __name__ == '__main__':
     quick_refresh()
@@ -0,0 +1,154 @@
+"""
+行情聚合器（内存中保存最新报价，后台按各数据源的 TTL 并行刷新）
+/api/prices 原先每个请求都依次请求新浪行情、查库/akshare、中行汇率，现在直接读内存:
+  - 每个数据源有自己的 TTL，后台线程发现过期就提交刷新，各数据源在线程池中并行获取；
+  - 同一数据源同一时刻只有一个上游请求（single-flight），刷新期间到达的请求不会再发起请求，
+    已有旧值时直接返回旧值，还没有值时等待同一次获取的结果；
+  - 获取失败时保留上一次的值并记录错误，该字段的 age 继续增大，隔一个 TTL 再重试；
+  - 超过 IDLE_AFTER 秒没有请求时后台暂停刷新，不替无人查看的页面轮询上游。
+
+用法:
+    import quote_aggregator
+    quotes = quote_aggregator.QuoteAggregator({
+        'gfex': (get_gfex_prices, 10),          # 名称: (获取函数, TTL 秒)
+        'exchange_rate': (get_exchange_rate, 600),
+    })
+    quotes.start()                   # 启动后台刷新（并立即获取一次）
+    quotes.snapshot()                # {名称: {'value', 'fetched_at', 'age', 'error'}}
+    quotes.get_stats()               # 各数据源的获取次数、合并的请求数、耗时等
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CHECK_INTERVAL = 1                # 后台检查过期的间隔（秒）
+IDLE_AFTER = 600                  # 多久没有请求后暂停后台刷新（秒）
+FIRST_FETCH_WAIT = 15             # 还没有值时等待首次获取的秒数
+
+
+class QuoteSource:
+    """一个数据源的最新值与刷新状态"""
+
+    def __init__(self, name, fetch, ttl):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.value = None
+        self.fetched_at = None        # 最近一次成功获取的时间 (time.time)
+        self.error = None             # 最近一次获取失败的原因（成功后清空）
+        self.failed_at = None         # 最近一次获取失败的时间，失败后隔一个 TTL 再重试
+        self.future = None            # 在途的获取
+        self.stats = {'fetches': 0, 'failures': 0, 'coalesced': 0, 'last_duration_ms': None}
+
+    def age(self, now=None):
+        return None if self.fetched_at is None else (now or time.time()) - self.fetched_at
+
+    def stale(self, now=None):
+        now = now or time.time()
+        if self.failed_at is not None and now - self.failed_at < self.ttl:
+            return False
+        age = self.age(now)
+        return age is None or age >= self.ttl
+
+
+class QuoteAggregator:
+    """
+    按数据源缓存的报价集合
+
+    sources: {名称: (无参获取函数, TTL 秒)}。获取函数在线程池中执行，抛出异常视为失败。
+    """
+
+    def __init__(self, sources, idle_after=IDLE_AFTER):
+        self.sources = {name: QuoteSource(name, fetch, ttl) for name, (fetch, ttl) in sources.items()}
+        self.idle_after = idle_after
+        self.last_request = time.time()
+        self._executor = ThreadPoolExecutor(len(self.sources), thread_name_prefix='quotes')
+        self._lock = threading.Lock()
+
+    def _run(self, source):
+        started = time.perf_counter()
+        value, error = None, None
+        try:
+            value = source.fetch()
+        except Exception as e:
+            error = e
+        with self._lock:
+            # 结果与清除在途标记在同一把锁内完成，之后的请求要么看到新值，要么发起新的获取
+            source.future = None
+            source.stats['fetches'] += 1
+            source.stats['last_duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            if error is None:
+                source.value, source.fetched_at = value, time.time()
+                source.error, source.failed_at = None, None
+            else:
+                source.error, source.failed_at = str(error), time.time()
+                source.stats['failures'] += 1
+        if error is not None:
+            print(f"[行情] {source.name} 获取失败: {error}")
+            raise error
+        return value
+
+    def refresh(self, name):
+        """提交一次获取并返回其 Future；已有在途获取时直接返回那一个（single-flight）"""
+        source = self.sources[name]
+        with self._lock:
+            if source.future is not None:
+                source.stats['coalesced'] += 1
+                return source.future
+            source.future = self._executor.submit(self._run, source)
+            return source.future
+
+    def refresh_stale(self):
+        """并行刷新所有过期的数据源，返回提交的数据源名称"""
+        now = time.time()
+        stale = [name for name, source in self.sources.items() if source.stale(now)]
+        for name in stale:
+            self.refresh(name)
+        return stale
+
+    def snapshot(self, wait=FIRST_FETCH_WAIT):
+        """
+        各数据源的最新值 {名称: {'value', 'fetched_at', 'age', 'error'}}
+
+        过期的数据源先返回旧值并在后台刷新；从未获取成功的数据源最多等待 wait 秒。
+        """
+        self.last_request = time.time()
+        for name in self.refresh_stale():
+            source = self.sources[name]
+            if source.fetched_at is None and wait:
+                future = source.future
+                try:
+                    if future is not None:
+                        future.result(timeout=wait)
+                except Exception:
+                    pass
+        now = time.time()
+        with self._lock:
+            return {name: {'value': source.value, 'fetched_at': source.fetched_at,
+                           'age': None if source.fetched_at is None else round(source.age(now), 3),
+                           'error': source.error}
+                    for name, source in self.sources.items()}
+
+    def watch(self, interval=CHECK_INTERVAL):
+        """后台循环：有人在看（最近有请求）时按 TTL 刷新过期的数据源"""
+        while True:
+            if time.time() - self.last_request < self.idle_after:
+                try:
+                    self.refresh_stale()
+                except Exception as e:
+                    print(f"[行情] 后台刷新出错: {e}")
+            time.sleep(interval)
+
+    def start(self, interval=CHECK_INTERVAL):
+        self.refresh_stale()
+        thread = threading.Thread(target=self.watch, args=(interval,), daemon=True)
+        thread.start()
+        return thread
+
+    def get_stats(self):
+        now = time.time()
+        with self._lock:
+            return {name: dict(source.stats, ttl=source.ttl, in_flight=source.future is not None,
+                               age=None if source.fetched_at is None else round(source.age(now), 1),
+                               error=source.error)
+                    for name, source in self.sources.items()}
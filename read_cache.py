@@ -0,0 +1,128 @@
+"""
+数据库读缓存（进程内 LRU，按数据版本失效）
+数据只在采集/同步时变化，API 的重复请求不必每次都查库：查询结果按
+(函数, 参数, 数据版本) 缓存，写入路径每次有变化的写入都会递增 meta 表中的
+data_version，版本一变旧条目全部作废。缓存总大小按估算的内存字节数限制，
+超出时淘汰最久未使用的条目。
+
+用法:
+    import read_cache
+    cached_pairs = read_cache.cached(get_all_pairs)
+    cached_pairs('platinum')        # 数据版本不变时只是一次字典查找
+    read_cache.get_stats()          # 命中率、条目数、占用字节等
+注意: 返回的是缓存中的共享对象，调用方不要修改。
+"""
+import functools
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from database import get_data_version
+
+MAX_BYTES = 64 * 1024 * 1024      # 缓存总大小上限（估算值）
+
+
+def sizeof(value):
+    """估算对象占用的内存字节数（递归计算容器内容）"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(v) for v in value)
+    return size
+
+
+class ReadCache:
+    """按字节数限制大小的 LRU 缓存，键中包含数据版本"""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()     # key -> (value, size)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _check_version(self, version):
+        # 数据版本变化后旧条目不会再被命中，直接整体清掉释放内存
+        if version != self._version:
+            if self._entries:
+                self._stats['invalidations'] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key, version):
+        """命中返回 (True, 值)，未命中返回 (False, None)"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return True, entry[0]
+
+    def put(self, key, version, value):
+        size = sizeof(value)
+        with self._lock:
+            if self._version is None:
+                self._check_version(version)
+            # 计算期间数据版本已经变化（结果来自旧版本，且不能清掉新版本的条目），
+            # 或单个结果超过上限时不缓存
+            if version != self._version or size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'entries': len(self._entries), 'bytes': self._bytes,
+                          'max_bytes': self.max_bytes, 'data_version': self._version})
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def cached(self, func):
+        """装饰器：按 (函数名, 参数, 数据版本) 缓存函数结果，参数必须可哈希"""
+        name = f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            version = get_data_version()
+            key = (name, args, tuple(sorted(kwargs.items())))
+            hit, value = self.get(key, version)
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            self.put(key, version, value)
+            return value
+
+        return wrapper
+
+
+# 进程内共享的默认缓存
+_default = ReadCache()
+
+cached = _default.cached
+get_stats = _default.get_stats
+clear = _default.clear
@@ -0,0 +1,186 @@
+"""
+数据刷新任务队列（单工作线程，同类任务去重）
+POST /api/refresh-data 原先在请求线程里同步执行整个数据同步（采集脚本或 git pull），连接可能
+被占用几分钟，并且多次点击会同时启动多轮同步。现在请求只提交任务并立即返回任务 id:
+  - 所有刷新（手动触发、定时调度、启动时的首次同步）都进入同一个队列，由一个工作线程依次执行，
+    不会重叠；
+  - 同类任务已在排队时，新的请求并入该任务（返回同一个 id），不再另起一轮；正在执行的任务
+    可能已经读过请求想要的数据，这时排一个后续任务（每类最多一个），之后的请求都并入它；
+  - 任务记录每个阶段的起止与耗时，GET /api/jobs/<id> 查询；只保留最近 KEEP_JOBS 个任务。
+
+用法:
+    import refresh_jobs
+    jobs = refresh_jobs.JobManager()
+    jobs.start()
+    job, created = jobs.submit('sync', run_data_sync, source='api')   # run_data_sync(job) -> (成功, 消息)
+    job.wait(timeout)                 # 定时调度等需要等待结果时
+    jobs.get(job.id).to_dict()        # 状态、各阶段耗时、结果
+任务函数内用 with job.stage('名称'): ... 记录阶段耗时。
+"""
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+KEEP_JOBS = 50                    # 保留的最近任务数
+
+
+def _format_time(ts):
+    return None if ts is None else datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
+@contextmanager
+def untimed_stage(name):
+    """不在任务中执行时代替 Job.stage"""
+    yield {}
+
+
+class Job:
+    """一次刷新任务：状态 queued -> running -> succeeded / failed，及各阶段耗时"""
+
+    def __init__(self, kind, func, source):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.func = func
+        self.sources = [source]           # 提交（及并入）该任务的来源，如 api / scheduler
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = []
+        self.message = None
+        self._done = threading.Event()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        记录一个阶段的耗时
+
+        阶段内抛出的异常会标记该阶段失败后继续抛出；不中断流程的失败可在返回的记录中写入 error。
+        """
+        record = {'name': name, 'status': 'running', 'started_at': _format_time(time.time()), 'seconds': None}
+        self.stages.append(record)
+        started = time.perf_counter()
+        try:
+            yield record
+            record['status'] = 'failed' if record.get('error') else 'succeeded'
+        except Exception as e:
+            record['status'] = 'failed'
+            record['error'] = str(e)
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 3)
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'sources': list(self.sources),
+            'created_at': _format_time(self.created_at),
+            'started_at': _format_time(self.started_at),
+            'finished_at': _format_time(self.finished_at),
+            'queued_seconds': round((self.started_at or now) - self.created_at, 3),
+            'run_seconds': None if self.started_at is None else round((self.finished_at or now) - self.started_at, 3),
+            'stages': [dict(stage) for stage in self.stages],
+            'message': self.message,
+        }
+
+
+class JobManager:
+    """
+    单工作线程的任务队列
+
+    on_change(job) 在任务开始和结束时调用（如推送任务状态），异常不影响任务本身。
+    """
+
+    def __init__(self, keep=KEEP_JOBS, on_change=None):
+        self.keep = keep
+        self.on_change = on_change
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()        # id -> Job（最近的在后）
+        self._queued = {}                 # 类型 -> 排队中（尚未开始执行）的 Job
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, source='api'):
+        """
+        提交任务，返回 (任务, 是否新建)
+
+        同类任务已在排队时不新建，直接返回该任务（并记录来源）；同类任务正在执行时
+        新建一个排在其后的任务，执行中的任务不会再读到提交之后才有的数据。
+        """
+        with self._lock:
+            job = self._queued.get(kind)
+            if job is not None:
+                job.sources.append(source)
+                return job, False
+            job = Job(kind, func, source)
+            self._queued[kind] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done:
+                    break
+                self._jobs.popitem(last=False)
+        self._queue.put(job)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def recent(self, limit=10):
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())][:limit]
+
+    def _notify(self, job):
+        if self.on_change is not None:
+            try:
+                self.on_change(job)
+            except Exception as e:
+                print(f"任务状态通知失败: {e}")
+
+    def _run(self, job):
+        with self._lock:
+            # 开始执行后不再并入新请求，之后的提交另排一个任务
+            if self._queued.get(job.kind) is job:
+                del self._queued[job.kind]
+            job.status = 'running'
+        job.started_at = time.time()
+        self._notify(job)
+        try:
+            success, message = job.func(job)
+            job.status = 'succeeded' if success else 'failed'
+            job.message = message
+        except Exception as e:
+            job.status = 'failed'
+            job.message = str(e)
+        finally:
+            job.finished_at = time.time()
+            job._done.set()
+            self._notify(job)
+
+    def worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:
+                print(f"任务 {job.id} 执行出错: {e}")
+
+    def start(self):
+        thread = threading.Thread(target=self.worker, name='refresh-jobs', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,107 @@
+"""
+测试冷数据归档 (archive.py)
+在临时目录里建库与归档，不会碰到 precious_metals.db 和 archive/:
+  - 归档后该月的行移出数据库，按列写入 npz，只读取需要的列；
+  - 分钟级 get_pair_history / load_bars 透明合并归档与库内数据，结果与归档前相同；
+  - 汇总表留在库中，5m/1h/1d 查询不受影响；
+  - 写入路径跳过已归档月份的行；库里留下的迟到数据在再次归档时合并，库内数据优先；
+    dry_run 不做修改。
+用法: python test_archive.py
+"""
+import os
+
+import pandas as pd
+
+import archive
+import database
+from test_helpers import check, finish, header, temp_database
+
+PAIR = '2610-2610'
+
+
+def history(start, hours, pct=2.0):
+    dates = pd.date_range(start, periods=hours, freq='h')
+    return [{'date': d.strftime('%Y-%m-%d %H:%M'), 'gfex_price': 500.0, 'cme_usd': 2000.0,
+             'cme_cny': 450.0, 'spread': 50.0, 'spread_pct': pct + i / 100} for i, d in enumerate(dates)]
+
+
+def bars(start, hours, close=500.0):
+    index = pd.date_range(start, periods=hours, freq='h')
+    return pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+                         'volume': 1, 'hold': 10}, index=index)
+
+
+def pair_rows(start, end):
+    conn = database.get_connection()
+    return conn.execute('SELECT COUNT(*) FROM platinum_pairs WHERE pair_name = ? AND ts >= ? AND ts < ?',
+                        (PAIR, start, end)).fetchone()[0]
+
+
+def check_pairs():
+    print("\n【配对价差】")
+    # 2026-08-31 00:00 起 48 小时，跨 8 月和 9 月
+    database.save_pair_history('platinum', PAIR, 'PT2610', 'PLV2026', history('2026-08-31 00:00', 48))
+    before = database.get_pair_history('platinum', PAIR, limit=100)
+    hourly = database.get_pair_history('platinum', PAIR, resolution='1h', limit=100)
+
+    check(archive.archive_month('pairs', 'platinum', PAIR, '2026-08', dry_run=True) == 24, "dry_run 报告可归档行数")
+    check(not archive.archived_months('pairs', 'platinum', PAIR), "dry_run 不写文件")
+    rows = archive.archive_month('pairs', 'platinum', PAIR, '2026-08')
+    start, end = archive.month_range('2026-08')
+    check(rows == 24 and pair_rows(start, end) == 0, f"8 月 {rows} 行移出数据库")
+    check(archive.archived_months('pairs', 'platinum', PAIR) == ['2026-08'], "归档文件按月存放")
+
+    columns = archive.read_columns(archive.archive_path('pairs', 'platinum', PAIR, '2026-08'), ['ts', 'spread_pct'])
+    check(sorted(columns) == ['spread_pct', 'ts'] and len(columns['ts']) == 24, "只读取指定的列")
+
+    after = database.get_pair_history('platinum', PAIR, limit=100)
+    check(after == before, "分钟级查询合并归档与库内数据，结果与归档前相同")
+    ranged = database.get_pair_history('platinum', PAIR, '2026-08-31 22:00', '2026-09-01 01:00')
+    check([h['date'] for h in ranged] == ['2026-08-31 22:00', '2026-08-31 23:00', '2026-09-01 00:00',
+                                          '2026-09-01 01:00'], f"跨归档边界的区间查询: {[h['date'] for h in ranged]}")
+    check(database.get_pair_history('platinum', PAIR, resolution='1h', limit=100) == hourly, "1h 汇总不受归档影响")
+
+    late = history('2026-08-31 10:00', 1, pct=9.0) + history('2026-08-15 00:00', 1, pct=7.0)
+    result = database.bulk_ingest_spreads('platinum', PAIR, 'PT2610', 'PLV2026', late)
+    check(result['inserted'] + result['updated'] == 0 and pair_rows(start, end) == 0, "写入路径跳过已归档月份的行")
+
+    # 归档只读之前留在库里的迟到数据，直接写表模拟
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO platinum_pairs (pair_name, ts, gfex_contract, cme_contract, gfex_price, cme_usd, cme_cny, '
+            'spread, spread_pct) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(PAIR, database.to_epoch(h['date']), 'PT2610', 'PLV2026', h['gfex_price'], h['cme_usd'],
+              h['cme_cny'], h['spread'], h['spread_pct']) for h in late])
+    rows = archive.archive_month('pairs', 'platinum', PAIR, '2026-08')
+    merged = database.get_pair_history('platinum', PAIR, '2026-08-01 00:00', '2026-08-31 23:59', limit=100)
+    values = {h['date']: h['spread_pct'] for h in merged}
+    check(rows == 25 and pair_rows(start, end) == 0, f"迟到数据再次归档时合并: {rows} 行")
+    check(values['2026-08-31 10:00'] == 9.0 and values['2026-08-15 00:00'] == 7.0, "库内数据优先于旧归档")
+
+
+def check_bars():
+    print("\n【合约K线】")
+    database.bulk_ingest_bars('PT2610', bars('2026-08-31 00:00', 48))
+    before = database.load_bars('PT2610')
+    rows = archive.archive_month('bars', 'platinum', 'PT2610', '2026-08')
+    check(rows == 24, f"K线按月归档: {rows} 行")
+    after = database.load_bars('PT2610')
+    check(after.index.equals(before.index) and after['close'].tolist() == before['close'].tolist(),
+          "load_bars 合并归档与库内K线")
+    check(len(database.load_bars('PT2610', limit=30)) == 30, "limit 跨越归档边界")
+    check(archive.archive_month('bars', 'platinum', 'PT9999', '2026-08') == 0, "未登记的合约不归档")
+
+
+def main():
+    header("测试冷数据归档")
+    temp_database('test_archive_')
+    archive.ARCHIVE_DIR = os.path.abspath('archive')
+
+    check_pairs()
+    check_bars()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+测试 asyncio HTTP/1.1 服务器 (async_server.AsyncHTTPServer)
+在本机随机端口启动服务器，用测试自己的路由，不依赖 akshare 和数据库:
+  - 同一个 keep-alive 连接上连续处理多个请求，Connection: close 后关闭连接；
+  - db/upstream 类路由在各自的线程池执行，inline 路由在事件循环线程执行；
+  - 上游名额占满时排队，超过 UPSTREAM_WAIT 返回 503；
+  - 404、处理函数异常 (500)、格式错误的请求 (400)、HEAD 只返回响应头；
+  - 统计连接数、请求数与耗时分位数。
+用法: python test_async_server.py
+"""
+import http.client
+import json
+import socket
+import threading
+import time
+
+import async_server
+from async_server import AsyncHTTPServer
+from test_helpers import check, finish, header
+
+
+def reply(payload, status=200):
+    return status, {'Content-Type': 'application/json'}, json.dumps(payload).encode('utf-8')
+
+
+def where(request):
+    return reply({'thread': threading.current_thread().name, 'name': request.param('name')})
+
+
+def slow(request):
+    time.sleep(1)
+    return reply({'ok': True})
+
+
+def fail(request):
+    raise RuntimeError('boom')
+
+
+def echo(request):
+    return reply(request.json())
+
+
+ROUTES = {
+    '/db': (where, 'db'),
+    '/inline': (where, 'inline'),
+    '/upstream': (where, 'upstream'),
+    '/slow': (slow, 'upstream'),
+    '/fail': (fail, 'db'),
+    '/echo': (echo, 'db'),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server():
+    server = AsyncHTTPServer(lambda request: ROUTES.get(request.path), '127.0.0.1', free_port(), max_upstream=1)
+    threading.Thread(target=server.serve_forever, name='api-loop', daemon=True).start()
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', server.port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return server
+
+
+def get(conn, path, method='GET', body=None, headers=None):
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    return response, json.loads(data) if data else None
+
+
+def check_keep_alive(server):
+    print("\n【keep-alive 与路由】")
+    before = server.stats.get_stats()['total_connections']
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    first, db = get(conn, '/db?name=pt')
+    _, inline = get(conn, '/inline')
+    _, upstream = get(conn, '/upstream')
+    check(first.status == 200 and db['name'] == 'pt', "查询参数传给处理函数")
+    check(server.stats.get_stats()['total_connections'] == before + 1, "同一个连接上处理多个请求")
+    check(db['thread'].startswith('api-db') and upstream['thread'].startswith('api-upstream'),
+          f"db/upstream 路由在各自的线程池执行: {db['thread']}, {upstream['thread']}")
+    check(inline['thread'] == 'api-loop', f"inline 路由在事件循环线程执行: {inline['thread']}")
+
+    _, echoed = get(conn, '/echo', 'POST', json.dumps({'price': 500}), {'Content-Type': 'application/json'})
+    check(echoed == {'price': 500}, "读取请求体")
+    head, body = get(conn, '/db', 'HEAD')
+    check(head.status == 200 and int(head.getheader('Content-Length')) > 0 and body is None, "HEAD 只返回响应头")
+
+    missing, error = get(conn, '/nowhere')
+    check(missing.status == 404 and error == {'error': 'Not Found'}, "未知路径返回 404")
+    failed, error = get(conn, '/fail')
+    check(failed.status == 500 and error == {'error': 'boom'}, "处理函数异常返回 500，连接继续可用")
+
+    closing, _ = get(conn, '/db', headers={'Connection': 'close'})
+    check(closing.getheader('Connection') == 'close', "Connection: close 时响应后关闭")
+    conn.close()
+
+
+def check_bad_request(server):
+    print("\n【格式错误的请求】")
+    with socket.create_connection(('127.0.0.1', server.port), timeout=10) as sock:
+        sock.sendall(b'NONSENSE\r\n\r\n')
+        data = sock.recv(4096)
+    check(data.startswith(b'HTTP/1.1 400'), f"返回 400: {data[:20]}")
+
+
+def check_upstream_limit(server):
+    print("\n【上游并发上限】")
+    async_server.UPSTREAM_WAIT = 0.3
+    results = {}
+
+    def call(name):
+        conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+        results[name] = get(conn, '/slow')[0].status
+        conn.close()
+
+    first = threading.Thread(target=call, args=('first',))
+    first.start()
+    time.sleep(0.2)
+    call('second')
+    first.join()
+    check(results == {'first': 200, 'second': 503}, f"名额占满时排队超时返回 503: {results}")
+    check(server.stats.get_stats()['rejected'] >= 1, "503 计入 rejected")
+
+
+def check_stats(server):
+    print("\n【统计】")
+    stats = server.stats.get_stats()
+    check(stats['requests'] >= 10 and stats['errors'] >= 2, f"请求与错误计数: {stats['requests']}, {stats['errors']}")
+    latency = stats.get('latency_ms', {})
+    check(latency.get('p50', -1) <= latency.get('p99', -1) <= latency.get('max', -1), f"耗时分位数: {latency}")
+    check(stats['in_flight'].get('upstream') == 0, "上游在途数归零")
+
+
+def main():
+    header("测试 asyncio HTTP 服务器")
+    server = start_server()
+
+    check_keep_alive(server)
+    check_bad_request(server)
+    check_upstream_limit(server)
+    check_stats(server)
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+测试K线缺口检测与补数计划 (backfill_planner.py)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 广期所日盘/夜盘与节假日、CME Globex 的交易时段；
+  - 已有K线之间超过容差的交易时间才算缺口，休市时段不算；
+  - tvDatafeed 只抓一次，条数刚好够到最早的缺口；1分钟线够不到的旧缺口改用更粗的周期；
+  - plan_instrument 从库中 5m 汇总读出已有K线时间，in_gaps 只保留缺口内的K线。
+用法: python test_backfill_planner.py
+"""
+import pandas as pd
+
+import backfill_planner as bp
+import database
+from test_helpers import check, finish, header, temp_database
+
+NOW = database.to_epoch('2026-10-15 15:00') + 30     # 芝加哥时间周四 02:00，CME 交易中
+
+
+def minutes(start_ts, now, holes=()):
+    """CME 交易时段内每分钟一根K线的时间，holes 为要挖掉的 [开始, 结束) 区间"""
+    points = []
+    for open_ts, close_ts in bp.trading_sessions('CME', start_ts, now):
+        first = (open_ts + 59) // 60 * 60
+        points += [ts for ts in range(first, close_ts, 60)
+                   if not any(a <= ts < b for a, b in holes)]
+    return points
+
+
+def check_calendar():
+    print("\n【交易日历】")
+    start, end = database.to_epoch('2026-10-15 00:00'), database.to_epoch('2026-10-16 00:00')
+    seconds = bp.session_seconds(bp.trading_sessions('GFEX', start, end), start, end)
+    # 凌晨夜盘 2.5h + 日盘 3.75h + 当晚夜盘到 24 点 3h
+    check(seconds == 33300, f"广期所普通交易日的交易时间: {seconds / 3600}h")
+
+    start, end = database.to_epoch('2026-09-30 00:00'), database.to_epoch('2026-10-08 00:00')
+    seconds = bp.session_seconds(bp.trading_sessions('GFEX', start, end), start, end)
+    check(seconds == 22500, f"国庆节前最后一天没有夜盘，假期无交易: {seconds / 3600}h")
+
+    sessions = bp.trading_sessions('CME', database.to_epoch('2026-10-17 00:00'), database.to_epoch('2026-10-19 12:00'))
+    sessions = [(database.from_epoch(a), database.from_epoch(b)) for a, b in sessions]
+    check(sessions == [('2026-10-17 00:00', '2026-10-17 05:00'), ('2026-10-19 06:00', '2026-10-19 12:00')],
+          f"CME 周六清晨收盘、周一清晨（芝加哥周日晚）开盘: {sessions}")
+
+
+def check_recent_gap():
+    print("\n【最近的缺口】")
+    start = NOW - 86400
+    hole = NOW - 30 - 5 * 3600
+    full = bp.plan_series(minutes(start, NOW), 'CME', start, NOW)
+    check(full['gaps'] == [] and full['fetches'] == [] and full['bars'] == 0, "数据完整时无需抓取")
+
+    plan = bp.plan_series(minutes(start, NOW, [(hole, hole + 7200)]), 'CME', start, NOW)
+    check([(g['start'], g['end']) for g in plan['gaps']] == [(hole - 60, hole + 7200)],
+          f"缺口两侧为已有K线: {plan['gaps']}")
+    check(plan['missing'] == 121, f"按交易时间估算缺失根数: {plan['missing']}")
+    fetches = [(f['interval'], f['n_bars']) for f in plan['fetches']]
+    # 从缺口前一根到现在 5h 加一分半，302 根加余量
+    check(fetches == [('in_1_minute', 302 + bp.BAR_MARGIN)], f"只抓一次 1分钟线，条数刚好够到缺口: {fetches}")
+    check(plan['bars'] < plan['baseline'] and not plan['unreachable'], "比固定抓取少")
+
+    stale = bp.plan_series(minutes(start, NOW - 3600), 'CME', start, NOW)
+    check(len(stale['gaps']) == 1 and stale['gaps'][0]['end'] == NOW, "最近一段没有数据也算缺口")
+
+
+def check_old_gap():
+    print("\n【超出1分钟线回溯范围的旧缺口】")
+    start = NOW - 12 * 86400
+    hole = NOW - 30 - 10 * 86400
+    plan = bp.plan_series(minutes(start, NOW, [(hole, hole + 7200)]), 'CME', start, NOW)
+    intervals = [f['interval'] for f in plan['fetches']]
+    check(intervals == ['in_5_minute'], f"1分钟线够不到时改用 5分钟线: {intervals}")
+    check(plan['fetches'][0]['n_bars'] <= bp.MAX_BARS and plan['beyond_baseline'] > 0,
+          "缺口超出原固定抓取的回溯范围")
+
+    gaps = plan['fetches'][0]['gaps']
+    times = pd.DatetimeIndex([database.from_epoch(ts) for ts in (hole - 300, hole, hole + 3600, hole + 9000)])
+    check(bp.in_gaps(times, gaps).tolist() == [False, True, True, False], "粗周期K线只保留缺口内的")
+
+
+def check_instrument():
+    print("\n【从库中读取已有K线】")
+    start = NOW - 86400
+    hole = NOW - 30 - 5 * 3600
+    points = minutes(start, NOW, [(hole, hole + 7200)])
+    index = pd.DatetimeIndex([database.from_epoch(ts) for ts in points])
+    database.bulk_ingest_bars('PLV2026', pd.DataFrame(
+        {'open': 1000.0, 'high': 1001.0, 'low': 999.0, 'close': 1000.0, 'volume': 5}, index=index))
+    # 爬虫的单点实时价（成交量为 0）不算已有数据
+    database.save_bar('PLV2026', database.from_epoch(hole + 600), 1000, 1000, 1000, 1000, 0)
+
+    plan = bp.plan_instrument('PLV2026', days=1, now=NOW)
+    check(plan['source'] == 'CME' and [(g['start'], g['end']) for g in plan['gaps']] == [(hole - 60, hole + 7200)],
+          f"按 5m 汇总桶找到同一个缺口: {plan['gaps']}")
+    check(bp.oldest_gap(plan) == hole - 60, "oldest_gap 为最早需要补的时间")
+    check(bp.plan_instrument('PT2610', days=1, now=NOW)['source'] == 'GFEX', "广期所合约按新浪小时线计划")
+    try:
+        bp.plan_instrument('XX0000')
+        check(False, "未知合约报错")
+    except ValueError:
+        check(True, "未知合约报错")
+
+
+def main():
+    header("测试补数计划")
+    temp_database('test_backfill_planner_')
+
+    check_calendar()
+    check_recent_gap()
+    check_old_gap()
+    check_instrument()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+测试汇总表 (bar_rollups / pair_rollups) 与原始数据一致
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 经 save_bar / bulk_ingest_bars 写入后，5m/1h/1d 汇总与直接从 bars 分组计算的结果相同；
+  - 经旧表名兼容视图 INSERT 写入（旧脚本的写法）同样更新汇总；
+  - 价差分批、乱序写入及覆盖已有时间点后，各层级价差汇总与直接分组计算的结果相同；
+  - 版本 3 的库（旧触发器，没有汇总表）迁移后，汇总按全部K线回填，触发器重建为同时更新汇总。
+用法: python test_bar_rollups.py
+"""
+import pandas as pd
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+
+def expected_rollups(conn, resolution):
+    """直接从 bars 按桶分组计算的汇总 {(instrument_id, bucket): (o, h, l, c, v, count)}"""
+    step = database.RESOLUTIONS[resolution]
+    rows = conn.execute(f'''
+        SELECT instrument_id, {database._bucket_expression(step)} AS bkt, ts, o, h, l, c, v
+        FROM bars ORDER BY instrument_id, ts
+    ''').fetchall()
+    result = {}
+    for instrument_id, bucket, ts, o, h, l, c, v in rows:
+        key = (instrument_id, bucket)
+        if key not in result:
+            result[key] = [o, h, l, c, v, 1]
+        else:
+            item = result[key]
+            item[1], item[2], item[3] = max(item[1], h), min(item[2], l), c
+            item[4] += v
+            item[5] += 1
+    return {key: tuple(item) for key, item in result.items()}
+
+
+def stored_rollups(conn, resolution):
+    return {(r[0], r[1]): tuple(r[2:]) for r in conn.execute(
+        'SELECT instrument_id, bucket, o, h, l, c, v, count FROM bar_rollups WHERE resolution = ?',
+        (resolution,))}
+
+
+def check_consistent(label):
+    conn = database.get_connection()
+    for resolution, _ in database.ROLLUP_LEVELS:
+        expected, stored = expected_rollups(conn, resolution), stored_rollups(conn, resolution)
+        wrong = [key for key in expected.keys() | stored.keys() if expected.get(key) != stored.get(key)]
+        check(not wrong, f"{label}: {resolution} 汇总与原始K线一致（不一致 {len(wrong)} 桶）")
+
+
+def legacy_insert(contract, when, price, volume):
+    conn = database.get_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO gfex_platinum_contracts (contract, datetime, open, high, low, close, volume, hold)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (contract, when, price, price + 1, price - 1, price, volume, 100))
+
+
+def check_write_paths():
+    print("\n【写入路径】")
+    index = pd.date_range('2026-10-15 09:00', periods=150, freq='min')
+    df = pd.DataFrame({'open': range(150), 'high': range(1, 151), 'low': range(-1, 149),
+                       'close': range(150), 'volume': 1}, index=index).astype('float64')
+    database.bulk_ingest_bars('PT2610', df)
+    database.save_bar('PT2610', '2026-10-15 10:07', 5, 500, -50, 7, 3)
+    database.save_bar('PLV2026', '2026-10-15 23:59', 2000, 2001, 1999, 2000, 2)
+    check_consistent("批量与单点写入")
+
+    version = database.get_data_version(database.get_connection())
+    legacy_insert('PT2610', '2026-10-15 11:31', 900.0, 4)       # 落在已有的 5m/1h/1d 桶里
+    legacy_insert('PT2606', '2026-10-16 09:02', 800.0, 6)       # 新合约、新的一天
+    check(database.get_data_version(database.get_connection()) == version + 2, "视图写入递增数据版本")
+    check_consistent("兼容视图写入")
+
+    conn = database.get_connection()
+    high = conn.execute('''
+        SELECT r.h FROM bar_rollups r JOIN instruments i ON i.instrument_id = r.instrument_id
+        WHERE i.symbol = 'PT2610' AND r.resolution = '1d'
+    ''').fetchone()[0]
+    check(high == 901.0, f"视图写入的最高价进入日汇总: {high}")
+
+
+def expected_pair_rollups(conn, resolution):
+    """直接从 platinum_pairs 按桶分组计算的价差汇总 {(pair_name, bucket): (open, high, low, close, count)}"""
+    step = database.RESOLUTIONS[resolution]
+    rows = conn.execute(f'''
+        SELECT pair_name, {database._bucket_expression(step)} AS bkt, spread_pct
+        FROM platinum_pairs ORDER BY pair_name, ts
+    ''').fetchall()
+    result = {}
+    for pair_name, bucket, value in rows:
+        item = result.setdefault((pair_name, bucket), [value, value, value, value, 0])
+        item[1], item[2], item[3] = max(item[1], value), min(item[2], value), value
+        item[4] += 1
+    return {key: tuple(item) for key, item in result.items()}
+
+
+def check_pairs():
+    print("\n【价差汇总】")
+    times = pd.date_range('2026-10-15 09:00', periods=200, freq='min')
+    history = [{'date': t.strftime('%Y-%m-%d %H:%M'), 'gfex_price': 500.0, 'cme_usd': 2000.0, 'cme_cny': 450.0,
+                'spread': 50.0, 'spread_pct': float((i * 7) % 13)} for i, t in enumerate(times)]
+    database.save_pair_history('platinum', '2610-2610', 'PT2610', 'PLV2026', history[100:])
+    database.save_pair_history('platinum', '2610-2610', 'PT2610', 'PLV2026', history[:100])
+    history[150]['spread_pct'] = 99.0
+    database.save_pair_history('platinum', '2610-2610', 'PT2610', 'PLV2026', history[150:151])
+
+    conn = database.get_connection()
+    for resolution, _ in database.ROLLUP_LEVELS:
+        expected = expected_pair_rollups(conn, resolution)
+        stored = {(r[0], r[1]): tuple(r[2:]) for r in conn.execute(
+            'SELECT pair_name, bucket, open, high, low, close, count FROM pair_rollups WHERE resolution = ?',
+            (resolution,))}
+        check(expected == stored, f"{resolution} 价差汇总与原始数据一致（{len(stored)} 桶）")
+
+
+def check_migration():
+    print("\n【从版本 3 迁移】")
+    conn = database.get_connection()
+    # 还原出版本 3 的状态：没有汇总表，旧触发器只写 bars
+    with conn:
+        conn.execute('DROP TABLE pair_rollups')
+        conn.execute('DROP TABLE bar_rollups')
+        for table, (exchange, metal) in database.LEGACY_BAR_TABLES.items():
+            conn.execute(f'DROP TRIGGER {table}_insert')
+            conn.execute(f'''
+                CREATE TRIGGER {table}_insert INSTEAD OF INSERT ON {table}
+                BEGIN
+                    INSERT OR IGNORE INTO instruments (symbol, exchange, metal)
+                    VALUES (NEW.contract, '{exchange}', '{metal}');
+                    INSERT OR REPLACE INTO bars (instrument_id, ts, o, h, l, c, v, oi)
+                    VALUES ((SELECT instrument_id FROM instruments WHERE symbol = NEW.contract),
+                            CAST(strftime('%s', NEW.datetime) AS INTEGER) - {database.BEIJING_OFFSET},
+                            NEW.open, NEW.high, NEW.low, NEW.close, NEW.volume, NULL);
+                END
+            ''')
+        conn.execute('PRAGMA user_version = 3')
+    legacy_insert('PT2610', '2026-10-17 14:00', 950.0, 2)
+
+    database.migrate_database()
+    check(database.get_schema_version(conn) == database.SCHEMA_VERSION, "表结构版本已升级")
+    check_consistent("迁移回填")
+    legacy_insert('PT2610', '2026-10-17 14:01', 951.0, 2)
+    check_consistent("迁移后重建的触发器")
+
+
+def main():
+    header("测试汇总表")
+    temp_database('test_bar_rollups_')
+
+    check_write_paths()
+    check_pairs()
+    check_migration()
+
+    finish()
+
+
+if __name__ == "__main__":
+    main()
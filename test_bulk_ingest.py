@@ -0,0 +1,111 @@
+"""
+测试批量写入 (bulk_ingest_bars / bulk_ingest_spreads)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - DataFrame（datetime 列或时间索引）整批写入，OHLC 缺失的行被拒绝，成交量/持仓缺失记为 0；
+  - offset_hours 换算时区；重复写入同一时间点计为更新，不产生重复行；
+  - 价差历史（字典列表或 DataFrame）中缺值的行被拒绝，conflict='IGNORE' 时保留已有数据；
+  - 值没有变化的行计为 unchanged、不写入也不重复计入统计；更新就地进行，保留行 id 与未写入的列。
+用法: python test_bulk_ingest.py
+"""
+import pandas as pd
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+
+def bars(start, closes, freq='h'):
+    index = pd.date_range(start, periods=len(closes), freq=freq)
+    return pd.DataFrame({'open': closes, 'high': closes, 'low': closes, 'close': closes,
+                         'volume': 1.0, 'hold': 10.0}, index=index)
+
+
+def stored_bars(table, contract):
+    conn = database.get_connection()
+    return conn.execute(f'SELECT datetime, close, volume FROM {table} WHERE contract = ? ORDER BY datetime',
+                        (contract,)).fetchall()
+
+
+def spreads(start, values):
+    dates = pd.date_range(start, periods=len(values), freq='h')
+    return [{'date': d.strftime('%Y-%m-%d %H:%M'), 'gfex_price': 500.0, 'cme_usd': 2000.0, 'cme_cny': 450.0,
+             'spread': 50.0, 'spread_pct': v} for d, v in zip(dates, values)]
+
+
+def check_bars():
+    print("\n【K线】")
+    df = bars('2026-10-15 09:00', [500.0, 501.0, None, 503.0])
+    df.loc[df.index[1], 'volume'] = None
+    result = database.bulk_ingest_bars('PD2610', df)
+    check(result == {'inserted': 3, 'updated': 0, 'unchanged': 0, 'rejected': 1}, f"缺 OHLC 的行被拒绝: {result}")
+    rows = stored_bars('gfex_palladium_contracts', 'PD2610')
+    check([r[1] for r in rows] == [500.0, 501.0, 503.0] and rows[1][2] == 0, "成交量缺失记为 0")
+
+    again = database.bulk_ingest_bars('PD2610', bars('2026-10-15 11:00', [600.0, 601.0]))
+    check(again == {'inserted': 1, 'updated': 1, 'unchanged': 0, 'rejected': 0}, f"已有时间点计为更新: {again}")
+    rows = stored_bars('gfex_palladium_contracts', 'PD2610')
+    check([r[1] for r in rows] == [500.0, 501.0, 600.0, 601.0], f"不产生重复行，新值覆盖旧值: {[r[1] for r in rows]}")
+
+    cme = bars('2026-10-15 01:00', [2000.0]).drop(columns='hold')
+    database.bulk_ingest_bars('PAZ2026', cme, offset_hours=8)
+    rows = stored_bars('cme_palladium_contracts', 'PAZ2026')
+    check(rows and rows[0][0].startswith('2026-10-15 09:00'), f"offset_hours 换算为北京时间: {rows[:1]}")
+
+    with_column = bars('2026-10-16 09:00', [510.0, 511.0]).rename_axis('datetime').reset_index()
+    result = database.bulk_ingest_bars('PD2606', with_column)
+    check(result['inserted'] == 2, "datetime 列的 DataFrame 同样可以写入")
+
+
+def check_spreads():
+    print("\n【价差】")
+    items = spreads('2026-10-15 09:00', [1.0, 2.0, None, 4.0])
+    result = database.bulk_ingest_spreads('platinum', '2610-2610', 'PT2610', 'PLV2026', items)
+    check(result == {'inserted': 3, 'updated': 0, 'unchanged': 0, 'rejected': 1}, f"缺值的行被拒绝: {result}")
+
+    frame = pd.DataFrame(spreads('2026-10-15 12:00', [9.0, 5.0]))
+    result = database.bulk_ingest_spreads('platinum', '2610-2610', 'PT2610', 'PLV2026', frame, conflict='IGNORE')
+    check(result['inserted'] == 1 and result['updated'] == 0, f"IGNORE：已有时间点不覆盖: {result}")
+    history = database.get_pair_history('platinum', '2610-2610')
+    check([h['spread_pct'] for h in history] == [1.0, 2.0, 4.0, 5.0], f"读回的价差: {[h['spread_pct'] for h in history]}")
+
+    result = database.save_pair_history('platinum', '2610-2610', 'PT2610', 'PLV2026', spreads('2026-10-15 12:00', [9.0]))
+    history = database.get_pair_history('platinum', '2610-2610')
+    check(result['updated'] == 1 and history[2]['spread_pct'] == 9.0, "默认覆盖已有时间点")
+
+
+def check_unchanged():
+    print("\n【只写有变化的行】")
+    items = spreads('2026-10-16 09:00', [1.0, 2.0, 3.0])
+    database.bulk_ingest_spreads('palladium', '2610-2610', 'PD2610', 'PAZ2026', items)
+    conn = database.get_connection()
+    ids = conn.execute("SELECT ts, id FROM palladium_pairs ORDER BY ts").fetchall()
+
+    again = database.bulk_ingest_spreads('palladium', '2610-2610', 'PD2610', 'PAZ2026', items)
+    check(again == {'inserted': 0, 'updated': 0, 'unchanged': 3, 'rejected': 0}, f"重复写入相同的值: {again}")
+    stats = database.get_pair_stats('palladium', '2610-2610')
+    check(stats['count'] == 3, f"未变化的行不重复计入统计: {stats['count']}")
+
+    items[1]['spread_pct'] = 9.0
+    items += spreads('2026-10-16 12:00', [4.0])
+    result = database.bulk_ingest_spreads('palladium', '2610-2610', 'PD2610', 'PAZ2026', items)
+    check(result == {'inserted': 1, 'updated': 1, 'unchanged': 2, 'rejected': 0}, f"新增、更新与未变化分别计数: {result}")
+    check(conn.execute("SELECT ts, id FROM palladium_pairs ORDER BY ts").fetchall()[:3] == ids, "更新就地进行，行 id 不变")
+
+    database.bulk_ingest_bars('PD2612', bars('2026-10-16 09:00', [400.0]))
+    changed = database.save_bar('PD2612', '2026-10-16 09:00', 400.0, 400.0, 400.0, 401.0, 1)
+    hold = conn.execute("SELECT close, hold FROM gfex_palladium_contracts WHERE contract = 'PD2612'").fetchone()
+    check(changed == 1 and hold == (401.0, 10), f"单点写入不覆盖未写入的持仓列: {hold}")
+    check(database.save_bar('PD2612', '2026-10-16 09:00', 400.0, 400.0, 400.0, 401.0, 1) == 0, "值相同时返回 0")
+
+
+def main():
+    header("测试批量写入")
+    temp_database('test_bulk_ingest_')
+
+    check_bars()
+    check_spreads()
+    check_unchanged()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+测试年度分区与冷数据归档之后的写入
+在临时目录里建库与归档，不会碰到 precious_metals.db 和 archive/:
+  - 已结束的年份移到按年分区文件，查询只挂载与区间相交的年份；
+  - 重复抓取已移入分区/归档的旧数据（无论值是否变化）不会再写进主库；
+  - 全量统计 (pair_stats) 与数据版本不因此变化，查询仍返回冷数据中的值；
+  - 边界之后的新数据照常写入。
+用法: python test_cold_storage.py
+"""
+import os
+
+import pandas as pd
+
+import archive
+import database
+import partitions
+from test_helpers import check, finish, header, temp_database
+
+PAIR = '2610-2610'
+
+
+def history(start, hours, pct=2.0):
+    dates = pd.date_range(start, periods=hours, freq='h')
+    return [{'date': d.strftime('%Y-%m-%d %H:%M'), 'gfex_price': 500.0, 'cme_usd': 2000.0,
+             'cme_cny': 450.0, 'spread': 50.0, 'spread_pct': pct + i / 100} for i, d in enumerate(dates)]
+
+
+def bars(start, hours, close=500.0):
+    index = pd.date_range(start, periods=hours, freq='h')
+    return pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+                         'volume': 1, 'hold': 10}, index=index)
+
+
+def save(items):
+    return database.bulk_ingest_spreads('platinum', PAIR, 'PT2610', 'PLV2026', items)
+
+
+def main_rows(table, start, end):
+    conn = database.get_connection()
+    return conn.execute(f'SELECT COUNT(*) FROM main.{table} WHERE ts >= ? AND ts < ?', (start, end)).fetchone()[0]
+
+
+def stats():
+    conn = database.get_connection()
+    return conn.execute("SELECT count, ROUND(sum, 6) FROM pair_stats WHERE metal = 'platinum' "
+                        "AND pair_name = ? AND period = 'all'", (PAIR,)).fetchone()
+
+
+def check_partition():
+    print("\n【年度分区】")
+    save(history('2024-12-31 00:00', 48))
+    database.bulk_ingest_bars('PT2610', bars('2024-12-31 00:00', 48))
+    before = stats()
+    partitions.partition_year(2024)
+    start, end = database.year_range(2024)
+    check(main_rows('platinum_pairs', start, end) == 0 and main_rows('bars', start, end) == 0, "2024 年已移出主库")
+    conn = database.get_connection()
+    check(database.partition_years() == [2024] and os.path.exists(database.partition_path(2024)), "分区文件按年份存放")
+    check(database.attach_partitions(conn, *database.year_range(2025)) == [] and
+          database.attach_partitions(conn, start, end) == ['y2024'], "只挂载与查询区间相交的年份")
+
+    version = database.get_data_version(conn)
+    same = save(history('2024-12-31 00:00', 24))
+    changed = save(history('2024-12-31 00:00', 24, pct=9.0))
+    result = database.bulk_ingest_bars('PT2610', bars('2024-12-31 00:00', 24, close=700.0))
+    check(same['inserted'] + changed['inserted'] + changed['updated'] + result['inserted'] + result['updated'] == 0,
+          "分区年份的行（相同或改过的值）都不写入")
+    check(main_rows('platinum_pairs', start, end) == 0 and main_rows('bars', start, end) == 0, "主库中仍没有 2024 年的行")
+    check(stats() == before, f"全量统计不变: {before} -> {stats()}")
+    check(database.get_data_version(conn) == version, "数据版本不变")
+
+    old = database.get_pair_history('platinum', PAIR, '2024-12-31 05:00', '2024-12-31 05:00')
+    check([p['spread_pct'] for p in old] == [2.05], f"查询仍返回分区中的值: {old}")
+
+    fresh = save(history('2025-01-02 00:00', 2))
+    check(fresh['inserted'] == 2, "分区边界之后的新行照常写入")
+
+
+def check_archive():
+    print("\n【冷数据归档】")
+    archive.ARCHIVE_DIR = os.path.abspath('archive')
+    archive.archive_month('pairs', 'platinum', PAIR, '2025-01')
+    start, end = archive.month_range('2025-01')
+    check(main_rows('platinum_pairs', start, end) == 0, "2025-01 已归档")
+
+    before = stats()
+    result = save(history('2025-01-01 00:00', 24, pct=7.0))
+    check(result['inserted'] + result['updated'] == 0 and result['unchanged'] == 24, f"归档月份的行不写入: {result}")
+    check(main_rows('platinum_pairs', start, end) == 0, "主库中仍没有 2025-01 的行")
+    check(stats() == before, "全量统计不变")
+
+    fresh = save(history('2025-02-01 00:00', 3))
+    check(fresh['inserted'] == 3, "归档之后的月份照常写入")
+
+
+def main():
+    header("测试分区与归档后的写入")
+    temp_database('test_cold_storage_')
+
+    check_partition()
+    check_archive()
+
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+测试历史数据的列式编码 (columnar.to_columns / encode_binary / decode_binary)
+不需要数据库:
+  - columnar: ts 为 UTC 时间戳，价格按 SCALES 放大取整，缺失为 None；
+  - binary: 编码后解码还原每一列（缺失价格为 NaN、缺失条数为 -1），头部附加字段保留，
+    头部补齐到 8 字节、各列 offset 是元素大小的整数倍，空历史也能往返；
+  - 非列式数据解码时报错。
+用法: python test_columnar.py
+"""
+import struct
+
+import numpy as np
+
+import columnar
+from database import to_epoch
+from test_helpers import check, finish, header
+
+
+HISTORY = [
+    {'date': '2026-10-16 09:00', 'gfex_price': 512.35, 'cme_usd': 2001.1, 'cme_cny': 451.27,
+     'spread': 61.08, 'spread_pct': 13.5349},
+    {'date': '2026-10-16 09:01', 'gfex_price': None, 'cme_usd': 2002.0, 'cme_cny': 451.5,
+     'spread': None, 'spread_pct': None},
+    {'date': '2026-10-16 21:00', 'gfex_price': 498.0, 'cme_usd': 1990.55, 'cme_cny': 448.93,
+     'spread': 49.07, 'spread_pct': -0.0001},
+]
+
+OHLC = [
+    {'date': '2026-10-16 09:00', 'open': 2.5, 'high': 3.25, 'low': 2.0, 'close': 3.0, 'avg': 2.6667, 'count': 12},
+    {'date': '2026-10-16 10:00', 'open': 3.0, 'high': 3.0, 'low': 1.5, 'close': 1.75, 'avg': 2.1, 'count': None},
+]
+
+
+def check_columns():
+    print("\n【columnar】")
+    result = columnar.to_columns(HISTORY)
+    check(result['count'] == 3, "条数")
+    check(result['ts'] == [to_epoch(item['date']) for item in HISTORY], "ts 为 UTC 时间戳")
+    check(result['gfex_price'] == [51235, None, 49800], f"价格放大 100 倍，缺失为 None: {result['gfex_price']}")
+    check(result['spread_pct'] == [135349, None, -1], f"百分比放大 10000 倍: {result['spread_pct']}")
+    check(result['scale'] == {name: columnar.SCALES[name] for name in HISTORY[0] if name != 'date'}, "scale 只含出现的字段")
+    check(columnar.to_columns([]) == {'count': 0, 'scale': {}, 'ts': []}, "空历史")
+
+
+def check_binary():
+    print("\n【binary】")
+    body = columnar.encode_binary(HISTORY, {'pair_name': '2610-2610', 'metal': '铂'})
+    head, columns = columnar.decode_binary(body)
+    size = struct.unpack_from('<I', body, 4)[0]
+    check(body[:4] == columnar.MAGIC and head['columns'][0]['offset'] == 8 + size, "魔数；头部之后紧接第一列")
+    check(head['pair_name'] == '2610-2610' and head['metal'] == '铂' and head['count'] == 3, "头部附加字段与条数")
+    check(head['columns'][0]['offset'] % 8 == 0, "头部补齐到 8 字节，第一列对齐")
+    check(all(c['offset'] % columns[c['name']].itemsize == 0 for c in head['columns']),
+          "各列 offset 是元素大小的整数倍（可直接构造 TypedArray）")
+    check(head['columns'][-1]['offset'] + columns[head['columns'][-1]['name']].nbytes == len(body), "最后一列到文件末尾")
+    check(columns['ts'].dtype == np.dtype('<u4')
+          and columns['ts'].tolist() == [to_epoch(item['date']) for item in HISTORY], "ts 为 uint32 时间戳")
+    for name in ('gfex_price', 'cme_usd', 'cme_cny', 'spread', 'spread_pct'):
+        expected = np.array([np.nan if item[name] is None else item[name] for item in HISTORY], dtype='<f4')
+        check(columns[name].dtype == np.dtype('<f4') and np.array_equal(columns[name], expected, equal_nan=True),
+              f"{name} 还原为 float32（缺失为 NaN）")
+
+    head, columns = columnar.decode_binary(columnar.encode_binary(OHLC))
+    check(columns['count'].dtype == np.dtype('<i4') and columns['count'].tolist() == [12, -1], "条数为 int32，缺失为 -1")
+    check(np.allclose(columns['close'], [3.0, 1.75]), "OHLC 列还原")
+
+    head, columns = columnar.decode_binary(columnar.encode_binary([], {'pair_name': 'x'}))
+    check(head['count'] == 0 and columns['ts'].size == 0, "空历史往返")
+
+    try:
+        columnar.decode_binary(b'{"count": 0}')
+        check(False, "非列式数据报错")
+    except ValueError:
+        check(True, "非列式数据报错")
+
+
+def main():
+    header("测试列式编码")
+
+    check_columns()
+    check_binary()
+
+    finish()
+
+
+if __name__ == "__main__":
+    main()
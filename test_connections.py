@@ -0,0 +1,106 @@
+"""
+测试共享的数据库连接 (database.get_connection)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 同一线程复用一个连接，不同线程各用各的；close_connections 后重新打开；
+  - 连接为 WAL 模式并带调优参数与写锁等待；
+  - 只读连接不能写，读不会被进行中的写事务阻塞；
+  - 多个线程同时写入时等待写锁，不报 database is locked。
+用法: python test_connections.py
+"""
+import sqlite3
+import threading
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+
+def in_thread(func):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def check_reuse():
+    print("\n【连接复用】")
+    conn = database.get_connection()
+    check(database.get_connection() is conn, "同一线程复用同一个连接")
+    check(in_thread(lambda: id(database.get_connection())) != id(conn), "其他线程使用自己的连接")
+    check(database.get_readonly_connection() is not conn, "只读连接与读写连接分开保存")
+
+    database.close_connections()
+    try:
+        conn.execute('SELECT 1')
+        closed = False
+    except sqlite3.ProgrammingError:
+        closed = True
+    check(closed and database.get_connection() is not conn, "close_connections 关闭后重新打开")
+
+
+def check_settings():
+    print("\n【连接参数】")
+    conn = database.get_connection()
+    check(conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal', "WAL 模式")
+    check(conn.execute('PRAGMA synchronous').fetchone()[0] == 1, "synchronous = NORMAL")
+    check(conn.execute('PRAGMA busy_timeout').fetchone()[0] == database.BUSY_TIMEOUT * 1000, "等待写锁")
+    check(conn.execute('PRAGMA cache_size').fetchone()[0] == database.CONNECTION_PRAGMAS['cache_size'], "页缓存大小")
+
+
+def check_readonly():
+    print("\n【只读连接】")
+    conn = database.get_connection()
+    with conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS scratch (n INTEGER)')
+        conn.execute('INSERT INTO scratch VALUES (1)')
+    reader = database.get_readonly_connection()
+    try:
+        reader.execute('INSERT INTO scratch VALUES (2)')
+        check(False, "只读连接拒绝写入")
+    except sqlite3.OperationalError:
+        check(True, "只读连接拒绝写入")
+
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('INSERT INTO scratch VALUES (3)')
+    count = in_thread(lambda: database.get_readonly_connection().execute('SELECT COUNT(*) FROM scratch').fetchone()[0])
+    conn.commit()
+    check(count == 1, f"写事务进行中读取不阻塞，读到提交前的数据: {count}")
+
+
+def check_concurrent_writes():
+    print("\n【并发写入】")
+    errors = []
+
+    def writer(n):
+        try:
+            conn = database.get_connection()
+            for i in range(50):
+                with conn:
+                    conn.execute('INSERT INTO scratch VALUES (?)', (n * 1000 + i,))
+        except sqlite3.Error as e:
+            errors.append(str(e))
+        finally:
+            database.close_connections()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    count = database.get_connection().execute('SELECT COUNT(*) FROM scratch WHERE n >= 1000').fetchone()[0]
+    check(not errors and count == 200, f"4 个线程各写 50 行: {count} 行, 错误 {errors[:1]}")
+
+
+def main():
+    header("测试数据库连接")
+    temp_database('test_connections_')
+
+    check_reuse()
+    check_settings()
+    check_readonly()
+    check_concurrent_writes()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+测试时间戳表结构与迁移 (to_epoch / from_epoch / migrate_database)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 北京时间文本、datetime、带时区的时间与时间戳互相转换，无法解析时返回 None；
+  - 旧版本（datetime 为 TEXT，两种格式混用）的库在 init_database 时迁移为 UTC 时间戳，
+    同一时间点两种写法的重复行只保留后写入的一条，datetime 列由 ts 生成。
+用法: python test_epoch_schema.py
+"""
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import database
+from test_helpers import check, finish, header
+
+NINE = 1792026000                 # 2026-10-15 09:00 北京时间 = 01:00 UTC
+
+
+def check_conversion():
+    print("\n【时间转换】")
+    check(database.to_epoch('2026-10-15 09:00') == NINE, "北京时间文本 -> UTC 时间戳")
+    check(database.to_epoch('2026/10/15 09:00:30') == NINE + 30, "斜杠日期与秒")
+    check(database.to_epoch(datetime(2026, 10, 15, 9)) == NINE, "无时区的 datetime 视为北京时间")
+    check(database.to_epoch(datetime(2026, 10, 15, 1, tzinfo=timezone.utc)) == NINE, "带时区的时间按其时区换算")
+    check(database.to_epoch(NINE) == NINE and database.to_epoch(None) is None, "时间戳原样返回，None 返回 None")
+    check(database.to_epoch('not a time') is None, "无法解析时返回 None")
+    check(database.from_epoch(NINE) == '2026-10-15 09:00'
+          and database.from_epoch(NINE + 30, '%Y-%m-%d %H:%M:%S') == '2026-10-15 09:00:30', "时间戳 -> 北京时间文本")
+    times = pd.date_range('2026-10-15 09:00', periods=3, freq='min')
+    check(database.series_to_epoch(times) == [NINE, NINE + 60, NINE + 120], "向量化转换与逐个转换一致")
+
+
+def create_legacy_database(path):
+    """版本 0 的库：datetime 为 TEXT，'%Y-%m-%d %H:%M' 与 '%Y-%m-%d %H:%M:%S' 混用"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE platinum_pairs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, pair_name TEXT NOT NULL, gfex_contract TEXT NOT NULL,
+            cme_contract TEXT NOT NULL, datetime TEXT NOT NULL, gfex_price REAL, cme_usd REAL, cme_cny REAL,
+            spread REAL, spread_pct REAL, created_at TEXT DEFAULT CURRENT_TIMESTAMP, UNIQUE(pair_name, datetime));
+        CREATE TABLE gfex_palladium_contracts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, contract TEXT NOT NULL, datetime TEXT NOT NULL,
+            open REAL, high REAL, low REAL, close REAL, volume INTEGER, hold INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP, UNIQUE(contract, datetime));
+    ''')
+    pairs = [('2026-10-15 09:00', 1.0), ('2026-10-15 09:00:00', 1.5), ('2026-10-15 10:00:00', 2.0), ('bad', 3.0)]
+    conn.executemany('''
+        INSERT INTO platinum_pairs (pair_name, gfex_contract, cme_contract, datetime, gfex_price, cme_usd,
+                                    cme_cny, spread, spread_pct)
+        VALUES ('2610-2610', 'PT2610', 'PLV2026', ?, 500, 2000, 450, 50, ?)
+    ''', pairs)
+    conn.executemany('''
+        INSERT INTO gfex_palladium_contracts (contract, datetime, open, high, low, close, volume, hold)
+        VALUES ('PD2610', ?, ?, ?, ?, ?, 1, 10)
+    ''', [('2026-10-15 09:00', 400, 401, 399, 400), ('2026-10-15 09:01:00', 401, 402, 400, 401)])
+    conn.commit()
+    conn.close()
+
+
+def check_migration():
+    print("\n【旧库迁移】")
+    os.chdir(tempfile.mkdtemp(prefix='test_epoch_schema_'))
+    database.DB_FILE = os.path.abspath('precious_metals.db')
+    create_legacy_database(database.DB_FILE)
+    database.init_database()
+
+    conn = database.get_connection()
+    check(database.get_schema_version(conn) == database.SCHEMA_VERSION, "表结构升级到最新版本")
+    rows = conn.execute('SELECT ts, datetime, spread_pct FROM platinum_pairs ORDER BY ts').fetchall()
+    check(rows == [(NINE, '2026-10-15 09:00', 1.5), (NINE + 3600, '2026-10-15 10:00', 2.0)],
+          f"两种写法的重复行合并，保留后写入的值，无法解析的行丢弃: {rows}")
+    bars = conn.execute("SELECT datetime, close FROM gfex_palladium_contracts WHERE contract = 'PD2610' "
+                        "ORDER BY datetime").fetchall()
+    check(bars == [('2026-10-15 09:00', 400.0), ('2026-10-15 09:01', 401.0)], f"K线迁移后统一为分钟文本: {bars}")
+
+    history = database.get_pair_history('platinum', '2610-2610')
+    check([h['date'] for h in history] == ['2026-10-15 09:00', '2026-10-15 10:00'], "查询返回北京时间文本")
+
+
+def main():
+    header("测试时间戳表结构")
+
+    check_conversion()
+    check_migration()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+测试推送流 (event_stream)
+在临时目录里建库，不启动服务器:
+  - 带 Last-Event-ID 重连时只补发错过的消息，不再发送 hello；
+    id 已不在缓冲区（或来自上次启动）时先发 reset 再发 hello；
+  - ChangeFeed 能发现独立采集脚本只写进主库的数据：先发布快照再推送新增价差点与警报，
+    快照被最短间隔推迟时本次不推送，补发后再推送。
+用法: python test_event_stream.py
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import database
+import event_stream
+from test_helpers import check, finish, header, temp_database
+
+PAIR = '2610-2610'
+
+
+def events(chunk):
+    """SSE 字节流中的 [(event, data), ...]"""
+    result = []
+    for block in chunk.decode('utf-8').split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n') if ': ' in line)
+        if 'event' in lines:
+            result.append((lines['event'], json.loads(lines['data'])))
+    return result
+
+
+def first_chunk(broadcaster, last_event_id=None):
+    stream = event_stream.EventStream(broadcaster, lambda: {'state': 'now'}, last_event_id)
+    return events(next(iter(stream)))
+
+
+def check_resume():
+    print("\n【断线重连】")
+    broadcaster = event_stream.Broadcaster(backlog=3)
+    check([e for e, _ in first_chunk(broadcaster)] == ['hello'], "首次连接发送 hello")
+
+    ids = [broadcaster.publish('prices', {'n': n}) for n in range(3)]
+    resumed = first_chunk(broadcaster, ids[0])
+    check(resumed == [('prices', {'n': 1}), ('prices', {'n': 2})], f"从 Last-Event-ID 之后补发: {resumed}")
+    check(first_chunk(broadcaster, ids[-1]) == [], "没有错过消息时什么都不发")
+
+    broadcaster.publish('prices', {'n': 3})
+    check([e for e, _ in first_chunk(broadcaster, ids[0] - 1)] == ['reset', 'hello'],
+          "错过的消息已移出缓冲区：reset + hello")
+    check([e for e, _ in first_chunk(broadcaster, 1)] == ['reset', 'hello'], "上次启动的 id：reset + hello")
+
+
+def spread_points(start, count, pct):
+    first = datetime.strptime(start, '%Y-%m-%d %H:%M')
+    return [{'date': (first + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M'), 'gfex_price': 500.0,
+             'cme_usd': 2000.0, 'cme_cny': 450.0, 'spread': 50.0, 'spread_pct': pct} for i in range(count)]
+
+
+def collector_write(start, count, pct):
+    """模拟独立运行的采集脚本：只写主库，不发布快照"""
+    database.bulk_ingest_spreads('platinum', PAIR, 'PT2610', 'PLV2026', spread_points(start, count, pct))
+
+
+def age_snapshot(seconds):
+    path = database.current_snapshot()
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def check_outside_writes():
+    print("\n【外部写入】")
+    with open(event_stream.ALERT_CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'thresholds': {'platinum': {'min': -5, 'max': 5}}}, f)
+    collector_write('2026-10-16 09:00', 2, 1.0)
+    database.publish_snapshot(min_interval=0)
+    database.enable_snapshot_reads()
+
+    cme = {'PLV2026': {'price': 2000.0}}
+    broadcaster = event_stream.Broadcaster()
+    feed = event_stream.ChangeFeed(broadcaster, {'cme': lambda: dict(cme)})
+    check(feed.check() == 0 and feed.version is not None, "第一次检查只记录基线")
+    start = broadcaster.last_id
+
+    collector_write('2026-10-16 09:02', 1, 1.0)
+    check(feed.check() == 0 and database.snapshot_pending(), "快照刚发布过：推迟补发，本次不推送")
+
+    age_snapshot(database.SNAPSHOT_MIN_INTERVAL + 1)
+    collector_write('2026-10-16 09:03', 1, 9.0)
+    cme['PLV2026'] = {'price': 2001.0}
+    sent = feed.check()
+    received = dict(events(b''.join(broadcaster.since(start)[1])))
+    check(sent == 3, f"发布快照后推送增量: {sent} 条")
+    check(feed.version == database.get_data_version(database.get_connection()), "读到主库的最新数据版本")
+    points = received.get('spreads', {}).get('points', {}).get('platinum', {}).get(PAIR, [])
+    check([p[-1] for p in points] == [1.0, 9.0], f"推送推迟期间与本次新增的价差点: {points}")
+    check(received.get('alert', {}).get('state') == 'above', "价差越过上限推送警报")
+    check(received.get('prices') == {'cme': {'PLV2026': {'price': 2001.0}}}, "只推送变化的最新价")
+    check(feed.check() == 0, "没有新写入时不再推送")
+
+    timer = database._deferred_publish
+    if timer is not None:
+        timer.cancel()
+    database.enable_snapshot_reads(False)
+
+
+def main():
+    header("测试推送流")
+    temp_database('test_event_stream_')
+    database.SNAPSHOT_DIR = os.path.abspath('snapshots')
+    database.SNAPSHOT_POINTER = os.path.join(database.SNAPSHOT_DIR, 'CURRENT')
+
+    check_resume()
+    check_outside_writes()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+测试脚本共用的检查、汇总与临时数据库
+用法:
+    from test_helpers import check, finish, header, temp_database
+    header("测试xxx")
+    temp_database('test_xxx_')      # 切换到临时目录并在其中建库，不会碰到 precious_metals.db
+    check(ok, "说明")
+    finish()                        # 打印汇总，有失败时以状态码 1 退出
+"""
+import os
+import sys
+import tempfile
+
+failures = []
+
+
+def header(title):
+    print("=" * 60)
+    print(title)
+    print("=" * 60)
+
+
+def check(ok, message):
+    """记录一项检查并打印结果"""
+    print(f"  {'✓' if ok else '[X]'} {message}")
+    if not ok:
+        failures.append(message)
+    return ok
+
+
+def temp_database(prefix):
+    """切换到新的临时目录，把 database.DB_FILE 指向其中并初始化，返回数据库路径"""
+    import database
+
+    os.chdir(tempfile.mkdtemp(prefix=prefix))
+    database.DB_FILE = os.path.abspath('precious_metals.db')
+    database.init_database()
+    return database.DB_FILE
+
+
+def finish():
+    print()
+    if failures:
+        print(f"[X] {len(failures)} 项失败")
+        sys.exit(1)
+    print("[OK] 全部通过")
@@ -0,0 +1,96 @@
+"""
+测试预压缩 JSON 与静态文件的压缩协商 (json_artifacts / price_api_server.serve_static)
+在临时目录里建库与写文件，不会碰到仓库里的 JSON:
+  - write_json 写出与原来 json.dump(..., indent=2) 相同的内容，并生成 .gz（有 brotli 时还有 .br）；
+  - 兄弟文件比 JSON 旧时视为过期，refresh_stale 只重新生成过期的；
+  - 有新鲜的预压缩文件时直接发送，过期或没有时现场压缩；q=0 与不可压缩的文件发送原文；
+  - 静态文件带按编码区分的强 ETag 与 Last-Modified，重新验证返回 304；目录外的路径返回 404。
+用法: python test_json_artifacts.py
+"""
+import gzip
+import json
+import os
+
+import json_artifacts
+import price_api_server as api
+from async_server import Request
+from test_helpers import check, finish, header, temp_database
+
+DATA = {'pairs': [{'name': f'2610-{i:04d}', 'spread_pct': i / 7, '说明': '铂金'} for i in range(200)]}
+
+
+def call(path, **headers):
+    request = Request('GET', path, {name.replace('_', '-'): value for name, value in headers.items()})
+    return api.serve_static(request)
+
+
+def make_stale(path):
+    """把兄弟文件的修改时间提前，模拟 git pull 只更新了 JSON"""
+    earlier = os.stat(path).st_mtime - 10
+    os.utime(path + '.gz', (earlier, earlier))
+
+
+def check_write():
+    print("\n【写入与过期】")
+    json_artifacts.write_json('pairs.json', DATA)
+    with open('pairs.json', encoding='utf-8') as f:
+        raw = f.read()
+    check(raw == json.dumps(DATA, ensure_ascii=False, indent=2), "JSON 格式与原来相同")
+    with open('pairs.json.gz', 'rb') as f:
+        check(gzip.decompress(f.read()).decode('utf-8') == raw, "生成 .gz 兄弟文件")
+    check(not os.path.exists('pairs.json.tmp'), "临时文件已替换")
+    check(json_artifacts.fresh_sibling('pairs.json', 'gzip') == 'pairs.json.gz', "新写的兄弟文件是新鲜的")
+
+    make_stale('pairs.json')
+    check(json_artifacts.fresh_sibling('pairs.json', 'gzip') is None, "JSON 更新后兄弟文件过期")
+    json_artifacts.write_json('other.json', DATA)
+    refreshed = json_artifacts.refresh_stale(['pairs.json', 'other.json', 'missing.json'])
+    check(refreshed == ['pairs.json'] and json_artifacts.fresh_sibling('pairs.json', 'gzip'),
+          f"refresh_stale 只重新生成过期的: {refreshed}")
+
+
+def check_static():
+    print("\n【静态文件协商】")
+    with open('pairs.json', 'rb') as f:
+        raw = f.read()
+    with open('pairs.json.gz', 'rb') as f:
+        artifact = f.read()
+
+    status, headers, body = call('/pairs.json', accept_encoding='gzip, deflate')
+    check(status == 200 and headers.get('Content-Encoding') == 'gzip' and body == artifact, "直接发送预压缩文件")
+    check(headers['ETag'].endswith('-gzip"') and 'Last-Modified' in headers and headers['Vary'] == 'Accept-Encoding',
+          "按编码区分的强 ETag 与 Last-Modified")
+    check(call('/pairs.json', accept_encoding='gzip', if_none_match=headers['ETag'])[0] == 304, "重新验证返回 304")
+
+    status, plain, body = call('/pairs.json', accept_encoding='gzip;q=0')
+    check(status == 200 and 'Content-Encoding' not in plain and body == raw, "q=0 时发送原文")
+
+    make_stale('pairs.json')
+    status, stale, body = call('/pairs.json', accept_encoding='gzip')
+    check(stale.get('Content-Encoding') == 'gzip' and gzip.decompress(body) == raw and stale['ETag'] == headers['ETag'],
+          "兄弟文件过期时现场压缩，ETag 仍按 JSON 文件计")
+    hits = api.response_cache.get_stats()['hits']
+    call('/pairs.json', accept_encoding='gzip')
+    check(api.response_cache.get_stats()['hits'] == hits + 1, "现场压缩的结果按修改时间缓存")
+
+    with open('logo.png', 'wb') as f:
+        f.write(b'\x89PNG' + bytes(4096))
+    status, png, _ = call('/logo.png', accept_encoding='gzip')
+    check(status == 200 and 'Content-Encoding' not in png and png['Content-Type'] == 'image/png', "不可压缩的文件发送原文")
+    check(call('/logo.png', if_none_match=png['ETag'])[0] == 304, "不可压缩的文件同样支持 304")
+
+    check(call('/missing.json')[0] == 404, "不存在的文件返回 404")
+    check(call('/../etc/passwd')[0] == 404 and call('/%2e%2e/etc/passwd')[0] == 404, "当前目录外的路径返回 404")
+
+
+def main():
+    header("测试预压缩 JSON")
+    temp_database('test_json_artifacts_')
+
+    check_write()
+    check_static()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
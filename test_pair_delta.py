@@ -0,0 +1,122 @@
+"""
+测试配对价差的增量游标 (get_pair_changes / /api/pairs/delta)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 游标之后新增、修改的点都能取到，原样重写的点不会再给；
+  - 两个连接并发写入时，已经拿到游标的客户端不会漏掉另一个写入方随后提交的行；
+  - 版本 6 的库迁移到 7 后 version 列与索引存在，旧行记为 0。
+用法: python test_pair_delta.py
+"""
+import threading
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+
+def points(day, hours, base=500.0, pct=2.0):
+    return [{'date': f'2026-10-{day:02d} {hh:02d}:00', 'gfex_price': base + hh, 'cme_usd': 2000.0,
+             'cme_cny': 450.0, 'spread': 50.0 + hh, 'spread_pct': pct + hh / 100} for hh in hours]
+
+
+def save(pair_name, history):
+    return database.save_pair_history('platinum', pair_name, 'PT2610', 'PLV2026', history)
+
+
+def pair_rows():
+    conn = database.get_connection()
+    return {(r[0], r[1]) for r in conn.execute('SELECT pair_name, ts FROM platinum_pairs')}
+
+
+def check_cursor():
+    print("\n【游标增量】")
+    save('2610-2610', points(1, range(9, 15)))
+    cursor = database.get_pair_changes('platinum', 0)['cursor']
+    changes = database.get_pair_changes('platinum', cursor)
+    check(changes['pairs'] == {} and not changes['reset'], "没有写入时增量为空")
+
+    save('2610-2610', points(1, range(9, 15)))
+    check(database.get_pair_changes('platinum', cursor)['pairs'] == {}, "原样重写的点不算变化")
+
+    save('2610-2610', points(1, [10], pct=9.0) + points(2, [9]))
+    changes = database.get_pair_changes('platinum', cursor)
+    dates = [p['date'] for p in changes['pairs'].get('2610-2610', [])]
+    check(dates == ['2026-10-01 10:00', '2026-10-02 09:00'], f"只返回修改与新增的点: {dates}")
+    check(database.get_pair_changes('platinum', changes['cursor'])['pairs'] == {}, "新游标之后没有变化")
+    check(database.get_pair_changes('platinum', changes['cursor'] + 100)['reset'], "超前的游标要求重新全量加载")
+
+
+def check_concurrent_writers():
+    print("\n【并发写入】")
+    # 写入方 A 读到本次版本号后停住，B 在此期间写入；
+    # 修复前 B 会先提交并与 A 取到同一个版本号，A 的行对已拿到 B 之后游标的客户端永远不可见
+    stamped, proceed = threading.Event(), threading.Event()
+    original = database._next_data_version
+
+    def paused(conn):
+        version = original(conn)
+        if threading.current_thread().name == 'writer-a':
+            stamped.set()
+            proceed.wait(10)
+        return version
+
+    writers = {
+        'writer-a': threading.Thread(target=save, args=('2606-2601', points(3, [9])), name='writer-a'),
+        'writer-b': threading.Thread(target=save, args=('2610-2604', points(3, [9])), name='writer-b'),
+    }
+    database._next_data_version = paused
+    try:
+        writers['writer-a'].start()
+        stamped.wait(10)
+        writers['writer-b'].start()
+        writers['writer-b'].join(1)
+        # 此刻来轮询的客户端：记下游标与已经可见的行
+        cursor = database.get_data_version(database.get_connection())
+        seen = pair_rows()
+        proceed.set()
+        for thread in writers.values():
+            thread.join(30)
+    finally:
+        database._next_data_version = original
+
+    changes = database.get_pair_changes('platinum', cursor)
+    delivered = {(name, database.to_epoch(p['date'])) for name, history in changes['pairs'].items()
+                 for p in history}
+    missing = pair_rows() - seen - delivered
+    check(not missing, f"游标 {cursor} 之后提交的行全部能取到（遗漏 {len(missing)} 行）")
+
+    conn = database.get_connection()
+    versions = [r[0] for r in conn.execute(
+        "SELECT version FROM platinum_pairs WHERE pair_name IN ('2606-2601', '2610-2604')")]
+    check(len(set(versions)) == 2, f"两个写入方的版本号不同: {versions}")
+
+
+def check_migration():
+    print("\n【迁移到版本 7】")
+    conn = database.get_connection()
+    with conn:
+        for table in database.PAIR_TABLES.values():
+            conn.execute(f'DROP INDEX IF EXISTS idx_{table}_version')
+            conn.execute(f'ALTER TABLE {table} DROP COLUMN version')
+        conn.execute('PRAGMA user_version = 6')
+    database.migrate_database()
+    check(database.get_schema_version(conn) == database.SCHEMA_VERSION, "表结构版本已升级")
+    for table in database.PAIR_TABLES.values():
+        indexes = [r[1] for r in conn.execute(f'PRAGMA index_list({table})')]
+        check('version' in database._table_columns(conn, table) and f'idx_{table}_version' in indexes,
+              f"{table} 有 version 列与索引")
+    old = conn.execute('SELECT COUNT(*) FROM platinum_pairs WHERE version != 0').fetchone()[0]
+    check(old == 0, "迁移前的行 version 为 0")
+
+
+def main():
+    header("测试配对价差增量游标")
+    temp_database('test_pair_delta_')
+
+    check_cursor()
+    check_concurrent_writers()
+    check_migration()
+
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+测试配对历史的区间与分辨率查询 (database.get_pair_history)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 默认返回最近的原始数据，按时间升序；
+  - start/end 为闭区间，北京时间文本、datetime 与时间戳等价；
+  - 5m/1h/1d 按北京时间对齐分桶，agg='last' 取桶内最后一条，agg='ohlc' 另给出开高低收、均值与条数；
+  - limit 限制最近的桶数，参数错误抛出 ValueError。
+用法: python test_pair_history.py
+"""
+from datetime import datetime
+
+import pandas as pd
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+PAIR = '2610-2610'
+
+
+def history():
+    """2026-10-15 09:00 起 120 分钟 spread_pct 为 0..119，另加次日 09:00 一条 500"""
+    dates = list(pd.date_range('2026-10-15 09:00', periods=120, freq='min')) + [pd.Timestamp('2026-10-16 09:00')]
+    values = list(range(120)) + [500]
+    return [{'date': d.strftime('%Y-%m-%d %H:%M'), 'gfex_price': 500.0 + v, 'cme_usd': 2000.0,
+             'cme_cny': 450.0, 'spread': 50.0 + v, 'spread_pct': float(v)} for d, v in zip(dates, values)]
+
+
+def query(**kwargs):
+    return database.get_pair_history('platinum', PAIR, **kwargs)
+
+
+def check_raw():
+    print("\n【原始数据与区间】")
+    rows = query(limit=3)
+    check([r['date'] for r in rows] == ['2026-10-15 10:58', '2026-10-15 10:59', '2026-10-16 09:00'],
+          f"默认返回最近的原始数据，按时间升序: {[r['date'] for r in rows]}")
+    check(rows[-1] == {'date': '2026-10-16 09:00', 'gfex_price': 1000.0, 'cme_usd': 2000.0, 'cme_cny': 450.0,
+                       'spread': 550.0, 'spread_pct': 500.0}, "字段与原来相同")
+
+    ranged = query(start='2026-10-15 09:10', end='2026-10-15 09:12')
+    check([r['spread_pct'] for r in ranged] == [10.0, 11.0, 12.0], "闭区间包含两端")
+    same = query(start=datetime(2026, 10, 15, 9, 10), end=database.to_epoch('2026-10-15 09:12'))
+    check(same == ranged, "datetime 与时间戳等价")
+    check(len(query(start='2026-10-15 10:00')) == 61, "只给 start")
+
+
+def check_buckets():
+    print("\n【分桶】")
+    five = query(resolution='5m', end='2026-10-15 09:14')
+    check([(r['date'], r['spread_pct']) for r in five] ==
+          [('2026-10-15 09:00', 4.0), ('2026-10-15 09:05', 9.0), ('2026-10-15 09:10', 14.0)],
+          f"5m 取桶内最后一条，date 为桶起点: {[(r['date'], r['spread_pct']) for r in five]}")
+    check('open' not in five[0] and five[0]['gfex_price'] == 504.0, "agg='last' 的字段与原始数据相同")
+
+    hourly = query(resolution='1h', agg='ohlc')
+    first = hourly[0]
+    check(len(hourly) == 3 and first['date'] == '2026-10-15 09:00', f"1h 分桶: {[r['date'] for r in hourly]}")
+    check((first['open'], first['high'], first['low'], first['close'], first['count']) == (0.0, 59.0, 0.0, 59.0, 60)
+          and round(first['avg'], 6) == 29.5, f"ohlc: {first}")
+
+    daily = query(resolution='1d', agg='ohlc')
+    check([(r['date'], r['count']) for r in daily] == [('2026-10-15 00:00', 120), ('2026-10-16 00:00', 1)],
+          f"1d 按北京时间零点对齐: {[(r['date'], r['count']) for r in daily]}")
+
+    recent = query(resolution='1h', limit=2)
+    check([r['date'] for r in recent] == ['2026-10-15 10:00', '2026-10-16 09:00'], "limit 为最近的桶数")
+
+
+def check_errors():
+    print("\n【参数错误】")
+    for kwargs, message in (({'resolution': '2m'}, "不支持的分辨率"), ({'agg': 'median'}, "不支持的聚合方式"),
+                            ({'start': 'yesterday'}, "无法解析的时间")):
+        try:
+            query(**kwargs)
+            check(False, message)
+        except ValueError:
+            check(True, f"{message}抛出 ValueError")
+
+
+def main():
+    header("测试配对历史查询")
+    temp_database('test_pair_history_')
+    database.save_pair_history('platinum', PAIR, 'PT2610', 'PLV2026', history())
+
+    check_raw()
+    check_buckets()
+    check_errors()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+测试配对最新值表 (pair_latest)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 单条写入与批量写入都在同一事务内刷新 pair_latest，get_all_pairs 读到每个配对最新的一条；
+  - 补写更早的历史数据不会让最新值倒退；
+  - 版本2的库迁移时用已有配对数据回填。
+用法: python test_pair_latest.py
+"""
+import os
+import sqlite3
+import tempfile
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+
+def spreads(start, values):
+    dates = [f'2026-10-{day:02d} 09:00' for day in range(start, start + len(values))]
+    return [{'date': d, 'gfex_price': 500.0, 'cme_usd': 2000.0, 'cme_cny': 450.0,
+             'spread': 50.0, 'spread_pct': v} for d, v in zip(dates, values)]
+
+
+def check_writes():
+    print("\n【写入刷新】")
+    database.save_pair_history('platinum', '2610-2610', 'PT2610', 'PLV2026', spreads(10, [1.0, 2.0, 3.0]))
+    database.save_pair_data('platinum', '2612-2612', 'PT2612', 'PLZ2026', '2026-10-12 09:00',
+                            500.0, 2000.0, 450.0, 50.0, 8.0)
+    pairs = database.get_all_pairs('platinum')
+    check(list(pairs) == ['2612-2612', '2610-2610'], f"每个配对一行，按 spread_pct 降序: {list(pairs)}")
+    current = pairs['2610-2610']['current']
+    check(current['datetime'] == '2026-10-12 09:00' and current['spread_pct'] == 3.0, f"批量写入后为最新一条: {current}")
+    check(database.get_all_pairs('palladium') == {}, "按品种区分")
+
+    database.save_pair_history('platinum', '2610-2610', 'PT2610', 'PLV2026', spreads(1, [9.0, 9.0]))
+    current = database.get_all_pairs('platinum')['2610-2610']['current']
+    check(current['datetime'] == '2026-10-12 09:00', f"补写历史不会让最新值倒退: {current['datetime']}")
+
+    database.save_pair_data('platinum', '2610-2610', 'PT2610', 'PLV2026', '2026-10-13 09:00',
+                            501.0, 2000.0, 450.0, 51.0, 4.0)
+    current = database.get_all_pairs('platinum')['2610-2610']['current']
+    check(current['spread_pct'] == 4.0, "单条写入同样刷新")
+
+
+def check_migration():
+    print("\n【版本2回填】")
+    os.chdir(tempfile.mkdtemp(prefix='test_pair_latest_v2_'))
+    database.DB_FILE = os.path.abspath('precious_metals.db')
+    database.init_database()
+    database.save_pair_history('palladium', '2610-2610', 'PD2610', 'PAZ2026', spreads(10, [1.0, 2.0]))
+
+    conn = database.get_connection()
+    with conn:
+        conn.execute('DROP TABLE pair_latest')
+        conn.execute('PRAGMA user_version = 2')
+    database.init_database()
+    pairs = database.get_all_pairs('palladium')
+    check(database.get_schema_version() == database.SCHEMA_VERSION, "表结构升级到最新版本")
+    check(pairs.get('2610-2610', {}).get('current', {}).get('spread_pct') == 2.0, f"迁移时回填最新值: {pairs}")
+
+
+def main():
+    header("测试配对最新值表")
+    temp_database('test_pair_latest_')
+
+    check_writes()
+    check_migration()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+测试写入时维护的价差统计 (pair_stats)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 新写入的值计入 count/avg/min/max/std，与直接扫描历史的结果一致；
+  - 覆盖已有时间点时扣除旧值，被覆盖的恰好是最大/最小值时重新求极值；
+  - conflict='IGNORE' 跳过的行不计入；
+  - 1d 窗口只统计最新一天，JSON 中的 stats 只含 avg/max/min 三项。
+用法: python test_pair_stats.py
+"""
+import math
+
+import pandas as pd
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+PAIR = '2610-2610'
+
+
+def history(start, values, freq='h'):
+    dates = pd.date_range(start, periods=len(values), freq=freq)
+    return [{'date': d.strftime('%Y-%m-%d %H:%M'), 'gfex_price': 500.0, 'cme_usd': 2000.0, 'cme_cny': 450.0,
+             'spread': 50.0, 'spread_pct': v} for d, v in zip(dates, values)]
+
+
+def save(items, conflict='REPLACE'):
+    database.bulk_ingest_spreads('platinum', PAIR, 'PT2610', 'PLV2026', items, conflict)
+
+
+def scanned(start=None):
+    """直接扫描历史得到的统计"""
+    sql = 'SELECT spread_pct FROM platinum_pairs WHERE pair_name = ?'
+    params = [PAIR]
+    if start is not None:
+        sql += ' AND ts >= ?'
+        params.append(database.to_epoch(start))
+    values = [r[0] for r in database.get_connection().execute(sql, params)]
+    mean = sum(values) / len(values)
+    return {'count': len(values), 'avg_spread_pct': mean, 'max_spread_pct': max(values),
+            'min_spread_pct': min(values),
+            'std_spread_pct': math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))}
+
+
+def same(stats, expected):
+    return stats is not None and stats.keys() == expected.keys() and all(
+        math.isclose(stats[k], expected[k], abs_tol=1e-9) for k in expected)
+
+
+def main():
+    header("测试价差统计")
+    temp_database('test_pair_stats_')
+
+    print("\n【写入】")
+    check(database.get_pair_stats('platinum', PAIR) is None, "没有数据时为 None")
+    save(history('2026-10-14 09:00', [float(v) for v in range(1, 11)]))
+    stats = database.get_pair_stats('platinum', PAIR)
+    check(same(stats, scanned()), f"与扫描历史一致: {stats}")
+
+    print("\n【覆盖旧值】")
+    save(history('2026-10-14 18:00', [0.5]))             # 覆盖最大值 10
+    stats = database.get_pair_stats('platinum', PAIR)
+    check(stats['count'] == 10, "覆盖不增加条数")
+    check(stats['max_spread_pct'] == 9 and stats['min_spread_pct'] == 0.5, f"重新求极值: {stats}")
+    check(same(stats, scanned()), "扣除旧值后与扫描历史一致")
+
+    save(history('2026-10-14 09:00', [7.0, 8.0]))         # 覆盖 1、2 两个普通值
+    check(same(database.get_pair_stats('platinum', PAIR), scanned()), "再次覆盖多行后一致")
+
+    save(history('2026-10-14 10:00', [100.0]), conflict='IGNORE')
+    check(same(database.get_pair_stats('platinum', PAIR), scanned()), "IGNORE 跳过的行不计入")
+
+    print("\n【窗口与 JSON】")
+    save(history('2026-10-16 09:00', [3.0, 4.0, 6.0], freq='min'))
+    check(same(database.get_pair_stats('platinum', PAIR), scanned()), "全量统计含新的一天")
+    day = database.get_pair_stats('platinum', PAIR, '1d')
+    check(day is not None and day['count'] == 3 and day['avg_spread_pct'] == 13 / 3,
+          f"1d 窗口只统计最新一天: {day}")
+    json_stats = database.get_pair_json_stats('platinum', PAIR)
+    check(list(json_stats) == list(database.PAIR_JSON_STATS), f"JSON 中的 stats 字段: {list(json_stats)}")
+
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+测试分析查询后端 (query_backend)
+在临时目录里建库与归档，不会碰到 precious_metals.db 和 archive/:
+  - 同一时间点在主库与冷数据归档中都有时（归档后迟到的数据）只返回一条，主库的值优先；
+  - pair_summary 列出价差全为空的配对（count 为 0）；
+  - 装了 duckdb 时两个后端的结果逐行相同。
+用法: python test_query_backend.py
+"""
+import os
+
+import pandas as pd
+
+import archive
+import database
+import query_backend
+from test_helpers import check, finish, header, temp_database
+
+PAIR, EMPTY = '2610-2610', '2606-2606'
+LATE = '2025-01-01 05:00'
+
+
+def history(start, hours):
+    dates = pd.date_range(start, periods=hours, freq='h')
+    return [{'date': d.strftime('%Y-%m-%d %H:%M'), 'gfex_price': 500.0, 'cme_usd': 2000.0, 'cme_cny': 450.0,
+             'spread': 50.0, 'spread_pct': 2.0 + i / 100} for i, d in enumerate(dates)]
+
+
+def insert_main(pair_name, when, spread_pct):
+    """直接写一行进主库（不经写入接口的校验与冷数据边界）"""
+    conn = database.get_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO platinum_pairs (pair_name, gfex_contract, cme_contract, ts, gfex_price, cme_usd, cme_cny,
+                                        spread, spread_pct)
+            VALUES (?, 'PT2610', 'PLV2026', ?, 500, 2000, 450, 50, ?)
+        ''', (pair_name, database.to_epoch(when), spread_pct))
+
+
+def prepare():
+    database.bulk_ingest_spreads('platinum', PAIR, 'PT2610', 'PLV2026', history('2025-01-01 00:00', 24))
+    archive.ARCHIVE_DIR = os.path.abspath('archive')
+    archive.archive_month('pairs', 'platinum', PAIR, '2025-01')
+    database.bulk_ingest_spreads('platinum', PAIR, 'PT2610', 'PLV2026', history('2025-02-01 00:00', 3))
+    insert_main(PAIR, LATE, 99)                      # 归档之后迟到的数据，与归档中的时间点重复
+    insert_main(EMPTY, '2025-02-01 00:00', None)     # 价差缺失的配对（旧脚本写入）
+    insert_main(EMPTY, '2025-02-01 01:00', None)
+
+
+def check_backend(name):
+    print(f"\n【{name}】")
+    query_backend.set_backend(name)
+    df = query_backend.load_pairs('platinum')
+    check(not df.duplicated(['pair_name', 'ts']).any(), "每个 (配对, 时间点) 只有一条")
+    late = df[(df['pair_name'] == PAIR) & (df['ts'] == database.to_epoch(LATE))]['spread_pct'].tolist()
+    check(late == [99], f"主库的值优先于归档: {late}")
+    check(len(df[df['pair_name'] == PAIR]) == 27, "归档 24 条 + 主库 3 条")
+
+    summary = query_backend.pair_summary('platinum')
+    check(list(summary.index) == [EMPTY, PAIR], f"价差全为空的配对也列出: {list(summary.index)}")
+    check(summary.loc[EMPTY, 'count'] == 0 and pd.isna(summary.loc[EMPTY, 'last']), "全空配对 count 为 0")
+    check(summary.loc[PAIR, 'count'] == 27 and summary.loc[PAIR, 'max'] == 99, "统计不重复计入归档中的旧值")
+    return df, summary
+
+
+def main():
+    header("测试分析查询后端")
+    temp_database('test_query_backend_')
+    prepare()
+
+    sqlite = check_backend('sqlite')
+    if query_backend.duckdb_available():
+        duck = check_backend('duckdb')
+        check(query_backend.records(sqlite[0]) == query_backend.records(duck[0]), "两个后端 load_pairs 相同")
+        pd.testing.assert_frame_equal(sqlite[1], duck[1], check_dtype=False)
+        check(True, "两个后端 pair_summary 相同")
+    else:
+        print("\n  [!] 未安装 duckdb，只测试 SQLite 后端")
+    query_backend.set_backend('auto')
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+测试行情聚合器 (quote_aggregator.QuoteAggregator)
+用计数的假数据源，不访问网络:
+  - 并发的首次请求只发起一次获取（single-flight），都等到同一个结果；
+  - 过期后立即返回旧值并在后台刷新，刷新期间的请求不再发起获取；
+  - 获取失败时保留上一次的值并记录错误，一个 TTL 内不重试；
+  - 无人请求超过 idle_after 后后台不再刷新。
+用法: python test_quote_aggregator.py
+"""
+import threading
+import time
+
+from quote_aggregator import QuoteAggregator
+from test_helpers import check, finish, header
+
+
+class FakeSource:
+    """每次获取耗时 delay 秒，返回递增的计数；fail 为 True 时抛出异常"""
+
+    def __init__(self, delay=0.3):
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('upstream down')
+        return self.calls
+
+
+def check_single_flight():
+    print("\n【并发的首次请求】")
+    source = FakeSource()
+    quotes = QuoteAggregator({'gfex': (source, 60)})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(quotes.snapshot()['gfex']['value'])) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    check(source.calls == 1 and results == [1] * 20, f"20 个请求只获取一次: {source.calls} 次")
+    check(quotes.get_stats()['gfex']['fetches'] == 1, "统计获取次数")
+
+    started = time.perf_counter()
+    quotes.snapshot()
+    check(source.calls == 1 and time.perf_counter() - started < 0.05, "TTL 内直接读内存")
+
+
+def check_stale():
+    print("\n【过期刷新】")
+    source = FakeSource()
+    quotes = QuoteAggregator({'cme': (source, 0.5)})
+    quotes.snapshot()
+    time.sleep(0.6)
+
+    started = time.perf_counter()
+    snap = quotes.snapshot()['cme']
+    check(snap['value'] == 1 and snap['age'] >= 0.5 and time.perf_counter() - started < 0.1,
+          f"过期时立即返回旧值: age {snap['age']}")
+    quotes.snapshot()
+    check(source.calls == 2 and quotes.get_stats()['cme']['in_flight'], "刷新期间不再发起获取")
+    time.sleep(0.4)
+    snap = quotes.snapshot()['cme']
+    check(snap['value'] == 2 and snap['age'] < 0.5, "后台刷新完成后读到新值")
+
+
+def check_failure():
+    print("\n【获取失败】")
+    source = FakeSource(delay=0.05)
+    quotes = QuoteAggregator({'rate': (source, 0.3)})
+    quotes.snapshot()
+    source.fail = True
+    time.sleep(0.35)
+    quotes.snapshot()
+    time.sleep(0.1)
+    snap = quotes.snapshot()['rate']
+    check(snap['value'] == 1 and snap['error'] == 'upstream down', f"失败时保留旧值并记录错误: {snap}")
+    calls = source.calls
+    quotes.snapshot()
+    check(source.calls == calls, "一个 TTL 内不重试")
+
+    source.fail = False
+    time.sleep(0.35)
+    quotes.snapshot()
+    time.sleep(0.1)
+    snap = quotes.snapshot()['rate']
+    check(snap['value'] == source.calls and snap['error'] is None, "恢复后错误清空")
+    stats = quotes.get_stats()['rate']
+    check(stats['failures'] == 1 and stats['fetches'] == 3, f"统计失败次数: {stats}")
+
+    empty = QuoteAggregator({'down': (FakeSource(delay=0.01), 60)})
+    empty.sources['down'].fetch.fail = True
+    snap = empty.snapshot()['down']
+    check(snap['value'] is None and snap['fetched_at'] is None and snap['error'], "从未成功时值为空")
+
+
+def check_idle():
+    print("\n【无人请求时暂停】")
+    source = FakeSource(delay=0.01)
+    quotes = QuoteAggregator({'gfex': (source, 0.1)}, idle_after=0.5)
+    quotes.start(interval=0.05)
+    time.sleep(0.3)
+    active = source.calls
+    check(active >= 2, f"有人请求时按 TTL 刷新: {active} 次")
+    time.sleep(0.5)
+    idle = source.calls
+    time.sleep(0.3)
+    check(source.calls == idle, f"超过 idle_after 后不再刷新: {idle} -> {source.calls}")
+    quotes.snapshot()
+    time.sleep(0.3)
+    check(source.calls > idle, "再次请求后恢复刷新")
+
+
+def main():
+    header("测试行情聚合器")
+
+    check_single_flight()
+    check_stale()
+    check_failure()
+    check_idle()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+测试读缓存与数据版本 (read_cache / database.get_data_version)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 有变化的写入递增 data_version，值没变的重复写入不递增；
+  - 数据版本不变时重复查询命中缓存，写入后旧条目整体作废并读到新数据；
+  - 超过字节上限时淘汰最久未使用的条目，单个过大的结果不缓存；
+  - 计算期间数据版本变化时结果不缓存。
+用法: python test_read_cache.py
+"""
+import database
+import read_cache
+from test_helpers import check, finish, header, temp_database
+
+
+def save(minute, pct):
+    return database.save_pair_data('platinum', '2610-2610', 'PT2610', 'PLV2026', f'2026-10-15 09:{minute:02d}',
+                                   500.0, 2000.0, 450.0, 50.0, pct)
+
+
+def check_version():
+    print("\n【数据版本】")
+    version = database.get_data_version()
+    save(0, 1.0)
+    check(database.get_data_version() == version + 1, "有变化的写入递增版本")
+    save(0, 1.0)
+    check(database.get_data_version() == version + 1, "值没变的重复写入不递增")
+    database.save_bar('PT2610', '2026-10-15 09:00', 500, 500, 500, 500, 1)
+    check(database.get_data_version() == version + 2, "K线写入同样递增")
+
+
+def check_cache():
+    print("\n【按版本失效】")
+    cache = read_cache.ReadCache()
+    calls = []
+
+    @cache.cached
+    def latest(metal):
+        calls.append(metal)
+        return database.get_all_pairs(metal)
+
+    first = latest('platinum')
+    check(latest('platinum') is first and len(calls) == 1, "版本不变时命中缓存，不再查库")
+    latest('palladium')
+    check(len(calls) == 2, "不同参数分别缓存")
+
+    save(1, 7.0)
+    fresh = latest('platinum')
+    check(len(calls) == 3 and fresh['2610-2610']['current']['spread_pct'] == 7.0, "写入后重新查询，读到新数据")
+    stats = cache.get_stats()
+    check(stats['entries'] == 1 and stats['invalidations'] == 1, f"旧版本的条目整体作废: {stats}")
+    check(stats['hits'] == 1 and stats['misses'] == 3 and stats['hit_rate'] == 0.25, "命中率统计")
+
+
+def check_limits():
+    print("\n【大小上限】")
+    value = list(range(100))
+    size = read_cache.sizeof(value)
+    cache = read_cache.ReadCache(max_bytes=size * 2 + size // 2)
+    for key in 'abc':
+        cache.put(key, 1, list(value))
+    cache.get('b', 1)
+    cache.put('d', 1, list(value))
+    check(cache.get('c', 1)[0] is False and cache.get('b', 1)[0] and cache.get('d', 1)[0],
+          "超出上限时淘汰最久未使用的条目")
+    check(cache.get_stats()['bytes'] <= cache.max_bytes, "占用不超过上限")
+
+    cache.put('huge', 1, list(range(10000)))
+    check(cache.get('huge', 1)[0] is False, "单个超过上限的结果不缓存")
+
+    cache.put('stale', 0, 'old')
+    check(cache.get('b', 1)[0] and cache.get('stale', 1)[0] is False, "计算期间版本已变化的结果不缓存，也不清掉新版本的条目")
+
+
+def main():
+    header("测试读缓存")
+    temp_database('test_read_cache_')
+
+    check_version()
+    check_cache()
+    check_limits()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
+import time
 import requests
 try:
     print("Testing refresh-data endpoint...")
-    resp = requests.post("http://localhost:8080/api/refresh-data", timeout=120)
+    resp = requests.post("http://localhost:8080/api/refresh-data", timeout=10)
     print(f"Status: {resp.status_code}")
     print(f"Response: {resp.text}")
+    job = resp.json()
+    while job.get('status') in ('queued', 'running'):
+        time.sleep(2)
+        job = requests.get(f"http://localhost:8080/api/jobs/{job.get('job_id') or job['id']}", timeout=10).json()
+        print(f"  {job['status']}: " + ', '.join(f"{s['name']} {s['seconds']}s" for s in job['stages'] if s['seconds'] is not None))
+    print(f"Result: {job.get('status')} {job.get('message')}")
 except Exception as e:
     print(f"Error: {e}")
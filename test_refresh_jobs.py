@@ -0,0 +1,62 @@
+"""
+测试刷新任务队列的去重 (refresh_jobs.JobManager)
+不启动服务器、不执行真实同步:
+  - 同类任务排队时，新的提交并入该任务；
+  - 同类任务正在执行时，新的提交排一个后续任务（只排一个，之后的提交都并入它），
+    后续任务在前一个结束后才开始，不会重叠；
+  - 不同类型的任务互不合并。
+用法: python test_refresh_jobs.py
+"""
+import threading
+
+import refresh_jobs
+from test_helpers import check, finish, header
+
+
+def main():
+    header("测试刷新任务去重")
+
+    started, release = threading.Event(), threading.Event()
+    running, overlaps, order = [], [], []
+
+    def sync(job):
+        if running:
+            overlaps.append(job.id)
+        running.append(job.id)
+        order.append(job.id)
+        started.set()
+        release.wait(10)
+        running.remove(job.id)
+        return True, 'ok'
+
+    jobs = refresh_jobs.JobManager()
+
+    print("\n【排队中】")
+    first, created = jobs.submit('sync', sync, source='startup')
+    again, again_created = jobs.submit('sync', sync, source='api')
+    check(created and not again_created and again is first, "排队中的任务并入同一个 id")
+    other, other_created = jobs.submit('other', lambda job: (True, 'ok'), source='api')
+    check(other_created and other is not first, "不同类型的任务不合并")
+
+    print("\n【执行中】")
+    jobs.start()
+    started.wait(10)
+    check(first.status == 'running', "第一个任务已开始执行")
+    follow, follow_created = jobs.submit('sync', sync, source='api')
+    check(follow_created and follow is not first, "执行中再提交：新建后续任务")
+    merged, merged_created = jobs.submit('sync', sync, source='scheduler')
+    check(not merged_created and merged is follow, "之后的提交并入后续任务")
+    check(follow.sources == ['api', 'scheduler'], f"后续任务记录来源: {follow.sources}")
+    check(follow.status == 'queued', "后续任务在前一个结束前保持排队")
+
+    started.clear()
+    release.set()
+    check(follow.wait(10) and first.done, "两个任务都执行完成")
+    check(order == [first.id, follow.id] and not overlaps, "按提交顺序依次执行，没有重叠")
+    check(first.sources == ['startup', 'api'], f"第一个任务只含执行前并入的来源: {first.sources}")
+
+    finish()
+
+
+if __name__ == "__main__":
+    main()
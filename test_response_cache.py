@@ -0,0 +1,89 @@
+"""
+测试 API 响应缓存与 ETag (price_api_server.cached_response)
+在临时目录里建库，不会碰到 precious_metals.db；直接调用路由函数，不启动服务器:
+  - 成功的响应按 (路径, 查询参数, 数据版本) 缓存编码后的字节，带强 ETag；
+  - If-None-Match 命中时返回空的 304，数据写入后 ETag 变化、返回新数据；
+  - 接受 gzip 时发送预压缩的版本（ETag 加 -gzip 后缀），q=0 或小响应不压缩；
+  - update_time 取自数据本身，错误响应不缓存。
+用法: python test_response_cache.py
+"""
+import gzip
+import json
+
+import database
+import price_api_server as api
+from async_server import Request
+from test_helpers import check, finish, header, temp_database
+
+
+def call(path, **headers):
+    request = Request('GET', path, {name.replace('_', '-'): value for name, value in headers.items()})
+    return api.resolve(request)[0](request)
+
+
+def save(minute, pct):
+    database.save_pair_data('platinum', '2610-2610', 'PT2610', 'PLV2026', f'2026-10-15 09:{minute:02d}',
+                            500.0, 2000.0, 450.0, 50.0, pct)
+
+
+def check_etag():
+    print("\n【ETag 与 304】")
+    save(0, 1.0)
+    status, headers, body = call('/api/platinum-pairs')
+    check(status == 200 and headers['ETag'].startswith('"') and headers['Cache-Control'] == 'no-cache',
+          f"响应带强 ETag: {headers['ETag']}")
+    check(json.loads(body)['update_time'] == '2026-10-15 09:00:00', "update_time 为最新数据的时间")
+
+    status, _, empty = call('/api/platinum-pairs', if_none_match=headers['ETag'])
+    check(status == 304 and empty == b'', "If-None-Match 命中返回空的 304")
+    check(call('/api/platinum-pairs', if_none_match='W/' + headers['ETag'])[0] == 304, "弱比较忽略 W/ 前缀")
+    check(call('/api/platinum-pairs?x=1', if_none_match=headers['ETag'])[0] == 304, "内容相同的不同请求 ETag 相同")
+
+    save(1, 2.0)
+    status, fresh, body = call('/api/platinum-pairs', if_none_match=headers['ETag'])
+    check(status == 200 and fresh['ETag'] != headers['ETag'], "写入后 ETag 变化，返回新数据")
+    check(json.loads(body)['update_time'] == '2026-10-15 09:01:00', "update_time 随数据更新")
+
+    stats = api.response_cache.get_stats()
+    check(stats['hits'] >= 2, f"重复请求命中响应缓存: {stats}")
+
+
+def check_gzip():
+    print("\n【gzip】")
+    for minute in range(2, 40):
+        save(minute, float(minute))
+    path = '/api/pair-history?metal=platinum&pair=2610-2610'
+    status, plain, body = call(path)
+    check(status == 200 and len(body) >= api.MIN_COMPRESS_BYTES and 'Content-Encoding' not in plain,
+          f"不接受 gzip 时发送原文: {len(body)} 字节")
+
+    status, zipped, data = call(path, accept_encoding='gzip, deflate')
+    check(zipped.get('Content-Encoding') == 'gzip' and gzip.decompress(data) == body, "接受 gzip 时发送预压缩的版本")
+    check(zipped['ETag'] == plain['ETag'][:-1] + '-gzip"' and zipped['Vary'] == 'Accept-Encoding',
+          "压缩版本使用单独的 ETag")
+    check(call(path, accept_encoding='gzip', if_none_match=plain['ETag'])[0] == 304, "两种 ETag 都可重新验证")
+    check('Content-Encoding' not in call(path, accept_encoding='gzip;q=0')[1], "q=0 视为不接受")
+    small = call('/api/palladium-pairs', accept_encoding='gzip')[1]
+    check('Content-Encoding' not in small, "小响应不压缩")
+
+
+def check_errors():
+    print("\n【错误响应】")
+    before = api.response_cache.get_stats()['entries']
+    status, headers, _ = call('/api/pair-history?metal=silver&pair=x')
+    check(status == 400 and 'ETag' not in headers, "参数错误返回 400，不带 ETag")
+    check(api.response_cache.get_stats()['entries'] == before, "错误响应不缓存")
+
+
+def main():
+    header("测试响应缓存")
+    temp_database('test_response_cache_')
+
+    check_etag()
+    check_gzip()
+    check_errors()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
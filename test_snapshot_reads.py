@@ -0,0 +1,112 @@
+"""
+测试只读快照的发布与连接复用
+在临时目录里建库，不会碰到 precious_metals.db 和 snapshots/:
+  - 数据版本没变时不复制新快照；距上次发布不到最短间隔时推迟，间隔满后自动补发一次；
+  - 每个请求一个线程时，快照连接在线程结束后归还，后续线程复用，不会每个线程新开一个；
+  - 发布新快照后线程改用新快照的连接，旧快照的连接被关闭。
+用法: python test_snapshot_reads.py
+"""
+import os
+import sqlite3
+import threading
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+
+def write_bar(minute):
+    database.save_bar('PT2610', f'2026-10-16 09:{minute:02d}', 500, 501, 499, 500 + minute, 1)
+
+
+def check_publish():
+    print("\n【发布节流】")
+    write_bar(0)
+    first = database.publish_snapshot(min_interval=0)
+    check(first is not None and database.current_snapshot() == first, "首次发布快照")
+    check(database.publish_snapshot(min_interval=0) is None, "数据版本没变时不发布")
+
+    check(database.publish_snapshot(min_interval=3600) is None and not database.snapshot_pending(),
+          "数据版本没变时也不排补发")
+
+    write_bar(1)
+    check(database.publish_snapshot(min_interval=1) is None and database.snapshot_pending(), "不到最短间隔时推迟")
+    timer = database._deferred_publish
+    write_bar(2)
+    database.publish_snapshot(min_interval=1)
+    check(database._deferred_publish is timer, "同一时间只排一次补发")
+    timer.join(10)
+    second = database.current_snapshot()
+    check(second != first and not database.snapshot_pending(), "间隔满后自动补发")
+    check(database.get_data_version(database.get_snapshot_connection())
+          == database.get_data_version(database.get_connection()), "补发的快照包含推迟期间的全部写入")
+    third = database.publish_snapshot(min_interval=0)
+    check(third is None, "补发后数据没变，不再发布")
+
+
+def in_thread(func):
+    """在一个新线程里执行 func（模拟线程式服务器的一个请求），返回其结果"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def check_reuse():
+    print("\n【连接复用】")
+    database.enable_snapshot_reads()
+
+    def request():
+        conn = database.get_read_connection()
+        return id(conn), database.get_data_version(conn)
+
+    results = [in_thread(request) for _ in range(20)]
+    check(len({conn_id for conn_id, _ in results}) == 1, f"20 个请求线程共用 {len({r[0] for r in results})} 个连接")
+    old_conn = database._snapshot_pool['idle'][0]
+
+    write_bar(3)
+    version = database.get_data_version(database.get_connection())
+    database.publish_snapshot(min_interval=0)
+    conn_id, seen = in_thread(request)
+    check(seen == version, f"新快照发布后读到新数据: {seen}")
+    check(conn_id != id(old_conn) and len(database._snapshot_pool['idle']) == 1, "改用新快照的连接")
+    try:
+        old_conn.execute('SELECT 1')
+        closed = False
+    except sqlite3.ProgrammingError:
+        closed = True
+    check(closed, "旧快照的空闲连接已关闭")
+
+    # 并发请求各自借用一个连接，结束后全部归还
+    barrier = threading.Barrier(4)
+
+    def concurrent():
+        conn = database.get_read_connection()
+        barrier.wait(10)
+        return id(conn)
+
+    threads_ids = []
+    threads = [threading.Thread(target=lambda: threads_ids.append(concurrent())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    check(len(set(threads_ids)) == 4, "同时进行的请求使用不同连接")
+    check(len(database._snapshot_pool['idle']) == 4, f"请求结束后连接归还连接池: {len(database._snapshot_pool['idle'])}")
+    database.enable_snapshot_reads(False)
+
+
+def main():
+    header("测试只读快照")
+    temp_database('test_snapshot_reads_')
+    database.SNAPSHOT_DIR = os.path.abspath('snapshots')
+    database.SNAPSHOT_POINTER = os.path.join(database.SNAPSHOT_DIR, 'CURRENT')
+
+    check_publish()
+    check_reuse()
+
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+测试统一K线表 (instruments + bars, 旧分表兼容视图)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 合约按代码前缀登记到 instruments，编号稳定；bars 为 WITHOUT ROWID 表，主键 (instrument_id, ts)；
+  - 旧表名作为视图仍可查询，旧式 INSERT 经触发器写入 bars；
+  - load_bars 按区间/最近N根读取，get_latest_bar 返回最新收盘价；
+  - 版本1的四张分表迁移到 bars，写错表的合约按前缀归位。
+用法: python test_unified_bars.py
+"""
+import os
+import sqlite3
+import tempfile
+
+import pandas as pd
+
+import database
+from test_helpers import check, finish, header, temp_database
+
+NINE = 1792026000                 # 2026-10-15 09:00 北京时间
+
+
+def check_instruments():
+    print("\n【合约登记】")
+    conn = database.get_connection()
+    pt = database.get_instrument_id('PT2610')
+    pa = database.get_instrument_id('PAZ2026')
+    check(database.get_instrument_id('PT2610') == pt and pt != pa, "同一合约编号不变，不同合约编号不同")
+    rows = conn.execute('SELECT symbol, exchange, metal FROM instruments ORDER BY instrument_id').fetchall()
+    check(rows == [('PT2610', 'GFEX', 'platinum'), ('PAZ2026', 'CME', 'palladium')], f"按前缀识别交易所/品种: {rows}")
+    try:
+        database.get_instrument_id('XX0000')
+        check(False, "未知前缀报错")
+    except ValueError:
+        check(True, "未知前缀报错")
+
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'bars'").fetchone()[0]
+    check('WITHOUT ROWID' in sql and 'PRIMARY KEY (instrument_id, ts)' in sql, "bars 为 WITHOUT ROWID 聚簇主键表")
+
+
+def check_views():
+    print("\n【兼容视图】")
+    conn = database.get_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO gfex_platinum_contracts (contract, datetime, open, high, low, close, volume, hold)
+            VALUES ('PT2610', '2026-10-15 09:00', 500, 501, 499, 500, 3, 10)
+        ''')
+    database.save_bar('PT2610', '2026-10-15 09:01', 501, 502, 500, 501, 4)
+    rows = conn.execute('SELECT contract, ts, datetime, close, hold FROM gfex_platinum_contracts ORDER BY ts').fetchall()
+    check(rows == [('PT2610', NINE, '2026-10-15 09:00', 500.0, 10), ('PT2610', NINE + 60, '2026-10-15 09:01', 501.0, None)],
+          f"旧式 INSERT 与 save_bar 都写入 bars，视图按北京时间读出: {rows}")
+    other = conn.execute('SELECT COUNT(*) FROM gfex_palladium_contracts').fetchone()[0]
+    check(other == 0, "视图只包含对应交易所/品种的合约")
+
+
+def check_load_bars():
+    print("\n【读取K线】")
+    database.bulk_ingest_bars('PT2610', pd.DataFrame(
+        {'open': 510.0, 'high': 510.0, 'low': 510.0, 'close': [510.0, 511.0, 512.0], 'volume': 1, 'hold': 10},
+        index=pd.date_range('2026-10-15 10:00', periods=3, freq='h')))
+    df = database.load_bars('PT2610', start='2026-10-15 09:01', end='2026-10-15 11:00')
+    check(df['close'].tolist() == [501.0, 510.0, 511.0], f"区间读取（含两端）: {df['close'].tolist()}")
+    check(str(df.index[0]) == '2026-10-15 09:01:00', "索引为北京时间")
+    df = database.load_bars('PT2610', limit=2)
+    check(df['close'].tolist() == [511.0, 512.0], f"limit 取最近N根并按时间升序: {df['close'].tolist()}")
+    check(database.load_bars('PT2612').empty, "未登记的合约返回空表")
+    check(database.get_latest_bar('PT2610') == (512.0, '2026-10-15 12:00'), "最新一根K线")
+    check(database.get_latest_bar('PT2612') is None, "无数据时返回 None")
+
+
+def check_migration():
+    print("\n【版本1迁移】")
+    os.chdir(tempfile.mkdtemp(prefix='test_unified_bars_v1_'))
+    database.DB_FILE = os.path.abspath('precious_metals.db')
+    database._instrument_ids.clear()
+    conn = sqlite3.connect(database.DB_FILE)
+    for table in database.LEGACY_BAR_TABLES:
+        hold = ', hold INTEGER' if table.startswith('gfex') else ''
+        conn.execute(f'''
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, contract TEXT NOT NULL, ts INTEGER NOT NULL,
+                datetime TEXT, open REAL, high REAL, low REAL, close REAL, volume INTEGER{hold},
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP, UNIQUE(contract, ts))
+        ''')
+    conn.execute("INSERT INTO gfex_platinum_contracts (contract, ts, open, high, low, close, volume, hold) "
+                 "VALUES ('PT2610', ?, 500, 500, 500, 500, 1, 10)", (NINE,))
+    # 历史上钯金CME数据曾写进铂金表
+    conn.execute("INSERT INTO cme_platinum_contracts (contract, ts, open, high, low, close, volume) "
+                 "VALUES ('PAZ2026', ?, 1000, 1000, 1000, 1000, 2)", (NINE,))
+    conn.execute('PRAGMA user_version = 1')
+    conn.commit()
+    conn.close()
+
+    database.init_database()
+    conn = database.get_connection()
+    check(database.get_schema_version(conn) == database.SCHEMA_VERSION, "表结构升级到最新版本")
+    check(conn.execute('SELECT COUNT(*) FROM bars').fetchone()[0] == 2, "分表数据并入 bars")
+    check(conn.execute('SELECT contract FROM cme_palladium_contracts').fetchall() == [('PAZ2026',)]
+          and conn.execute('SELECT COUNT(*) FROM cme_platinum_contracts').fetchone()[0] == 0,
+          "写错表的合约按代码前缀归位")
+    check(database.get_latest_bar('PT2610') == (500.0, '2026-10-15 09:00'), "迁移后可按合约读取")
+
+
+def main():
+    header("测试统一K线表")
+    temp_database('test_unified_bars_')
+
+    check_instruments()
+    check_views()
+    check_load_bars()
+    check_migration()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
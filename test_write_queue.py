@@ -0,0 +1,70 @@
+"""
+测试数据库写入队列 (write_queue.WriteQueue)
+在临时目录里建库，不会碰到 precious_metals.db:
+  - 入队的K线、配对价差在 flush 后可以读到，派生表（最新值/汇总/统计）同步维护；
+  - 多条记录合并为一个事务提交，批量大小不超过 max_batch；
+  - 一组记录写入失败只丢弃该组，同批的其他数据照常写入；
+  - get_metrics 报告入队、提交、批次与错误数。
+用法: python test_write_queue.py
+"""
+import database
+from test_helpers import check, finish, header, temp_database
+from write_queue import WriteQueue
+
+
+def check_writes():
+    print("\n【写入与派生表】")
+    wq = WriteQueue(max_latency=0.5)
+    for minute in range(10):
+        when = f'2026-10-15 09:{minute:02d}'
+        wq.put_bar('PT2610', when, 500 + minute, 501 + minute, 499 + minute, 500 + minute, 1)
+        wq.put_pair('platinum', '2610-2610', 'PT2610', 'PLV2026', when, 500.0, 2000.0, 450.0, 50.0, float(minute))
+    wq.flush()
+
+    bars = database.load_bars('PT2610')
+    check(bars['close'].tolist() == [500.0 + m for m in range(10)], f"flush 后读到全部K线: {len(bars)} 根")
+    current = database.get_all_pairs('platinum')['2610-2610']['current']
+    check(current['datetime'] == '2026-10-15 09:09' and current['spread_pct'] == 9.0, "pair_latest 为最新一条")
+    hourly = database.get_pair_history('platinum', '2610-2610', resolution='1h', agg='ohlc')
+    check(len(hourly) == 1 and hourly[0]['count'] == 10 and hourly[0]['high'] == 9.0, f"1h 汇总包含全部记录: {hourly}")
+    stats = database.get_pair_stats('platinum', '2610-2610')
+    check(stats['count'] == 10 and stats['max_spread_pct'] == 9.0, f"价差统计同步更新: {stats}")
+
+    metrics = wq.get_metrics()
+    check(metrics['enqueued'] == metrics['committed'] == 20 and metrics['queue_depth'] == 0, f"入队与提交计数: {metrics}")
+    check(metrics['batches'] < 20, f"多条记录合并提交: {metrics['batches']} 个批次")
+
+
+def check_batching():
+    print("\n【批量上限】")
+    wq = WriteQueue(max_batch=5, max_latency=1)
+    for minute in range(12):
+        wq.put_bar('PT2612', f'2026-10-15 10:{minute:02d}', 500, 500, 500, 500, 1)
+    wq.flush()
+    metrics = wq.get_metrics()
+    check(metrics['max_batch'] == 5 and metrics['batches'] >= 3, f"单批不超过 max_batch: {metrics}")
+    check(len(database.load_bars('PT2612')) == 12, "全部写入")
+
+
+def check_errors():
+    print("\n【失败隔离】")
+    wq = WriteQueue(max_latency=0.5)
+    wq.put_bar('XX0000', '2026-10-15 11:00', 1, 1, 1, 1)        # 无法识别的合约
+    wq.put_bar('PT2606', '2026-10-15 11:00', 510, 510, 510, 510, 1)
+    wq.flush()
+    check(len(database.load_bars('PT2606')) == 1, "同批的其他记录照常写入")
+    check(wq.get_metrics()['errors'] == 1, "失败的记录计入 errors")
+
+
+def main():
+    header("测试写入队列")
+    temp_database('test_write_queue_')
+
+    check_writes()
+    check_batching()
+    check_errors()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
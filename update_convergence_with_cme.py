@@ -4,6 +4,7 @@
 """
 
 import json
+from json_artifacts import write_json
 import pandas as pd
 from openpyxl import load_workbook
 from datetime import datetime
@@ -139,8 +140,7 @@ def main():
     updated_data = update_convergence_data(cme_data, existing_data)
     
     # 保存更新后的数据
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(updated_data, f, ensure_ascii=False, indent=2)
+    write_json(json_path, updated_data)
     
     print(f"\n已保存到: {json_path}")
     
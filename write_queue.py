@@ -0,0 +1,177 @@
+"""
+数据库写入队列（单写入线程 + 组提交）
+采集端只负责把K线、配对价差、价差、快照记录放入队列，由后台写入线程按
+批量大小/延迟上限合并成一个事务提交，采集速度不再受锁等待与逐条提交拖累。
+
+用法:
+    import write_queue
+    write_queue.put_bar('PLJ2026', '2026-01-05 09:01', price, price, price, price)
+    write_queue.put_pair('platinum', '2610-2604', 'PT2610', 'PLJ2026', time_str, ...)
+    write_queue.flush()          # 需要立即读到刚写入的数据时
+    write_queue.get_metrics()    # 队列深度、实际变化行数、提交耗时等
+进程退出时会自动把队列中剩余的记录写完。
+"""
+import atexit
+import queue
+import threading
+import time
+
+from database import (
+    BAR_ROW_COLUMNS, get_connection, get_instrument_id, to_epoch, snapshot_row,
+    _store_bars, _store_pairs, _store_spreads, _store_snapshots,
+)
+
+MAX_BATCH = 500       # 单个事务最多合并的记录数
+MAX_LATENCY = 0.2     # 第一条记录入队后最多等待多久提交 (秒)
+
+
+class WriteQueue:
+    """单写入线程的组提交队列，记录按 (类型, 序列) 分组后在一个事务内写入"""
+
+    def __init__(self, max_batch=MAX_BATCH, max_latency=MAX_LATENCY):
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._metrics = {
+            'enqueued': 0,
+            'committed': 0,
+            'changed': 0,          # 实际写入（新增或值有变化）的行数
+            'unchanged': 0,        # 与库中相同而跳过的行数
+            'batches': 0,
+            'errors': 0,
+            'max_batch': 0,
+            'last_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'total_commit_ms': 0.0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def put(self, kind, key, row):
+        """放入一条记录: kind 为 bar/pair/spread/snapshot，key 标识同一序列"""
+        self.start()
+        with self._lock:
+            self._metrics['enqueued'] += 1
+        self._queue.put((kind, key, row))
+
+    def put_bar(self, symbol, when, open_, high, low, close, volume=0):
+        self.put('bar', symbol, (to_epoch(when), open_, high, low, close, volume))
+
+    def put_pair(self, metal, pair_name, gfex_contract, cme_contract, datetime_str,
+                 gfex_price, cme_usd, cme_cny, spread, spread_pct):
+        self.put('pair', (metal, pair_name), (to_epoch(datetime_str), gfex_contract, cme_contract,
+                                              gfex_price, cme_usd, cme_cny, spread, spread_pct))
+
+    def put_spread(self, metal, datetime_str, gfex_price, cme_usd, cme_cny, spread, spread_pct):
+        self.put('spread', metal, (to_epoch(datetime_str), gfex_price, cme_usd, cme_cny, spread, spread_pct))
+
+    def put_snapshot(self, pt_data, pd_data, exchange_rate):
+        self.put('snapshot', None, snapshot_row(pt_data, pd_data, exchange_rate))
+
+    def flush(self):
+        """阻塞到目前已入队的记录全部提交"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        batches = metrics.pop('batches')
+        total_ms = metrics.pop('total_commit_ms')
+        metrics.update({
+            'queue_depth': self._queue.qsize(),
+            'batches': batches,
+            'avg_commit_ms': total_ms / batches if batches else 0.0,
+        })
+        return metrics
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit(self, batch):
+        # 同一序列的记录合并，派生表（最新值/汇总/统计）每批每个序列只维护一次
+        groups = {}
+        for kind, key, row in batch:
+            groups.setdefault((kind, key), []).append(row)
+
+        conn = get_connection()
+        started = time.perf_counter()
+        counts = [0, 0]
+        try:
+            with conn:
+                for (kind, key), rows in groups.items():
+                    counts = [a + b for a, b in zip(counts, _write_group(conn, kind, key, rows))]
+        except Exception as e:
+            # 整批失败时逐组重试，避免一条坏记录拖累同批其他数据
+            print(f"  [!] 批量写入失败: {e}，改为逐组写入")
+            counts = [0, 0]
+            for (kind, key), rows in groups.items():
+                try:
+                    with conn:
+                        counts = [a + b for a, b in zip(counts, _write_group(conn, kind, key, rows))]
+                except Exception as group_err:
+                    print(f"  [X] 写入 {kind} {key} 失败 ({len(rows)} 条): {group_err}")
+                    with self._lock:
+                        self._metrics['errors'] += len(rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            m = self._metrics
+            m['committed'] += len(batch)
+            m['changed'] += counts[0]
+            m['unchanged'] += counts[1]
+            m['batches'] += 1
+            m['max_batch'] = max(m['max_batch'], len(batch))
+            m['last_commit_ms'] = elapsed_ms
+            m['max_commit_ms'] = max(m['max_commit_ms'], elapsed_ms)
+            m['total_commit_ms'] += elapsed_ms
+
+
+def _write_group(conn, kind, key, rows):
+    """写入一组记录，返回 (实际变化的行数, 跳过的行数)"""
+    if kind == 'bar':
+        inserted, updated, unchanged = _store_bars(conn, get_instrument_id(key, conn), BAR_ROW_COLUMNS, rows)
+    elif kind == 'pair':
+        inserted, updated, unchanged = _store_pairs(conn, key[0], key[1], rows)
+    elif kind == 'spread':
+        inserted, updated, unchanged = _store_spreads(conn, key, rows)
+    elif kind == 'snapshot':
+        _store_snapshots(conn, rows)
+        inserted, updated, unchanged = len(rows), 0, 0
+    else:
+        raise ValueError(f"未知的记录类型: {kind}")
+    return inserted + updated, unchanged
+
+
+# 进程内共享的默认队列
+_default = WriteQueue()
+
+put_bar = _default.put_bar
+put_pair = _default.put_pair
+put_spread = _default.put_spread
+put_snapshot = _default.put_snapshot
+flush = _default.flush
+get_metrics = _default.get_metrics
+
+atexit.register(flush)